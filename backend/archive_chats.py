@@ -0,0 +1,70 @@
+import argparse, asyncio
+from datetime import datetime, timedelta, timezone
+from utils.db import init_mongo, get_db, close_mongo
+from utils.archive import CHAT_ARCHIVE_AFTER_DAYS, CHAT_ARCHIVE_SEGMENT_TURNS, last_archived_key, write_segment
+from utils.chat_store import iter_hot_turns, purge_turns_batch, take, tombstone_cutoff
+
+
+async def archive_conversation(db, user_id, bot_id, cutoff, segment_turns):
+    """Move one conversation's turns older than ``cutoff`` into archive segments, oldest first.
+
+    Each segment is stored and listed in the manifest before any hot turn is deleted, and reads
+    de-duplicate the overlap, so the app keeps serving throughout and a rerun resumes cleanly.
+    """
+    if await tombstone_cutoff(db, user_id, bot_id) is not None:
+        # Being deleted; the deletion job owns it
+        return 0
+    archived = 0
+    last = await last_archived_key(db, user_id, bot_id)
+    while True:
+        turns = await take(iter_hot_turns(db, user_id, bot_id, 1, after=last, before=(cutoff, "")), segment_turns)
+        if not turns:
+            break
+        await write_segment(db, user_id, bot_id, turns)
+        archived += len(turns)
+        last = (turns[-1]["timestamp"], turns[-1].get("message_id") or "")
+
+    # Everything strictly before the cutoff is archived now; Mongo dates are millisecond precision
+    query = {"user_id": user_id, "bot_id": bot_id}
+    while await purge_turns_batch(db, query, cutoff - timedelta(milliseconds=1), 500, include_archive=False):
+        pass
+    return archived
+
+
+async def archive(older_than_days, limit):
+    init_mongo()
+    db = get_db()
+    try:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        cutoff = now - timedelta(days=older_than_days)
+        cutoff = cutoff.replace(microsecond=cutoff.microsecond // 1000 * 1000)
+        conversations = set()
+        for collection, field in (("chats", "timestamp"), ("chat_buckets", "start_ts")):
+            async for conversation in db[collection].aggregate([
+                {"$match": {field: {"$lt": cutoff}}},
+                {"$group": {"_id": {"user_id": "$user_id", "bot_id": "$bot_id"}}}
+            ]):
+                conversations.add((conversation["_id"]["user_id"], conversation["_id"]["bot_id"]))
+        conversations = sorted(conversations)[:limit or None]
+
+        total = 0
+        for user_id, bot_id in conversations:
+            archived = await archive_conversation(db, user_id, bot_id, cutoff, CHAT_ARCHIVE_SEGMENT_TURNS)
+            total += archived
+            if archived:
+                print(f"Archived {archived} turns for {user_id}_{bot_id}")
+        print(f"✅ Archived {total} turns older than {cutoff:%Y-%m-%d %H:%M} across {len(conversations)} conversations")
+    finally:
+        close_mongo()
+
+
+if __name__ == "__main__":
+    # The app finds archived turns through the manifest, so it needs no matching setting
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--older-than-days", type=float, default=CHAT_ARCHIVE_AFTER_DAYS,
+                        help="defaults to CHAT_ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--limit", type=int, default=0, help="only archive this many conversations")
+    args = parser.parse_args()
+    if args.older_than_days <= 0:
+        parser.error("set CHAT_ARCHIVE_AFTER_DAYS or pass --older-than-days")
+    asyncio.run(archive(args.older_than_days, args.limit))
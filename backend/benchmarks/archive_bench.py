@@ -0,0 +1,90 @@
+"""Working-set savings from archiving old turns, against the cost of paging into the archive.
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database and a temporary archive directory.
+Run from backend/:
+    python -m benchmarks.archive_bench --conversations 200 --turns 500 --hot-days 7
+"""
+import argparse, asyncio, statistics, tempfile, time, uuid
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+import utils.archive as archive
+from utils.chat_store import iter_turns, take
+from archive_chats import archive_conversation
+
+
+async def sizes(db):
+    total = {"size": 0, "indexes": 0}
+    for collection in ("chats", "chat_buckets", "chat_archive_segments"):
+        stats = await db.command("collStats", collection)
+        total["size"] += stats.get("size", 0)
+        total["indexes"] += stats.get("totalIndexSize", 0)
+    return total
+
+
+async def page_latency(db, conversations, before_of, pages):
+    latencies = []
+    for i in range(pages):
+        user_id, bot_id = conversations[i % len(conversations)]
+        started = time.perf_counter()
+        page = await take(iter_turns(db, user_id, bot_id, direction=-1, before=before_of(user_id, bot_id)), 20)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert page, "empty page"
+    latencies.sort()
+    return f"p50={statistics.median(latencies):7.2f}ms  p95={latencies[int(len(latencies) * 0.95)]:7.2f}ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=500, help="turns per conversation, one per hour")
+    parser.add_argument("--hot-days", type=float, default=7)
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"archive_bench_{uuid.uuid4().hex[:8]}"]
+    archive._store = archive.LocalSegmentStore(tempfile.mkdtemp(prefix="chat_archive_"))
+    try:
+        for collection, models in INDEXES.items():
+            await db[collection].create_indexes(models)
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        conversations = [(str(uuid.uuid4()), str(uuid.uuid4())) for _ in range(args.conversations)]
+        for user_id, bot_id in conversations:
+            await db.chats.insert_many([{
+                "user_id": user_id,
+                "bot_id": bot_id,
+                "message": f"message {i}: what did you get up to today? tell me everything",
+                "response": f"reply {i}: honestly not much, mostly reading and a long walk by the river",
+                "message_id": str(uuid.uuid4()),
+                "timestamp": now - timedelta(hours=args.turns - i),
+                "updated": now - timedelta(hours=args.turns - i)
+            } for i in range(args.turns)])
+
+        cutoff = now - timedelta(days=args.hot_days)
+        oldest = lambda user_id, bot_id: (cutoff + timedelta(hours=1), "")
+        before = await sizes(db)
+        hot_read = await page_latency(db, conversations, lambda *_: None, args.pages)
+        old_read = await page_latency(db, conversations, oldest, args.pages)
+
+        started = time.perf_counter()
+        archived = 0
+        for user_id, bot_id in conversations:
+            archived += await archive_conversation(db, user_id, bot_id, cutoff, archive.CHAT_ARCHIVE_SEGMENT_TURNS)
+        elapsed = time.perf_counter() - started
+        after = await sizes(db)
+        stored = sum([segment["bytes"] async for segment in db.chat_archive_segments.find({}, {"bytes": 1})])
+
+        print(f"archived {archived} turns in {elapsed:.1f}s -> {stored / 1024:.0f} KiB of segments")
+        print(f"mongo data     {before['size'] / 1024:9.0f} KiB -> {after['size'] / 1024:9.0f} KiB")
+        print(f"mongo indexes  {before['indexes'] / 1024:9.0f} KiB -> {after['indexes'] / 1024:9.0f} KiB")
+        print(f"latest page    before {hot_read}   after {await page_latency(db, conversations, lambda *_: None, args.pages)}")
+        print(f"old page       before {old_read}   after {await page_latency(db, conversations, oldest, args.pages)}")
+    finally:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""Create-bot latency, event-loop stall, memory and storage with ~2 MB avatars:
+verbatim storage on the event loop (the old behaviour) vs the off-loop avatar pipeline.
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database. Run from backend/:
+    python -m benchmarks.avatar_bench --bots 40 --concurrency 8 --distinct 10
+"""
+import argparse, asyncio, base64, hashlib, io, statistics, time, tracemalloc, uuid
+import httpx
+from bson import Binary
+from fastapi import FastAPI
+from motor.motor_asyncio import AsyncIOMotorClient
+from PIL import Image
+from routers import bots
+from utils.avatars import AvatarPool, decode_avatar
+import utils.avatars as avatars
+from utils.db import MONGODB_URI, get_db
+from benchmarks.hashing_bench import loop_lag_probe
+
+
+def make_avatar(seed, side=820):
+    """A noisy PNG of roughly 2 MB (noise keeps PNG from compressing it away)."""
+    image = Image.frombytes("RGB", (side, side), hashlib.shake_256(str(seed).encode()).digest(side * side * 3))
+    out = io.BytesIO()
+    image.save(out, format="PNG", compress_level=1)
+    return f"data:image/png;base64,{base64.b64encode(out.getvalue()).decode()}"
+
+
+def bot_payload(avatar):
+    return {
+        "user_id": "bench-user", "name": "Bench", "bio": "bio", "first_message": "hi", "situation": "s",
+        "back_story": "b", "personality": "p", "chatting_way": "c", "type_of_bot": "friend",
+        "privacy": "private", "avatar_base64": avatar
+    }
+
+
+async def store_verbatim(db, avatar):
+    # What create_bot used to do: decode on the event loop and keep the upload as-is
+    data, content_type = decode_avatar(avatar)
+    avatar_hash = hashlib.sha256(data).hexdigest()
+    await db.avatar_blobs.insert_one({"_id": str(uuid.uuid4()), "data": Binary(data), "content_type": content_type,
+                                      "size": len(data)})
+    return {"full": avatar_hash}
+
+
+async def run(label, app, db, payloads, concurrency):
+    await db.avatar_blobs.delete_many({})
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(client, payload):
+        async with semaphore:
+            started = time.perf_counter()
+            res = await client.post("/bots/createbot", json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            res.raise_for_status()
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(stop))
+    tracemalloc.start()
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await asyncio.gather(*(create(client, payload) for payload in payloads))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stop.set()
+    worst_lag = await probe
+
+    stored = sum([blob["size"] async for blob in db.avatar_blobs.find({}, {"size": 1})])
+    latencies.sort()
+    print(f"{label:<10} p50={statistics.median(latencies):7.1f}ms  p95={latencies[int(len(latencies) * 0.95)]:7.1f}ms  "
+          f"bots/s={len(payloads) / elapsed:6.1f}  worst loop stall={worst_lag * 1000:7.1f}ms  "
+          f"peak traced={peak / 1e6:6.1f}MB  stored={stored / 1e6:7.2f}MB")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--distinct", type=int, default=10, help="distinct images among the uploads (duplicates dedupe)")
+    args = parser.parse_args()
+
+    images = [make_avatar(i) for i in range(args.distinct)]
+    print(f"avatar size: {len(decode_avatar(images[0])[0]) / 1e6:.2f}MB decoded, {len(images[0]) / 1e6:.2f}MB as base64")
+    payloads = [bot_payload(images[i % args.distinct]) for i in range(args.bots)]
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"avatar_bench_{uuid.uuid4().hex[:8]}"]
+    app = FastAPI()
+    app.include_router(bots.router)
+    app.dependency_overrides[get_db] = lambda: db
+    pipeline_store = bots.store_avatar
+    try:
+        bots.store_avatar = store_verbatim
+        await run("verbatim", app, db, payloads, args.concurrency)
+        bots.store_avatar = pipeline_store
+        avatars._pool = AvatarPool(max_concurrency=args.concurrency)
+        # Warm the worker processes so start-up is not billed to the first requests
+        await asyncio.gather(*(avatars._pool.process(images[0]) for _ in range(avatars._pool.pool_size)))
+        await run("pipeline", app, db, payloads, args.concurrency)
+        print(f"pool: {avatars._pool.stats()}")
+    finally:
+        bots.store_avatar = pipeline_store
+        avatars.close_avatar_pool()
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Storage size and history read latency: per-turn documents vs time-bucketed documents.
+
+Needs a local mongod (MONGODB_URI); uses two throwaway databases. Run from backend/:
+    python -m benchmarks.chat_storage_bench --conversations 50 --turns 2000
+"""
+import argparse, asyncio, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+from utils.chat_store import CHAT_BUCKET_SIZE, iter_turns, take
+from migrate_chats_to_buckets import bucket_document
+
+
+def synthetic_turns(user_id, bot_id, count):
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    return [{
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "message": f"message {i}: how was your day?",
+        "response": f"reply {i}: pretty chill honestly, you?",
+        "message_id": str(uuid.uuid4()),
+        "timestamp": start + timedelta(seconds=30 * i),
+        "updated": start + timedelta(seconds=30 * i)
+    } for i in range(count)]
+
+
+async def load(db, layout, conversations, turns):
+    for collection, models in INDEXES.items():
+        await db[collection].create_indexes(models)
+    keys = []
+    for _ in range(conversations):
+        user_id, bot_id = str(uuid.uuid4()), str(uuid.uuid4())
+        docs = synthetic_turns(user_id, bot_id, turns)
+        if layout == "turns":
+            await db.chats.insert_many(docs)
+        else:
+            for i in range(0, len(docs), CHAT_BUCKET_SIZE):
+                chunk = docs[i:i + CHAT_BUCKET_SIZE]
+                for doc in chunk:
+                    doc["_id"] = uuid.uuid4().hex
+                await db.chat_buckets.insert_one(bucket_document(user_id, bot_id, chunk))
+        keys.append((user_id, bot_id))
+    return keys
+
+
+async def measure(db, layout, keys):
+    collection = "chats" if layout == "turns" else "chat_buckets"
+    stats = await db.command("collStats", collection)
+
+    full, page = [], []
+    for user_id, bot_id in keys:
+        start = time.perf_counter()
+        [turn async for turn in iter_turns(db, user_id, bot_id)]
+        full.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await take(iter_turns(db, user_id, bot_id, direction=-1), 50)
+        page.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{layout:<8} docs={stats['count']:>9}  data={stats['size'] / 1e6:8.1f}MB  "
+        f"storage={stats['storageSize'] / 1e6:8.1f}MB  indexes={stats['totalIndexSize'] / 1e6:8.1f}MB  "
+        f"full history p50={statistics.median(full):7.1f}ms  latest 50 p50={statistics.median(page):6.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URI or "mongodb://localhost:27017")
+    try:
+        for layout in ("turns", "buckets"):
+            name = f"chat_storage_bench_{layout}"
+            await client.drop_database(name)
+            db = client[name]
+            keys = await load(db, layout, args.conversations, args.turns)
+            await measure(db, layout, keys)
+            await client.drop_database(name)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
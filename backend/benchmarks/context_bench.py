@@ -0,0 +1,85 @@
+"""Prompt tokens and context-load time versus stored chat length: reading the full history vs
+load_context (rolling summary plus the recent window).
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database. Run from backend/:
+    python -m benchmarks.context_bench --lengths 10,100,1000,10000 --runs 50
+"""
+import argparse, asyncio, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+from utils.chat_store import iter_turns
+from utils.memory import (CONTEXT_TOKEN_BUDGET, CONTEXT_WINDOW_TURNS, SUMMARY_BATCH_TURNS, estimate_tokens,
+                          fit_history, format_turn, load_context)
+
+SUMMARY = "The user is Sam, a night-shift nurse who loves hiking and is learning Spanish. " * 3
+
+
+async def seed_conversation(db, bot_id, length):
+    start = datetime.now(timezone.utc) - timedelta(minutes=length)
+    turns = [{
+        "user_id": "bench-user",
+        "bot_id": bot_id,
+        "message": f"message {i}: how was your day, anything fun happen?",
+        "response": f"reply {i}: honestly pretty chill, just vibing and thinking about you lol",
+        "message_id": f"{i:08d}",
+        "timestamp": start + timedelta(minutes=i),
+        "updated": start + timedelta(minutes=i)
+    } for i in range(length)]
+    for i in range(0, length, 10000):
+        await db.chats.insert_many(turns[i:i + 10000])
+    # Steady state: everything older than the window has been folded into the summary
+    if length > CONTEXT_WINDOW_TURNS + SUMMARY_BATCH_TURNS:
+        last = turns[length - CONTEXT_WINDOW_TURNS - 1]
+        await db.chat_summaries.insert_one({
+            "user_id": "bench-user", "bot_id": bot_id, "summary": SUMMARY, "unsummarized_turns": CONTEXT_WINDOW_TURNS,
+            "summarized_until": {"timestamp": last["timestamp"], "message_id": last["message_id"]}
+        })
+
+
+async def full_history(db, bot_id):
+    turns = [turn async for turn in iter_turns(db, "bench-user", bot_id, fields=("message", "response"))]
+    return sum(estimate_tokens(format_turn(turn)) for turn in turns)
+
+
+async def windowed(db, bot_id):
+    context = await load_context(db, "bench-user", bot_id)
+    return fit_history(context, CONTEXT_TOKEN_BUDGET)[2]
+
+
+async def measure(call, runs):
+    latencies, tokens = [], 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        tokens = await call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies), tokens
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", default="10,100,1000,10000")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"context_bench_{uuid.uuid4().hex[:8]}"]
+    try:
+        for collection, models in INDEXES.items():
+            await db[collection].create_indexes(models)
+
+        print(f"budget={CONTEXT_TOKEN_BUDGET} tokens, window={CONTEXT_WINDOW_TURNS} turns")
+        print(f"{'turns':>8} {'full tokens':>12} {'full p50 ms':>12} {'context tokens':>15} {'context p50 ms':>15}")
+        for length in (int(value) for value in args.lengths.split(",")):
+            bot_id = str(uuid.uuid4())
+            await seed_conversation(db, bot_id, length)
+            full_ms, full_tokens = await measure(lambda: full_history(db, bot_id), max(1, args.runs // 10))
+            context_ms, context_tokens = await measure(lambda: windowed(db, bot_id), args.runs)
+            print(f"{length:>8} {full_tokens:>12} {full_ms:>12.2f} {context_tokens:>15} {context_ms:>15.2f}")
+    finally:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
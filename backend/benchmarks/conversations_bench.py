@@ -0,0 +1,89 @@
+"""Recent-conversations list: one /chat/conversations aggregation vs the dashboard's old
+/bots/my + /bots/public + per-bot /chat/history fetches.
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database. Run from backend/:
+    python -m benchmarks.conversations_bench --bots 200 --conversations 30 --turns 300
+"""
+import argparse, asyncio, random, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+from utils.chat_store import iter_turns, list_conversations
+from utils.bots import BOT_CARD_PROJECTION
+from utils.serialization import dumps
+
+
+async def per_bot_history(db, user_id):
+    """What the dashboard did: list every visible bot, then pull each full history."""
+    bots = [bot async for bot in db.bots.find({"user_id": user_id}, BOT_CARD_PROJECTION)]
+    bots += [bot async for bot in db.bots.find({"privacy": "public"}, BOT_CARD_PROJECTION)]
+    conversations, transferred = [], len(dumps(bots))
+    for bot in bots:
+        history = [turn async for turn in iter_turns(db, user_id, bot["bot_id"])]
+        transferred += len(dumps({"status": "success", "data": history}))
+        if history:
+            conversations.append({"bot": bot, "last_message": history[-1], "turn_count": len(history)})
+    conversations.sort(key=lambda row: row["last_message"]["timestamp"], reverse=True)
+    return conversations, transferred
+
+
+async def aggregated(db, user_id, limit):
+    rows = await list_conversations(db, user_id, None, limit)
+    return rows, len(dumps({"status": "success", "data": rows[:limit]}))
+
+
+async def measure(label, call, runs):
+    latencies, transferred, found = [], 0, 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows, transferred = await call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = len(rows)
+    latencies.sort()
+    print(f"{label:<18} p50={statistics.median(latencies):9.2f}ms  p95={latencies[int(len(latencies) * 0.95)]:9.2f}ms  "
+          f"response bytes={transferred:>10}  conversations={found}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=200, help="public bots on the dashboard")
+    parser.add_argument("--conversations", type=int, default=30, help="bots the probe user has talked to")
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"conversations_bench_{uuid.uuid4().hex[:8]}"]
+    try:
+        for collection, models in INDEXES.items():
+            await db[collection].create_indexes(models)
+
+        user_id = "probe-user"
+        now = datetime.now(timezone.utc)
+        bot_ids = [str(uuid.uuid4()) for _ in range(args.bots)]
+        await db.bots.insert_many([{"bot_id": bot_id, "user_id": "creator", "name": f"bot {i}", "bio": "a companion",
+                                    "first_message": "hey!", "type_of_bot": "friend", "privacy": "public",
+                                    "created_at": now} for i, bot_id in enumerate(bot_ids)])
+        for bot_id in rng.sample(bot_ids, args.conversations):
+            start = now - timedelta(days=rng.uniform(1, 30))
+            await db.chats.insert_many([{
+                "user_id": user_id,
+                "bot_id": bot_id,
+                "message": f"message {i}: how was your day?",
+                "response": f"reply {i}: pretty chill honestly, you?",
+                "message_id": str(uuid.uuid4()),
+                "timestamp": start + timedelta(minutes=i),
+                "updated": start + timedelta(minutes=i)
+            } for i in range(args.turns)])
+
+        await measure("per-bot history", lambda: per_bot_history(db, user_id), args.runs)
+        await measure("aggregation", lambda: aggregated(db, user_id, 20), args.runs)
+    finally:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""Local stand-in for the Gemini generateContent and streamGenerateContent APIs, for offline benchmarks.
+
+Run from backend/:
+    uvicorn benchmarks.gemini_stub:app --port 8001
+and point the app at it with GEMINI_API_BASE=http://127.0.0.1:8001/v1beta
+"""
+import asyncio, json, os, random
+from fastapi import FastAPI, Body
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "50"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "10"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_TOKEN_DELAY_MS = float(os.getenv("STUB_TOKEN_DELAY_MS", "20"))
+STUB_REPLY = os.getenv("STUB_REPLY", "hey! not much, just chilling. what about you?")
+
+app = FastAPI(title="Gemini Stub")
+
+
+async def simulate_latency():
+    delay = STUB_LATENCY_MS + random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)
+    await asyncio.sleep(max(delay, 0) / 1000)
+
+
+def candidate(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+def error_response(code, message):
+    return JSONResponse(status_code=code, content={"error": {"code": code, "message": message}})
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, payload: dict = Body(...)):
+    await simulate_latency()
+    if STUB_ERROR_RATE and random.random() < STUB_ERROR_RATE:
+        return error_response(503, "The model is overloaded. Please try again later.")
+    return candidate(STUB_REPLY)
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, payload: dict = Body(...), alt: str = "sse"):
+    await simulate_latency()
+    if STUB_ERROR_RATE and random.random() < STUB_ERROR_RATE:
+        return error_response(503, "The model is overloaded. Please try again later.")
+
+    async def frames():
+        for word in STUB_REPLY.split(" "):
+            yield f"data: {json.dumps(candidate(word + ' '))}\r\n\r\n"
+            await asyncio.sleep(STUB_TOKEN_DELAY_MS / 1000)
+
+    return StreamingResponse(frames(), media_type="text/event-stream")
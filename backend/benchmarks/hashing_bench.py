@@ -0,0 +1,54 @@
+"""Login throughput and event-loop stall versus bcrypt pool size.
+
+Run from backend/:
+    python -m benchmarks.hashing_bench --logins 64
+"""
+import argparse, asyncio, time
+from utils.hashing import HashingPool, hash_password, verify_and_update_password
+
+
+async def loop_lag_probe(stop, interval=0.01):
+    """Worst delay seen by a coroutine that wants to wake every ``interval`` seconds."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(label, verify, stored_hash, logins):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(verify("correct horse", stored_hash) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await probe
+    print(f"{label:<12} logins/s={logins / elapsed:7.1f}  worst loop stall={worst_lag * 1000:8.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--sizes", default="1,2,4,8")
+    args = parser.parse_args()
+
+    stored_hash = hash_password("correct horse")
+
+    async def inline(password, hashed):
+        # What the routes used to do: bcrypt straight on the event loop
+        return verify_and_update_password(password, hashed)
+
+    await run("inline", inline, stored_hash, args.logins)
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        pool = HashingPool(pool_size=size, max_concurrency=size * 2)
+        try:
+            await run(f"pool={size}", lambda p, h: pool.run(verify_and_update_password, p, h), stored_hash, args.logins)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
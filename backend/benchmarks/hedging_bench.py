@@ -0,0 +1,65 @@
+"""Tail latency of chat replies with and without hedging and fallback, against fake providers.
+
+Deterministic and offline: every --slow-every-th call to the primary takes --slow-latency
+seconds. Run from backend/:
+    python -m benchmarks.hedging_bench --calls 400 --concurrency 20
+"""
+import argparse, asyncio, statistics, time
+from utils.llm_providers import FakeProvider, LLMRouter
+
+
+async def run(label, router, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await router.generate("hi")
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    latencies.sort()
+    extra = sum(stats["hedges"] for stats in router.stats()["models"].values())
+    print(f"{label:<22} p50={statistics.median(latencies):7.1f}ms  p90={latencies[int(len(latencies) * 0.9)]:7.1f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99)]:7.1f}ms  errors={errors}  extra requests={extra / calls:5.1%}")
+    for name, stats in router.stats()["models"].items():
+        print(f"    {name:<10} ok={stats['successes']:4}  failed={stats['failures']:3}  hedges={stats['hedges']:3}  "
+              f"won={stats['hedges_won']:3}  breaker={stats['breaker']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--slow-every", type=int, default=20)
+    args = parser.parse_args()
+
+    def primary(**kwargs):
+        return FakeProvider("primary", latency=args.latency, slow_latency=args.slow_latency,
+                            slow_every=args.slow_every, **kwargs)
+
+    def secondary():
+        return FakeProvider("secondary", latency=args.latency * 1.5)
+
+    await run("single, no hedge", LLMRouter([primary()], hedge=False), args.calls, args.concurrency)
+    # Warm the latency window so the hedge delay tracks the observed p90
+    hedged = LLMRouter([primary()], hedge=True)
+    for _ in range(50):
+        await hedged.generate("hi")
+    await run("single, hedged at p90", hedged, args.calls, args.concurrency)
+    await run("two models, hedged", LLMRouter([primary(), secondary()], hedge=True, hedge_delay=args.latency * 2),
+              args.calls, args.concurrency)
+    await run("failing primary", LLMRouter([primary(fail_every=2), secondary()], hedge=False, breaker_cooldown=0.5),
+              args.calls, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
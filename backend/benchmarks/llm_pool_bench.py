@@ -0,0 +1,59 @@
+"""Compare a pooled LLMClient against a fresh httpx.AsyncClient per request.
+
+Start the stub first (see benchmarks/gemini_stub.py), then from backend/:
+    python -m benchmarks.llm_pool_bench --requests 500 --concurrency 50
+"""
+import argparse, asyncio, statistics, time
+import httpx
+from utils.llm_client import LLMClient
+
+PAYLOAD = {"contents": [{"parts": [{"text": "hi"}]}]}
+PATH = "/models/gemini-2.0-flash:generateContent"
+
+
+async def fresh_client_call(base_url):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        res = await client.post(PATH, json=PAYLOAD)
+        res.raise_for_status()
+
+
+async def run(label, call, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<8} req/s={total / elapsed:8.1f}  "
+        f"p50={statistics.median(latencies):7.2f}ms  p95={p95:7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001/v1beta")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    await run("fresh", lambda: fresh_client_call(args.base_url), args.requests, args.concurrency)
+
+    pooled = LLMClient(base_url=args.base_url, max_retries=0)
+    try:
+        await run("pooled", lambda: pooled.post(PATH, json=PAYLOAD), args.requests, args.concurrency)
+    finally:
+        await pooled.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
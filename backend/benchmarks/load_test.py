@@ -0,0 +1,285 @@
+"""Offline load test for the FastAPI app in main.py.
+
+Runs the app in-process (uvicorn on --app-port) against stand-ins:
+  * Mongo: mongomock-motor (default, `pip install mongomock-motor`) or a local mongod via --mongo-uri
+  * Gemini: benchmarks/gemini_stub.py served on --stub-port, with configurable latency and streaming
+  * Gmail: the file transport from utils.gmail_utils, writing into a temp directory
+
+and drives realistic scenarios (signup bursts, dashboard loads, long chat sessions, history
+scrolls, conversation lists). Reports p50/p95/p99 latency, throughput and RSS per endpoint, and
+writes JSON so results can be compared between releases. The conversation list ($unionWith and
+pipeline $lookup) only runs against a real mongod; mongomock can't execute its aggregation, so
+that scenario is skipped there. Run from backend/:
+
+    python -m benchmarks.load_test --users 50 --turns 20 --output benchmarks/results/latest.json
+"""
+import argparse, asyncio, json, os, platform, subprocess, tempfile, time, uuid
+from collections import defaultdict
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+AVATAR = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 1e6
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """Collects per-endpoint latencies, status codes and RSS samples."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rss = defaultdict(float)
+        self.elapsed = defaultdict(float)
+
+    async def call(self, client, label, method, url, **kwargs):
+        start = time.perf_counter()
+        res = await client.request(method, url, **kwargs)
+        self.latencies[label].append((time.perf_counter() - start) * 1000)
+        if res.status_code >= 400:
+            self.errors[label] += 1
+        self.rss[label] = max(self.rss[label], current_rss_mb())
+        return res
+
+    def record(self, label, ms):
+        self.latencies[label].append(ms)
+        self.rss[label] = max(self.rss[label], current_rss_mb())
+
+    def report(self):
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            scenario_seconds = self.elapsed.get(label) or sum(values) / 1000
+            endpoints[label] = {
+                "requests": len(values),
+                "errors": self.errors[label],
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "throughput_rps": round(len(values) / scenario_seconds, 1) if scenario_seconds else None,
+                "peak_rss_mb": round(self.rss[label], 1)
+            }
+        return endpoints
+
+
+async def timed(recorder, labels, coro):
+    """Run a scenario and attribute its wall time to the endpoints it exercised (for throughput)."""
+    start = time.perf_counter()
+    result = await coro
+    for label in labels:
+        recorder.elapsed[label] += time.perf_counter() - start
+    return result
+
+
+async def signup_burst(client, recorder, db, users):
+    accounts = [(f"load-{uuid.uuid4().hex[:10]}@example.com", "hunter22") for _ in range(users)]
+    await asyncio.gather(*(
+        recorder.call(client, "POST /auth/signup", "POST", "/auth/signup", json={
+            "full_name": "Load Test", "email": email, "password": password, "confirm_password": password
+        }) for email, password in accounts
+    ))
+    # Skip the OTP round trip; the emails went to the file sink
+    await db.users.update_many({"email": {"$in": [email for email, _ in accounts]}}, {"$set": {"is_verified": True}})
+
+    logins = await asyncio.gather(*(
+        recorder.call(client, "POST /auth/login", "POST", "/auth/login", json={"email": email, "password": password})
+        for email, password in accounts
+    ))
+    return [res.json()["user_id"] for res in logins if res.status_code == 200]
+
+
+async def create_bots(client, recorder, user_ids, bots_per_user):
+    async def create(user_id, i):
+        res = await recorder.call(client, "POST /bots/createbot", "POST", "/bots/createbot", json={
+            "user_id": user_id, "name": f"Bot {i}", "bio": "A friendly load-test companion",
+            "first_message": "heyy, what's up?", "situation": "Texting late at night",
+            "back_story": "Grew up by the sea. " * 20, "personality": "Warm, witty, curious",
+            "chatting_way": "Short lowercase texts", "type_of_bot": "friend",
+            "privacy": "public", "avatar_base64": AVATAR, "response_cache": True
+        })
+        return res.json().get("bot_id")
+
+    results = await asyncio.gather(*(create(u, i) for u in user_ids for i in range(bots_per_user)))
+    return [bot_id for bot_id in results if bot_id]
+
+
+async def dashboard_loads(client, recorder, user_ids, loads):
+    async def load(user_id):
+        await asyncio.gather(
+            recorder.call(client, "GET /bots/public", "GET", "/bots/public"),
+            recorder.call(client, "GET /bots/my", "GET", "/bots/my", params={"user_id": user_id})
+        )
+    await asyncio.gather(*(load(user_ids[i % len(user_ids)]) for i in range(loads)))
+
+
+async def chat_sessions(client, recorder, user_ids, bot_ids, turns):
+    async def session(user_id, bot_id):
+        await recorder.call(client, "POST /chat/ask", "POST", "/chat/ask", json={
+            "user_id": user_id, "bot_id": bot_id, "message": "", "is_system_message": True,
+            "response": "heyy, what's up?"
+        })
+        for turn in range(turns):
+            await recorder.call(client, "POST /chat/ask", "POST", "/chat/ask", json={
+                "user_id": user_id, "bot_id": bot_id, "message": f"turn {turn}: tell me something about your day"
+            })
+        # One streamed turn per session to track time-to-first-token
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream("POST", "/chat/ask/stream", json={
+            "user_id": user_id, "bot_id": bot_id, "message": "and what are you up to now?"
+        }) as res:
+            async for line in res.aiter_lines():
+                if first_token is None and line.startswith("event: token"):
+                    first_token = (time.perf_counter() - start) * 1000
+        recorder.record("POST /chat/ask/stream (total)", (time.perf_counter() - start) * 1000)
+        if first_token is not None:
+            recorder.record("POST /chat/ask/stream (ttft)", first_token)
+
+    pairs = [(user_ids[i], bot_ids[i % len(bot_ids)]) for i in range(len(user_ids))]
+    await asyncio.gather(*(session(u, b) for u, b in pairs))
+    return pairs
+
+
+async def history_scrolls(client, recorder, pairs, page_size):
+    async def scroll(user_id, bot_id):
+        params = {"user_id": user_id, "bot_id": bot_id, "limit": page_size}
+        while True:
+            res = await recorder.call(client, "GET /chat/history (page)", "GET", "/chat/history", params=params)
+            body = res.json()
+            if not body.get("has_more"):
+                break
+            params["before"] = body["next_before"]
+        await recorder.call(client, "GET /chat/history (full)", "GET", "/chat/history",
+                            params={"user_id": user_id, "bot_id": bot_id})
+    await asyncio.gather(*(scroll(u, b) for u, b in pairs))
+
+
+async def conversation_lists(client, recorder, user_ids, loads, page_size):
+    async def load(user_id):
+        params = {"user_id": user_id, "limit": page_size}
+        while True:
+            res = await recorder.call(client, "GET /chat/conversations", "GET", "/chat/conversations", params=params)
+            body = res.json()
+            if not body.get("has_more"):
+                break
+            params["before"] = body["next_before"]
+    await asyncio.gather(*(load(user_ids[i % len(user_ids)]) for i in range(loads)))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--bots-per-user", type=int, default=2)
+    parser.add_argument("--dashboard-loads", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--mongo-uri", default="mongomock://", help="e.g. mongodb://localhost:27017")
+    parser.add_argument("--app-port", type=int, default=8764)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--stub-token-delay-ms", type=float, default=20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    # Stand-ins are chosen through the same env vars the app reads, so set them before importing it
+    outbox = tempfile.mkdtemp(prefix="outbox-")
+    db_name = f"load_test_{uuid.uuid4().hex[:8]}"
+    os.environ.update({
+        "MONGODB_URI": args.mongo_uri,
+        "MONGODB_DB_NAME": db_name,
+        "GEMINI_API_BASE": f"http://127.0.0.1:{args.stub_port}/v1beta",
+        "GOOGLE_API_KEY": "load-test",
+        "EMAIL_TRANSPORT": "file",
+        "EMAIL_OUTBOX_DIR": outbox,
+        "STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "STUB_TOKEN_DELAY_MS": str(args.stub_token_delay_ms),
+        "BCRYPT_ROUNDS": os.getenv("BCRYPT_ROUNDS", "10"),
+    })
+
+    import httpx, uvicorn
+    from benchmarks import gemini_stub
+    from main import app
+    from utils.db import get_db, get_client
+
+    stub = uvicorn.Server(uvicorn.Config(gemini_stub.app, host="127.0.0.1", port=args.stub_port, log_level="warning"))
+    stub_task = asyncio.create_task(stub.serve())
+    while not stub.started:
+        await asyncio.sleep(0.05)
+
+    # A real server rather than httpx.ASGITransport, which buffers the whole body before
+    # returning, so streamed responses (and time-to-first-token) are seen as they are sent
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.app_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    try:
+        db = get_db()
+        # No pool limit, so requests queue in the app rather than in the client
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.app_port}", timeout=60, limits=limits) as client:
+            user_ids = await timed(recorder, ["POST /auth/signup", "POST /auth/login"],
+                                   signup_burst(client, recorder, db, args.users))
+            bot_ids = await timed(recorder, ["POST /bots/createbot"],
+                                  create_bots(client, recorder, user_ids, args.bots_per_user))
+            await timed(recorder, ["GET /bots/public", "GET /bots/my"],
+                        dashboard_loads(client, recorder, user_ids, args.dashboard_loads))
+            pairs = await timed(recorder, ["POST /chat/ask"],
+                                chat_sessions(client, recorder, user_ids, bot_ids, args.turns))
+            await timed(recorder, ["GET /chat/history (page)", "GET /chat/history (full)"],
+                        history_scrolls(client, recorder, pairs, args.page_size))
+            if args.mongo_uri.startswith("mongomock"):
+                print("Skipping GET /chat/conversations: mongomock has no $unionWith, pass --mongo-uri")
+            else:
+                await timed(recorder, ["GET /chat/conversations"],
+                            conversation_lists(client, recorder, user_ids, args.dashboard_loads, args.page_size))
+        await get_client().drop_database(db_name)
+    finally:
+        server.should_exit = True
+        await server_task
+        stub.should_exit = True
+        await stub_task
+
+    results = {
+        "revision": git_revision(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "endpoints": recorder.report()
+    }
+
+    print(f"{'endpoint':<32} {'n':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'rss MB':>8}")
+    for label, row in results["endpoints"].items():
+        print(f"{label:<32} {row['requests']:>6} {row['errors']:>4} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['throughput_rps'] or 0:>8} {row['peak_rss_mb']:>8}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""Bot search latency at catalog scale, using the in-process index with synthetic bots.
+
+No database needed. Run from backend/:
+    python -m benchmarks.search_bench --bots 100000 --queries 500
+"""
+import argparse, random, statistics, time, uuid
+from datetime import datetime, timedelta, timezone
+from utils.search import BotSearchIndex
+
+TYPES = ["friend", "mentor", "partner", "therapist", "villain", "coach", "teacher", "rival"]
+
+
+def vocabulary(size, rng):
+    return ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary, rng)
+    now = datetime.now(timezone.utc)
+
+    index = BotSearchIndex()
+    started = time.perf_counter()
+    for i in range(args.bots):
+        index.upsert({
+            "bot_id": str(uuid.uuid4()),
+            "name": " ".join(rng.choices(words, k=2)),
+            "bio": " ".join(rng.choices(words, k=15)),
+            "type_of_bot": rng.choice(TYPES),
+            "privacy": "public",
+            "created_at": now - timedelta(minutes=i)
+        })
+    print(f"indexed {len(index)} bots in {time.perf_counter() - started:.1f}s ({index.stats()['terms']} terms)")
+
+    # Mix of browsing, full words, short prefixes (search-as-you-type) and multi-word queries
+    def query():
+        kind = rng.random()
+        if kind < 0.1:
+            return ""
+        if kind < 0.4:
+            return rng.choice(words)
+        if kind < 0.7:
+            return rng.choice(words)[:rng.randint(1, 3)]
+        return f"{rng.choice(words)} {rng.choice(words)[:3]}"
+
+    latencies = []
+    for _ in range(args.queries):
+        q, type_of_bot = query(), rng.choice([None, None, rng.choice(TYPES)])
+        started = time.perf_counter()
+        index.search(q, type_of_bot, skip=0, limit=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    print(f"p50={statistics.median(latencies):.2f}ms  p95={latencies[int(len(latencies) * 0.95)]:.2f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99)]:.2f}ms  max={latencies[-1]:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
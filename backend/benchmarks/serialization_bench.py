@@ -0,0 +1,79 @@
+"""Serialization cost of a 10k-message /chat/history payload: old path versus orjson.
+
+The old path stringified ObjectIds and reformatted timestamps per document, then went
+through FastAPI's jsonable_encoder and the stdlib JSON renderer. The new path hands the raw
+Mongo documents to BSONResponse.
+
+Run from backend/:
+    python -m benchmarks.serialization_bench --messages 10000
+"""
+import argparse, json, time, uuid
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from routers.chat import format_timestamp_for_response, serialize_history_doc
+from utils.serialization import BSONResponse
+
+
+def history_docs(count):
+    start = datetime(2024, 1, 1)
+    return [{
+        "_id": ObjectId(),
+        "user_id": "user-1",
+        "bot_id": "bot-1",
+        "message": f"message {i} " + "lorem ipsum " * 8,
+        "response": f"response {i} " + "dolor sit amet " * 12,
+        "message_id": str(uuid.uuid4()),
+        "timestamp": start + timedelta(seconds=i, milliseconds=123),
+        "updated": start + timedelta(seconds=i, milliseconds=123)
+    } for i in range(count)]
+
+
+def legacy_serialize(doc, chat_id):
+    doc["_id"] = str(doc["_id"])
+    doc["timestamp"] = format_timestamp_for_response(doc.get("timestamp"))
+    if isinstance(doc.get("updated"), datetime):
+        doc["updated"] = format_timestamp_for_response(doc["updated"])
+    doc["chat_id"] = chat_id
+    return doc
+
+
+def legacy_path(docs):
+    content = {"status": "success", "data": [legacy_serialize(doc, "user-1_bot-1") for doc in docs]}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def orjson_path(docs):
+    content = {"status": "success", "data": [serialize_history_doc(doc, "user-1_bot-1") for doc in docs]}
+    return BSONResponse(content).body
+
+
+def run(label, render, messages, repeat):
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        docs = history_docs(messages)
+        started = time.perf_counter()
+        body = render(docs)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{label:<10} median={timings[len(timings) // 2] * 1000:8.1f}ms  best={timings[0] * 1000:8.1f}ms  "
+          f"body={len(body) / 1e6:5.2f}MB")
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    legacy = run("legacy", legacy_path, args.messages, args.repeat)
+    fast = run("orjson", orjson_path, args.messages, args.repeat)
+    # Same documents must come out the same apart from whitespace
+    assert json.loads(legacy)["data"][0].keys() == json.loads(fast)["data"][0].keys()
+
+
+if __name__ == "__main__":
+    main()
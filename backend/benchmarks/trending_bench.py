@@ -0,0 +1,98 @@
+"""Popularity ranking: aggregating db.chats per request vs incrementally maintained counters.
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database. Run from backend/:
+    python -m benchmarks.trending_bench --bots 2000 --users 5000 --messages 200000
+"""
+import argparse, asyncio, itertools, random, statistics, time, uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+from utils.bot_stats import BotStatsRecorder, TrendingBots
+
+
+@contextmanager
+def timed(latencies):
+    started = time.perf_counter()
+    yield
+    latencies.append((time.perf_counter() - started) * 1000)
+
+
+def summary(label, latencies):
+    latencies.sort()
+    print(f"{label:<34} p50={statistics.median(latencies):9.2f}ms  p95={latencies[int(len(latencies) * 0.95)]:9.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--reads", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"trending_bench_{uuid.uuid4().hex[:8]}"]
+    try:
+        for collection, models in INDEXES.items():
+            await db[collection].create_indexes(models)
+
+        now = datetime.now(timezone.utc)
+        bot_ids = [str(uuid.uuid4()) for _ in range(args.bots)]
+        await db.bots.insert_many([{"bot_id": bot_id, "user_id": "creator", "name": f"bot {i}", "bio": "", "first_message": "",
+                                    "type_of_bot": "friend", "privacy": "public", "created_at": now}
+                                   for i, bot_id in enumerate(bot_ids)])
+
+        # Zipf-ish popularity over the last week; every turn is both a chat document and a counter update
+        recorder = BotStatsRecorder(db)
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(args.bots)))
+        batch = []
+        for _ in range(args.messages):
+            bot_id = rng.choices(bot_ids, cum_weights=cum_weights)[0]
+            user_id = f"user-{rng.randrange(args.users)}"
+            at = now - timedelta(minutes=rng.randrange(7 * 24 * 60))
+            batch.append({"user_id": user_id, "bot_id": bot_id, "message": "hi", "response": "hey",
+                          "message_id": str(uuid.uuid4()), "timestamp": at, "updated": at})
+            recorder.record(bot_id, user_id, at)
+            if len(batch) == 10000:
+                await db.chats.insert_many(batch)
+                await recorder.flush()
+                batch = []
+        if batch:
+            await db.chats.insert_many(batch)
+        await recorder.flush()
+        print(f"counters: {args.messages} messages -> {recorder.writes} batched writes "
+              f"({await db.bot_activity.count_documents({})} hourly buckets)")
+
+        aggregate, refresh, read = [], [], []
+        for _ in range(args.reads):
+            with timed(aggregate):
+                await db.chats.aggregate([
+                    {"$group": {"_id": "$bot_id", "messages": {"$sum": 1}, "users": {"$addToSet": "$user_id"}}},
+                    {"$project": {"messages": 1, "unique_users": {"$size": "$users"}}},
+                    {"$sort": {"messages": -1}},
+                    {"$limit": 20}
+                ]).to_list(None)
+
+        trending = TrendingBots()
+        for _ in range(max(1, args.reads // 5)):
+            with timed(refresh):
+                await trending.refresh(db)
+        for _ in range(args.reads * 100):
+            with timed(read):
+                trending.top(0, 20)
+
+        summary("aggregate db.chats per request", aggregate)
+        summary("trending refresh (periodic)", refresh)
+        summary("/bots/trending read", read)
+        top = trending.top(0, 3)
+        print("top 3:", ", ".join(f"{bot['name']} ({bot['messages']} msgs, {bot['unique_users']} users)" for bot in top))
+    finally:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""Per-turn persistence latency and write throughput: inline insert_one vs write-behind batches.
+
+Needs a local mongod (MONGODB_URI); uses a throwaway database. Run from backend/:
+    python -m benchmarks.write_behind_bench --sessions 200 --turns 50
+"""
+import argparse, asyncio, statistics, time, uuid
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.db import MONGODB_URI
+from utils.indexes import INDEXES
+import utils.chat_store as chat_store
+from utils.chat_store import ChatWriteBehind, iter_turns, take
+
+
+def turn(user_id, bot_id, i):
+    now = datetime.now(timezone.utc)
+    return {
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "message": f"message {i}: how was your day?",
+        "response": f"reply {i}: pretty chill honestly, you?",
+        "message_id": str(uuid.uuid4()),
+        "timestamp": now,
+        "updated": now
+    }
+
+
+async def run(label, db, store, sessions, turns, drain=None):
+    latencies = []
+
+    async def session():
+        user_id, bot_id = str(uuid.uuid4()), str(uuid.uuid4())
+        for i in range(turns):
+            started = time.perf_counter()
+            await store(turn(user_id, bot_id, i))
+            latencies.append((time.perf_counter() - started) * 1000)
+        return user_id, bot_id
+
+    started = time.perf_counter()
+    keys = await asyncio.gather(*(session() for _ in range(sessions)))
+    acked = time.perf_counter() - started
+    if drain:
+        await drain()
+    persisted = time.perf_counter() - started
+
+    stored = await db.chats.count_documents({"user_id": {"$in": [user_id for user_id, _ in keys]}})
+    latencies.sort()
+    print(f"{label:<12} p50={statistics.median(latencies):7.2f}ms  p95={latencies[int(len(latencies) * 0.95)]:7.2f}ms  "
+          f"acked/s={len(latencies) / acked:9.0f}  persisted/s={stored / persisted:9.0f}  stored={stored}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[f"write_behind_bench_{uuid.uuid4().hex[:8]}"]
+    try:
+        for collection, models in INDEXES.items():
+            await db[collection].create_indexes(models)
+
+        async def inline(doc):
+            await db.chats.insert_one(doc)
+
+        await run("inline", db, inline, args.sessions, args.turns)
+
+        writer = ChatWriteBehind(db, batch_size=args.batch_size, flush_interval=args.flush_interval,
+                                 maxsize=args.sessions * args.turns)
+
+        async def queued(doc):
+            writer.enqueue(doc)
+
+        await run("write-behind", db, queued, args.sessions, args.turns, drain=writer.stop)
+
+        # Read-your-writes: a turn queued a moment ago is visible before it is flushed
+        writer = ChatWriteBehind(db, flush_interval=5)
+        probe = turn("probe-user", "probe-bot", 0)
+        writer.enqueue(probe)
+        chat_store._chat_writer = writer
+        latest = await take(iter_turns(db, "probe-user", "probe-bot", direction=-1), 1)
+        print(f"read-your-writes overlay: {'ok' if latest and latest[0]['message_id'] == probe['message_id'] else 'MISSING'}")
+        await writer.stop()
+        chat_store._chat_writer = None
+    finally:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+import asyncio, sys
+from utils.db import init_mongo, get_db, close_mongo
+from utils.indexes import ensure_indexes, find_collscans
+
+
+async def check_query_plans(create_missing):
+    init_mongo()
+    try:
+        db = get_db()
+        if create_missing:
+            await ensure_indexes(db)
+        return await find_collscans(db)
+    finally:
+        close_mongo()
+
+
+if __name__ == "__main__":
+    # Usage: python check_query_plans.py [--ensure]
+    failures = asyncio.run(check_query_plans("--ensure" in sys.argv))
+    if failures:
+        for description, stages in failures:
+            print(f"❌ COLLSCAN in {description}: {' <- '.join(stages)}")
+        sys.exit(1)
+    print("✅ All hot queries use an index")
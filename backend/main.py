@@ -1,20 +1,71 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 from routers import auth, bots, chat
+from utils.llm_client import init_llm_client, close_llm_client
+from utils.llm_providers import close_llm_router, get_llm_router
+from utils.db import init_mongo, ping_mongo, close_mongo, get_db
+from utils.indexes import ensure_indexes
+from utils.bot_cache import bot_cache, init_invalidation_channel
+from utils.gmail_utils import get_email_queue, close_email_queue
+from utils.hashing import close_hashing_pool, get_hashing_pool
+from utils.avatars import close_avatar_pool, get_avatar_pool
+from utils.chat_store import CHAT_WRITE_BEHIND, get_chat_writer, close_chat_writer
+from utils.llm_dispatch import LLMOverloaded, LLMUpstreamError, get_dispatcher
+from utils.metrics import Gauge, MetricsMiddleware, StatsCollector, render_metrics
+from utils.serialization import BSONResponse
+from utils.response_cache import response_cache
+from utils.search import search_index
+from utils.bot_stats import get_bot_stats, close_bot_stats, trending_bots
+from utils.deletion import get_deletion_worker, close_deletion_worker
+import asyncio
 import uvicorn
 from dotenv import load_dotenv
-from pymongo import MongoClient
-import os
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Mongo pool per worker, shared by every router through utils.db.get_db
+    app.state.mongo = init_mongo()
+    if await ping_mongo():
+        await ensure_indexes(get_db())
+    # One pooled LLM client per worker, shared by every /chat/ask call
+    app.state.llm_client = init_llm_client()
+    # Cross-worker bot cache invalidation, if configured
+    listener = init_invalidation_channel(get_db())
+    invalidation_task = asyncio.create_task(listener) if listener else None
+    # Background email workers; routes only enqueue
+    get_email_queue().start()
+    # Public bot search index, built in the background and refreshed periodically
+    search_task = asyncio.create_task(search_index.run_refresher(get_db()))
+    # Per-bot usage counters (flushed in batches) and the trending list built from them
+    get_bot_stats(get_db()).start()
+    trending_task = asyncio.create_task(trending_bots.run_refresher(get_db()))
+    # Batched purges behind /chat/restart and bot deletion; resumes unfinished jobs
+    get_deletion_worker(get_db()).start()
+    # Batched chat-turn inserts, if enabled
+    if CHAT_WRITE_BEHIND:
+        get_chat_writer(get_db()).start()
+    yield
+    if invalidation_task:
+        invalidation_task.cancel()
+    search_task.cancel()
+    trending_task.cancel()
+    await close_deletion_worker()
+    await close_email_queue()
+    # Drain queued chat turns while Mongo is still open
+    await close_chat_writer()
+    await close_bot_stats()
+    close_hashing_pool()
+    close_avatar_pool()
+    await close_llm_router()
+    await close_llm_client()
+    close_mongo()
 
-# Initialize Mongo connection
-mongo = MongoClient(os.getenv("MONGODB_URI"))
-db_name = os.getenv("MONGODB_DB_NAME", "ai_companion")  # fallback if not in .env
-db = mongo[db_name]
-
-app = FastAPI(title="AI Companion API", version="1.0.0")
+# orjson for every route; hot list endpoints return BSONResponse directly to skip jsonable_encoder
+app = FastAPI(title="AI Companion API", version="1.0.0", lifespan=lifespan, default_response_class=BSONResponse)
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +75,78 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]  # Add this line
 )
+# Per-route latency / in-flight / response size; outermost so it also times CORS handling
+app.add_middleware(MetricsMiddleware)
+
+# Component counters and queue depths, read from each component's stats() when /metrics is scraped
+Gauge("email_queue_depth", "Emails waiting for a worker", function=lambda: get_email_queue().depth)
+StatsCollector("hashing", lambda: get_hashing_pool().stats(),
+               counters={"completed": "bcrypt jobs finished"},
+               gauges={"waiting": "bcrypt jobs queued for the hashing pool", "in_flight": "bcrypt jobs running",
+                       "avg_wait_ms": "Mean queue wait of bcrypt jobs", "avg_hash_ms": "Mean bcrypt run time"})
+StatsCollector("avatar", lambda: get_avatar_pool().stats(),
+               counters={"completed": "Avatars processed", "rejected": "Avatars rejected by the pool"},
+               gauges={"waiting": "Avatars queued for the processing pool",
+                       "avg_process_ms": "Mean avatar processing time"})
+StatsCollector("bot_cache", bot_cache.stats,
+               counters={"hits": "Bot cache hits", "misses": "Bot cache misses",
+                         "invalidations": "Bot cache invalidations"},
+               gauges={"size": "Bots in the cache"})
+StatsCollector("response_cache", response_cache.stats,
+               counters={"hits": "Opening-turn cache hits", "misses": "Opening-turn cache misses",
+                         "coalesced": "Requests that waited on an identical in-flight call"},
+               gauges={"size": "Cached opening-turn replies", "in_flight": "Opening-turn calls in flight"})
+StatsCollector("llm_dispatch", lambda: get_dispatcher().stats(),
+               counters={"completed": "LLM calls finished", "rejected": "LLM calls rejected with 429",
+                         "timed_out": "LLM calls that timed out waiting for a slot"},
+               gauges={"in_flight": "LLM calls currently upstream", "waiting": "LLM calls queued for a slot",
+                       "avg_queue_wait_ms": "Mean queue wait of LLM calls",
+                       "max_queue_wait_ms": "Longest queue wait of an LLM call",
+                       "avg_upstream_ms": "Mean upstream time of LLM calls",
+                       "max_upstream_ms": "Longest upstream time of an LLM call"})
+StatsCollector("llm_model", lambda: get_llm_router().stats()["models"], labelname="model",
+               counters={"hedges": "Hedged attempts sent to the model", "hedges_won": "Hedged attempts that won",
+                         "breaker_trips": "Times the model's circuit breaker opened"},
+               gauges={"breaker_open": "1 while the model's circuit breaker is open or half-open",
+                       "hedge_delay_ms": "Current hedge delay", "p50_ms": "Median recent reply latency",
+                       "p90_ms": "p90 recent reply latency", "p99_ms": "p99 recent reply latency"})
+StatsCollector("chat_write", lambda: get_chat_writer().stats() if CHAT_WRITE_BEHIND else {},
+               counters={"queued": "Chat turns queued for write-behind", "written": "Chat turns written in batches",
+                         "batches": "Write-behind batches", "failed": "Chat turns dropped after retries",
+                         "overflowed": "Chat turns written inline because the queue was full"},
+               gauges={"queue_depth": "Chat turns waiting for a write-behind flush"})
+StatsCollector("search_index", search_index.stats,
+               counters={"queries": "Bot searches served"},
+               gauges={"bots": "Public bots in the search index", "terms": "Distinct terms in the search index",
+                       "built_at": "Unix time of the last index build", "avg_query_ms": "Mean search latency"})
+StatsCollector("deletion_jobs", lambda: get_deletion_worker().stats(),
+               counters={"completed": "Background deletion jobs finished"})
+StatsCollector("trending", trending_bots.stats,
+               gauges={"bots": "Bots in the trending list", "refreshed_at": "Unix time of the last refresh",
+                       "refresh_ms": "Duration of the last trending refresh"})
+StatsCollector("bot_stats", lambda: get_bot_stats().stats(),
+               counters={"recorded": "Chat turns counted", "flushes": "Counter flushes",
+                         "writes": "Bulk writes issued by counter flushes", "failed_flushes": "Failed counter flushes"},
+               gauges={"buffered_bots": "Bots with counts waiting for the next flush"})
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(LLMUpstreamError)
+async def llm_upstream_error_handler(request: Request, exc: LLMUpstreamError):
+    print(f"❌ LLM upstream error ({exc.status_code}): {exc}")
+    if exc.status_code == 429:
+        return JSONResponse(
+            status_code=429,
+            content={"status": "error", "message": "The model is busy, please retry shortly"},
+            headers={"Retry-After": str(exc.retry_after or 1)}
+        )
+    return JSONResponse(status_code=502, content={"status": "error", "message": "The model failed to reply"})
 
 # Then import and include your routers
 from routers import auth, bots, chat
@@ -33,16 +156,14 @@ app.include_router(auth.router)
 app.include_router(bots.router)
 app.include_router(chat.router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to AI Companion API"}
 
-# Test DB connection
-try:
-    db.users.find_one()
-    print("✅ MongoDB Connected Successfully!")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,49 @@
+import asyncio
+from utils.db import init_mongo, get_db, close_mongo
+from utils.avatars import close_avatar_pool, decode_avatar, store_avatar
+
+
+async def legacy_avatar(db, bot):
+    """The bytes of a bot's unprocessed avatar: a per-bot db.bot_avatars document or inline base64."""
+    if bot.get("avatar_etag"):
+        avatar = await db.bot_avatars.find_one({"bot_id": bot["bot_id"]}, {"data": 1})
+        if avatar:
+            return avatar["data"]
+    if bot.get("avatar_base64"):
+        return decode_avatar(bot["avatar_base64"])[0]
+    raise ValueError("no stored avatar")
+
+
+async def migrate_avatars():
+    """Re-encode older avatars (inline avatar_base64 strings and per-bot db.bot_avatars documents)
+    into content-addressed renditions in db.avatar_blobs, then drop db.bot_avatars."""
+    init_mongo()
+    db = get_db()
+    migrated, failed = 0, 0
+    try:
+        query = {"avatar": {"$exists": False}, "$or": [{"avatar_base64": {"$nin": [None, ""]}},
+                                                       {"avatar_etag": {"$exists": True}}]}
+        async for bot in db.bots.find(query, {"bot_id": 1, "avatar_base64": 1, "avatar_etag": 1}):
+            try:
+                refs = await store_avatar(db, await legacy_avatar(db, bot))
+            except ValueError as e:
+                print(f"❌ Skipping bot {bot['bot_id']}: {e}")
+                failed += 1
+                continue
+            await db.bots.update_one(
+                {"_id": bot["_id"]},
+                {"$set": {"avatar": refs}, "$unset": {"avatar_base64": "", "avatar_etag": ""}}
+            )
+            await db.bot_avatars.delete_one({"bot_id": bot["bot_id"]})
+            migrated += 1
+        # The app no longer reads db.bot_avatars; only documents of skipped bots are left
+        if not failed:
+            await db.bot_avatars.drop()
+    finally:
+        close_avatar_pool()
+        close_mongo()
+    print(f"✅ Migrated {migrated} avatars ({failed} skipped)")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_avatars())
@@ -0,0 +1,76 @@
+import argparse, asyncio
+from utils.db import init_mongo, get_db, close_mongo
+from utils.chat_store import CHAT_BUCKET_SIZE, TURN_FIELDS
+
+
+def bucket_document(user_id, bot_id, turns):
+    """A closed bucket: the app never appends to it, even when it holds fewer than CHAT_BUCKET_SIZE
+    turns, because turns it stored while the migration ran may be newer."""
+    messages = []
+    for turn in turns:
+        message = {field: turn[field] for field in TURN_FIELDS if field in turn}
+        message["_id"] = turn["_id"]
+        messages.append(message)
+    return {
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "messages": messages,
+        "count": len(messages),
+        "closed": True,
+        "start_ts": messages[0]["timestamp"],
+        "end_ts": messages[-1]["timestamp"]
+    }
+
+
+async def migrate_conversation(db, user_id, bot_id, bucket_size):
+    """Move one conversation's per-turn documents into full buckets, oldest first.
+
+    Each bucket is written before its source turns are deleted; the read adapter in
+    utils.chat_store de-duplicates the overlap, so the app can keep serving throughout.
+    """
+    moved = 0
+    cursor = db.chats.find({"user_id": user_id, "bot_id": bot_id}).sort([("timestamp", 1), ("message_id", 1)])
+    batch = []
+    async for turn in cursor:
+        batch.append(turn)
+        if len(batch) == bucket_size:
+            moved += await flush(db, user_id, bot_id, batch)
+            batch = []
+    if batch:
+        moved += await flush(db, user_id, bot_id, batch)
+    return moved
+
+
+async def flush(db, user_id, bot_id, batch):
+    await db.chat_buckets.insert_one(bucket_document(user_id, bot_id, batch))
+    await db.chats.delete_many({"_id": {"$in": [turn["_id"] for turn in batch]}})
+    return len(batch)
+
+
+async def migrate(bucket_size, limit):
+    init_mongo()
+    db = get_db()
+    try:
+        conversations = db.chats.aggregate([
+            {"$group": {"_id": {"user_id": "$user_id", "bot_id": "$bot_id"}}},
+            *([{"$limit": limit}] if limit else [])
+        ])
+        total, count = 0, 0
+        async for conversation in conversations:
+            key = conversation["_id"]
+            moved = await migrate_conversation(db, key["user_id"], key["bot_id"], bucket_size)
+            total += moved
+            count += 1
+            print(f"Moved {moved} turns for {key['user_id']}_{key['bot_id']}")
+        print(f"✅ Migrated {total} turns across {count} conversations")
+    finally:
+        close_mongo()
+
+
+if __name__ == "__main__":
+    # Set CHAT_STORAGE=buckets on the app first so new turns stop landing in db.chats
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bucket-size", type=int, default=CHAT_BUCKET_SIZE)
+    parser.add_argument("--limit", type=int, default=0, help="only migrate this many conversations")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.bucket_size, args.limit))
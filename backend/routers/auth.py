@@ -1,19 +1,18 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
 from pydantic import EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.db import get_db
 from bson import ObjectId
 from datetime import datetime, timedelta
-from utils.hashing import hash_password, verify_password
+from utils.hashing import (
+    hash_password_async, verify_password_async, verify_and_update_password_async
+)
 from utils.gmail_utils import send_otp_email, send_welcome_email
 import random, uuid, os
 
 from dotenv import load_dotenv
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGODB_URI")
-client = AsyncIOMotorClient(MONGO_URI)
-db = client["ai_companion"]
-
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 
@@ -22,7 +21,8 @@ async def signup(
     full_name: str = Body(...),
     email: EmailStr = Body(...),
     password: str = Body(...),
-    confirm_password: str = Body(...)
+    confirm_password: str = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     if password != confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
@@ -37,7 +37,7 @@ async def signup(
         "user_id": str(uuid.uuid4()),
         "full_name": full_name,
         "email": email,
-        "password": hash_password(password),
+        "password": await hash_password_async(password),
         "is_verified": False,
         "otp": str(otp),
         "otp_created_at": datetime.utcnow()
@@ -46,7 +46,7 @@ async def signup(
     await db.users.insert_one(user)
 
     try:
-        # Send welcome email with OTP
+        # Queue welcome email with OTP; delivery happens on the background email workers
         await send_welcome_email(email, full_name)
         await send_otp_email(email, otp)
         return {
@@ -63,11 +63,19 @@ async def signup(
 
 
 @router.post("/login")
-async def login(email: EmailStr = Body(...), password: str = Body(...)):
+async def login(email: EmailStr = Body(...), password: str = Body(...), db: AsyncIOMotorDatabase = Depends(get_db)):
     user = await db.users.find_one({"email": email})
-    if not user or not verify_password(password, user["password"]):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    valid, new_hash = await verify_and_update_password_async(password, user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Transparently rehash when BCRYPT_ROUNDS has changed since this hash was made
+    if new_hash:
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+
     if not user.get("is_verified"):
         raise HTTPException(status_code=403, detail="Email not verified")
 
@@ -79,7 +87,7 @@ async def login(email: EmailStr = Body(...), password: str = Body(...)):
 
 
 @router.post("/forgot-password/request")
-async def forgot_password_request(email: EmailStr = Body(...)):
+async def forgot_password_request(email: EmailStr = Body(...), db: AsyncIOMotorDatabase = Depends(get_db)):
     user = await db.users.find_one({"email": email})
     if not user:
         # For security, don't reveal if email exists or not
@@ -109,7 +117,8 @@ async def forgot_password_request(email: EmailStr = Body(...)):
 async def verify_password_reset_otp(
     email: EmailStr = Body(...),
     otp: str = Body(...),
-    new_password: str = Body(None)
+    new_password: str = Body(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     user = await db.users.find_one({"email": email})
     if not user:
@@ -131,7 +140,7 @@ async def verify_password_reset_otp(
             raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
         
         # Check if new password is the same as the old one
-        if verify_password(new_password, user["password"]):
+        if await verify_password_async(new_password, user["password"]):
             raise HTTPException(
                 status_code=400,
                 detail="New password cannot be the same as your current password"
@@ -140,7 +149,7 @@ async def verify_password_reset_otp(
         await db.users.update_one(
             {"email": email},
             {
-                "$set": {"password": hash_password(new_password)},
+                "$set": {"password": await hash_password_async(new_password)},
                 "$unset": {"reset_otp": "", "reset_otp_created_at": ""}
             }
         )
@@ -151,7 +160,7 @@ async def verify_password_reset_otp(
 
 
 @router.post("/email-verification")
-async def email_verification(email: EmailStr = Body(...), otp: str = Body(...)):
+async def email_verification(email: EmailStr = Body(...), otp: str = Body(...), db: AsyncIOMotorDatabase = Depends(get_db)):
     user = await db.users.find_one({"email": email})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -174,3 +183,4 @@ async def email_verification(email: EmailStr = Body(...), otp: str = Body(...)):
         }
     )
     return {"message": "Email verified successfully"}
+
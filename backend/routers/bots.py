@@ -1,20 +1,59 @@
-from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, Body
-from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Body, Depends, Query, Request, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.db import get_db
+from utils.avatars import (AVATAR_MAX_BASE64, AVATAR_VARIANTS, store_avatar, release_avatar, load_avatar,
+                           load_avatar_blob, avatar_url, encode_avatar, is_current_avatar)
+from utils.bot_cache import bot_cache, invalidate_bot
+from utils.bots import BOT_CARD_PROJECTION
+from utils.serialization import BSONResponse
+from utils.search import search_index
+from utils.bot_stats import TRENDING_SIZE, trending_bots
+from utils.deletion import schedule_bot_deletion
 from datetime import datetime, timezone
 import os, uuid
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
 router = APIRouter(prefix="/bots", tags=["Bots"])
 
-client = AsyncIOMotorClient(os.getenv("MONGODB_URI"))
-db = client["ai_companion"]
-
 def get_current_timestamp():
     """Get current UTC timestamp as timezone-aware datetime object."""
     return datetime.now(timezone.utc)
 
+BOT_LIST_SORTS = {
+    "newest": [("created_at", -1)],
+    "oldest": [("created_at", 1)],
+    "name": [("name", 1)]
+}
+
+def bot_card(bot):
+    # ObjectId and datetimes are handled by the response encoder
+    bot["avatar_url"] = avatar_url(bot, "card")
+    return bot
+
+async def list_bot_cards(db, query, skip, limit, sort):
+    cursor = db.bots.find(query, BOT_CARD_PROJECTION).sort(BOT_LIST_SORTS[sort]).skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    return [bot_card(bot) async for bot in cursor]
+
+class BotCard(BaseModel):
+    """Shape of /bots/public and /bots/my items (documentation only; lists are not re-validated)."""
+    id: str = Field(alias="_id")
+    bot_id: str
+    user_id: str
+    name: str
+    bio: str
+    first_message: str
+    type_of_bot: str
+    privacy: str
+    avatar: Optional[Dict[str, str]] = None
+    avatar_url: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
 class BotCreate(BaseModel):
     user_id: str
     name: str
@@ -26,7 +65,10 @@ class BotCreate(BaseModel):
     chatting_way: str
     type_of_bot: str
     privacy: str
-    avatar_base64: str = None
+    # Rejected by length before any decoding; the image itself is processed off the event loop
+    avatar_base64: str = Field(None, max_length=AVATAR_MAX_BASE64)
+    # Serve repeated opening lines ("hi", "who are you") from the shared response cache
+    response_cache: bool = False
 
 class BotUpdate(BaseModel):
     user_id: str
@@ -39,12 +81,13 @@ class BotUpdate(BaseModel):
     chatting_way: str
     type_of_bot: str
     privacy: str
-    avatar_base64: str = None
+    # Rejected by length before any decoding; the image itself is processed off the event loop
+    avatar_base64: str = Field(None, max_length=AVATAR_MAX_BASE64)
+    # Left unchanged when omitted (the edit form doesn't send it)
+    response_cache: Optional[bool] = None
 
 @router.post("/createbot")
-async def create_bot(bot_data: BotCreate):
-    print("Received bot data:", bot_data.name, bot_data.type_of_bot, "Has avatar:", bool(bot_data.avatar_base64))
-
+async def create_bot(bot_data: BotCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
     try:
         bot_id = str(uuid.uuid4())
 
@@ -60,47 +103,90 @@ async def create_bot(bot_data: BotCreate):
             "chatting_way": bot_data.chatting_way,
             "type_of_bot": bot_data.type_of_bot,
             "privacy": bot_data.privacy,
-            "avatar_base64": bot_data.avatar_base64,
+            "response_cache": bot_data.response_cache,
             "created_at": get_current_timestamp(),
             "updated_at": get_current_timestamp()
         }
 
-        await db.bots.insert_one(bot)
+        # Avatar renditions live in db.avatar_blobs; the bot document only keeps their hashes
+        if bot_data.avatar_base64:
+            bot["avatar"] = await store_avatar(db, bot_data.avatar_base64)
+
+        try:
+            await db.bots.insert_one(bot)
+        except Exception:
+            await release_avatar(db, bot.get("avatar"))
+            raise
+        search_index.upsert(bot)
 
         return {"message": "Bot created successfully", "bot_id": bot_id}
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print("❌ Error in create_bot:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
-@router.get("/public")
-async def list_public_bots():
+@router.get("/public", response_model=List[BotCard])
+async def list_public_bots(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1, le=200),
+    sort: str = Query("newest", pattern="^(newest|oldest|name)$"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     try:
-        public_bots = []
-        async for bot in db.bots.find({"privacy": "public"}):
-            # Convert ObjectId to string for JSON serialization
-            bot["_id"] = str(bot["_id"])
-            public_bots.append(bot)
-        return public_bots
+        return BSONResponse(await list_bot_cards(db, {"privacy": "public"}, skip, limit, sort))
     except Exception as e:
         print("❌ Error in list_public_bots:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
-@router.get("/my")
-async def list_my_bots(user_id: str):
+@router.get("/my", response_model=List[BotCard])
+async def list_my_bots(
+    user_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1, le=200),
+    sort: str = Query("newest", pattern="^(newest|oldest|name)$"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     try:
-        my_bots = []
-        async for bot in db.bots.find({"user_id": user_id}):
-            # Convert ObjectId to string for JSON serialization
-            bot["_id"] = str(bot["_id"])
-            my_bots.append(bot)
-        return my_bots
+        return BSONResponse(await list_bot_cards(db, {"user_id": user_id}, skip, limit, sort))
     except Exception as e:
         print("❌ Error in list_my_bots:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
+@router.get("/search")
+async def search_bots(
+    q: str = "",
+    type_of_bot: str = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Search public bots by name, bio and type (every word matches as a prefix), ranked by
+    relevance then recency, with per-type facet counts."""
+    result = search_index.search(q, type_of_bot, skip, limit)
+    result["results"] = [bot_card(bot) for bot in result["results"]]
+    return BSONResponse(result)
+
+@router.get("/trending", response_model=List[BotCard])
+async def list_trending_bots(skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=TRENDING_SIZE)):
+    """Public bots ranked by recent chat activity (decaying over time), from a periodically
+    refreshed list; items also carry trending_score, messages and unique_users."""
+    return BSONResponse([bot_card(dict(bot)) for bot in trending_bots.top(skip, limit)])
+
+@router.get("/avatars/{avatar_hash}")
+async def get_avatar_blob(avatar_hash: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    etag = f'"{avatar_hash}"'
+    # Content-addressed: the bytes behind a hash never change
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    blob = await load_avatar_blob(db, avatar_hash)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    return Response(content=blob["data"], media_type=blob["content_type"], headers=headers)
+
 @router.put("/{bot_id}")
-async def update_bot(bot_id: str, bot_data: BotUpdate):
+async def update_bot(bot_id: str, bot_data: BotUpdate, db: AsyncIOMotorDatabase = Depends(get_db)):
     try:
         # Find the bot to update
         existing_bot = await db.bots.find_one({"bot_id": bot_id})
@@ -125,26 +211,40 @@ async def update_bot(bot_id: str, bot_data: BotUpdate):
             "privacy": bot_data.privacy,
             "updated_at": get_current_timestamp()
         }
+        if bot_data.response_cache is not None:
+            update_data["response_cache"] = bot_data.response_cache
         
-        # Only update avatar if provided
-        if bot_data.avatar_base64:
-            update_data["avatar_base64"] = bot_data.avatar_base64
+        update = {"$set": update_data}
+
+        # Only update avatar if a new one is provided; the edit page sends the current one back
+        new_avatar = bot_data.avatar_base64 and not is_current_avatar(existing_bot, bot_data.avatar_base64)
+        if new_avatar:
+            update_data["avatar"] = await store_avatar(db, bot_data.avatar_base64)
+            update["$unset"] = {"avatar_base64": "", "avatar_etag": ""}
         
-        await db.bots.update_one(
-            {"bot_id": bot_id},
-            {"$set": update_data}
-        )
+        try:
+            await db.bots.update_one({"bot_id": bot_id}, update)
+        except Exception:
+            await release_avatar(db, update_data.get("avatar"))
+            raise
+        if new_avatar:
+            await release_avatar(db, existing_bot.get("avatar"))
+        await invalidate_bot(bot_id)
+        search_index.upsert({**{k: v for k, v in existing_bot.items() if k not in update.get("$unset", {})},
+                             **update_data})
         
         return {"message": "Bot updated successfully", "bot_id": bot_id}
     
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print("❌ Error in update_bot:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
 @router.delete("/{bot_id}")
-async def delete_bot(bot_id: str, user_id: str):
+async def delete_bot(bot_id: str, user_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     try:
         # Find the bot to delete
         existing_bot = await db.bots.find_one({"bot_id": bot_id})
@@ -156,10 +256,15 @@ async def delete_bot(bot_id: str, user_id: str):
         if existing_bot.get("user_id") != user_id:
             raise HTTPException(status_code=403, detail="You don't have permission to delete this bot")
         
-        # Delete the bot
+        # Delete the bot; its conversations are tombstoned and purged by a background job
         await db.bots.delete_one({"bot_id": bot_id})
+        await release_avatar(db, existing_bot.get("avatar"))
+        await invalidate_bot(bot_id)
+        search_index.remove(bot_id)
+        trending_bots.discard(bot_id)
+        job_id = await schedule_bot_deletion(db, bot_id)
         
-        return {"message": "Bot deleted successfully", "bot_id": bot_id}
+        return {"message": "Bot deleted successfully", "bot_id": bot_id, "deletion_job_id": job_id}
     
     except HTTPException:
         raise
@@ -168,17 +273,37 @@ async def delete_bot(bot_id: str, user_id: str):
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
 @router.get("/{bot_id}")
-async def get_bot(bot_id: str):
+async def get_bot(bot_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     try:
-        bot = await db.bots.find_one({"bot_id": bot_id})
+        bot = await bot_cache.get_bot(db, bot_id)
         if not bot:
             raise HTTPException(status_code=404, detail="Bot not found")
         
-        # Convert ObjectId to string for JSON serialization
-        bot["_id"] = str(bot["_id"])
-        return bot
+        bot["avatar_url"] = avatar_url(bot)
+        if bot.get("avatar"):
+            bot["avatar_urls"] = {variant: avatar_url(bot, variant) for variant in AVATAR_VARIANTS}
+
+        # Single-bot reads keep the inline data URL the chat and edit pages render
+        avatar = await load_avatar(db, bot_id, bot)
+        if avatar:
+            bot["avatar_base64"] = encode_avatar(avatar["data"], avatar["content_type"])
+        return BSONResponse(bot)
     except HTTPException:
         raise
     except Exception as e:
         print("❌ Error in get_bot:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
+
+@router.get("/{bot_id}/avatar")
+async def get_bot_avatar(bot_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    avatar = await load_avatar(db, bot_id)
+    if not avatar:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+
+    etag = f'"{avatar["etag"]}"'
+    # The bytes behind this URL change when the avatar does; clients revalidate with the ETag.
+    # Cards link the immutable /bots/avatars/{hash} URLs instead.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=avatar["data"], media_type=avatar["content_type"], headers=headers)
@@ -1,16 +1,25 @@
-from fastapi import APIRouter, Body, HTTPException
-from motor.motor_asyncio import AsyncIOMotorClient
-from utils.langchain_utils import chat_with_bot
+from fastapi import APIRouter, Body, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.db import get_db
+from utils.langchain_utils import chat_with_bot, stream_chat_with_bot, summarize_conversation
+from utils.memory import load_context, schedule_summary_update
+from utils.bot_cache import bot_cache
+from utils.llm_dispatch import get_dispatcher
+from utils.bot_stats import record_message
+from utils.chat_store import insert_turn, iter_turns, take, list_conversations, mark_conversation_read
+from utils.avatars import avatar_url
+from utils.deletion import get_deletion_job, schedule_conversation_deletion
+from utils.serialization import BSONResponse, dumps
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime, timezone
-import uuid, os
+import base64, binascii, uuid, os
 from dotenv import load_dotenv
 load_dotenv()
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-client = AsyncIOMotorClient(os.getenv("MONGODB_URI"))
-db = client["ai_companion"]
-
 def get_current_timestamp():
     """Get current UTC timestamp as timezone-aware datetime object."""
     return datetime.now(timezone.utc)
@@ -36,6 +45,32 @@ def format_timestamp_for_response(timestamp):
     else:
         return get_current_timestamp().isoformat()
 
+def chat_turn_document(user_id, bot_id, message, response, message_id=None, is_system_message=False):
+    """Build the stored document for a single user/bot exchange."""
+    turn = {
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "message": message,
+        "response": response,
+        "message_id": message_id or str(uuid.uuid4()),
+        "timestamp": get_current_timestamp(),
+        "updated": get_current_timestamp()
+    }
+    if is_system_message:
+        turn["is_system_message"] = True
+    return turn
+
+async def store_turn(db, turn):
+    """Store a turn the user has just been shown, and move their read marker up to it."""
+    await insert_turn(db, turn)
+    await mark_conversation_read(db, turn["user_id"], turn["bot_id"], turn["timestamp"])
+
+def encode_stream_event(event, data, stream_format):
+    """Encode one stream event as an SSE frame or a newline-delimited JSON line."""
+    if stream_format == "ndjson":
+        return dumps({"event": event, **data}) + b"\n"
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
 @router.post("/ask")
 async def ask(
     user_id: str = Body(...),
@@ -43,82 +78,310 @@ async def ask(
     message: str = Body(...),
     is_system_message: bool = Body(False),
     response: str = Body(None),
-    message_id: str = Body(None)
+    message_id: str = Body(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     # chat_id is constructed when needed instead of stored
     chat_id = f"{user_id}_{bot_id}"
     
-    # Load bot data from MongoDB
-    bot = await db.bots.find_one({"bot_id": bot_id})
+    # Load bot data (cached; invalidated by bots.update_bot / delete_bot)
+    bot = await bot_cache.get_bot(db, bot_id)
     if not bot:
         return {"status": "error", "message": "Bot not found"}
 
     # If it's a system message (like bot's first message), store it directly
     if is_system_message and response:
-        await db.chats.insert_one({
-            "user_id": user_id,
-            "bot_id": bot_id,
-            "message": message,  # Empty for system messages is acceptable
-            "response": response,
-            "is_system_message": True,
-            "message_id": message_id or str(uuid.uuid4()),
-            "timestamp": get_current_timestamp(),
-            "updated": get_current_timestamp()
-        })
+        # message may be empty for system messages
+        await store_turn(db, chat_turn_document(user_id, bot_id, message, response, message_id, is_system_message=True))
         return {"status": "success", "message": "System message stored"}
     
-    # Normal user message flow
-    response = await chat_with_bot(bot, message, chat_id)
+    # Normal user message flow: recent turns plus a rolling summary of older ones
+    context = await load_context(db, user_id, bot_id)
+    response = await chat_with_bot(bot, message, chat_id, context, user_id=user_id)
 
-    await db.chats.insert_one({
-        "user_id": user_id,
-        "bot_id": bot_id,
-        "message": message,
-        "response": response,
-        "message_id": message_id or str(uuid.uuid4()),
-        "timestamp": get_current_timestamp(),
-        "updated": get_current_timestamp()
-    })
+    await store_turn(db, chat_turn_document(user_id, bot_id, message, response, message_id))
+    schedule_summary_update(db, user_id, bot_id, summarize_conversation)
+    record_message(db, bot_id, user_id)
 
     return {"status": "success", "response": response}
 
-@router.get("/history")
-async def get_chat_history(user_id: str, bot_id: str):
+@router.post("/ask/stream")
+async def ask_stream(
+    user_id: str = Body(...),
+    bot_id: str = Body(...),
+    message: str = Body(...),
+    message_id: str = Body(None),
+    stream_format: str = Query("sse", alias="format", pattern="^(sse|ndjson)$"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream the bot reply token by token; the full turn is stored once the stream completes."""
+    chat_id = f"{user_id}_{bot_id}"
+
+    bot = await bot_cache.get_bot(db, bot_id)
+    if not bot:
+        return {"status": "error", "message": "Bot not found"}
+
+    # Reject with 429 before opening the stream rather than mid-way through it
+    get_dispatcher().check_capacity()
+
+    message_id = message_id or str(uuid.uuid4())
+    context = await load_context(db, user_id, bot_id)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for text in stream_chat_with_bot(bot, message, chat_id, context, user_id=user_id):
+                chunks.append(text)
+                yield encode_stream_event("token", {"text": text}, stream_format)
+        except Exception as e:
+            print(f"Error in ask_stream: {str(e)}")
+            yield encode_stream_event("error", {"message": str(e)}, stream_format)
+            return
+
+        response = "".join(chunks)
+        await store_turn(db, chat_turn_document(user_id, bot_id, message, response, message_id))
+        schedule_summary_update(db, user_id, bot_id, summarize_conversation)
+        record_message(db, bot_id, user_id)
+        yield encode_stream_event("done", {"message_id": message_id, "response": response}, stream_format)
+
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        # Stop reverse proxies from buffering the stream and hiding the first token
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Fields returned by /chat/history unless the client asks for fewer
+HISTORY_FIELDS = ("user_id", "bot_id", "message", "response", "is_system_message", "message_id", "timestamp", "updated")
+
+def history_fields(fields):
+    """Parse a comma-separated field list; the cursor keys are always included."""
+    if not fields:
+        return list(HISTORY_FIELDS)
+    requested = {field.strip() for field in fields.split(",") if field.strip() in HISTORY_FIELDS}
+    requested.update(("timestamp", "message_id"))
+    return list(requested)
+
+def encode_history_cursor(doc):
+    """Opaque keyset cursor for a chat turn: its (timestamp, message_id) pair."""
+    raw = f"{format_timestamp_for_response(doc.get('timestamp'))}|{doc.get('message_id', '')}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor):
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), message_id
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+def serialize_history_doc(doc, chat_id):
+    # ObjectId and datetimes are rendered by the response encoder; only chat_id is added,
+    # for frontend compatibility
+    doc["chat_id"] = chat_id
+    return doc
+
+class HistoryTurn(BaseModel):
+    id: str = Field(alias="_id")
+    chat_id: str
+    user_id: str
+    bot_id: str
+    message: Optional[str] = None
+    response: Optional[str] = None
+    is_system_message: Optional[bool] = None
+    message_id: str
+    timestamp: datetime
+    updated: Optional[datetime] = None
+
+class HistoryPage(BaseModel):
+    """Documented shape of /chat/history; pages are returned as-is, not re-validated."""
+    status: str
+    data: List[HistoryTurn]
+    has_more: Optional[bool] = None
+    next_before: Optional[str] = None
+    next_after: Optional[str] = None
+
+@router.get("/history", response_model=HistoryPage)
+async def get_chat_history(
+    user_id: str,
+    bot_id: str,
+    before: str = None,
+    after: str = None,
+    limit: int = Query(None, ge=1, le=500),
+    fields: str = None,
+    stream_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Return a conversation oldest-first.
+
+    Without ``limit`` the whole history is returned (or streamed with ``format=ndjson``).
+    With ``limit`` and no cursor the latest page is returned; ``before``/``after`` take the
+    ``next_before``/``next_after`` cursors from a previous page to scroll back or forward.
+    Paged ``format=ndjson`` responses carry ``has_more`` and the cursors in ``X-Has-More``,
+    ``X-Next-Before`` and ``X-Next-After`` headers.
+    """
     try:
+        if before and after:
+            raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
         chat_id = f"{user_id}_{bot_id}"
-        # Convert MongoDB cursor to list of dicts and handle ObjectId serialization
-        history = []
-        async for doc in db.chats.find({"user_id": user_id, "bot_id": bot_id}).sort("timestamp", 1):
-            # Convert ObjectId to string
-            doc["_id"] = str(doc["_id"])
-            # Format timestamp properly
-            doc["timestamp"] = format_timestamp_for_response(doc.get("timestamp"))
-            # Add chat_id for frontend compatibility
-            doc["chat_id"] = f"{user_id}_{bot_id}"
-            history.append(doc)
-        return {"status": "success", "data": history}
+
+        # Responses are always oldest-first. A page ending at the newest turn or at a ``before``
+        # cursor has to be read newest-first from Mongo to find its start, and is flipped below;
+        # everything else (full history, ``after`` pages) is read oldest-first as is.
+        newest_first = limit is not None and not after
+        turns = iter_turns(
+            db, user_id, bot_id,
+            direction=-1 if newest_first else 1,
+            before=decode_history_cursor(before) if before else None,
+            after=decode_history_cursor(after) if after else None,
+            fields=history_fields(fields)
+        )
+
+        if limit is None:
+            if stream_format == "ndjson":
+                async def ndjson_lines():
+                    last = None
+                    async for doc in turns:
+                        last = doc
+                        yield dumps(serialize_history_doc(doc, chat_id)) + b"\n"
+                    if last:
+                        await mark_conversation_read(db, user_id, bot_id, last["timestamp"])
+                return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+            history = [serialize_history_doc(doc, chat_id) async for doc in turns]
+            if history:
+                await mark_conversation_read(db, user_id, bot_id, history[-1]["timestamp"])
+            return BSONResponse({"status": "success", "data": history})
+
+        # Fetch one extra turn to learn whether another page exists
+        page = await take(turns, limit + 1)
+        has_more = len(page) > limit
+        page = page[:limit]
+        if newest_first:
+            page.reverse()
+
+        next_before = encode_history_cursor(page[0]) if page else None
+        next_after = encode_history_cursor(page[-1]) if page else None
+        history = [serialize_history_doc(doc, chat_id) for doc in page]
+        # The marker only moves forward, so scrolling back through older pages leaves it alone
+        if history:
+            await mark_conversation_read(db, user_id, bot_id, history[-1]["timestamp"])
+
+        if stream_format == "ndjson":
+            # Every line is a turn, so the paging cursors travel in headers
+            lines = (dumps(doc) + b"\n" for doc in history)
+            headers = {"X-Has-More": "true" if has_more else "false"}
+            if next_before:
+                headers["X-Next-Before"] = next_before
+            if next_after:
+                headers["X-Next-After"] = next_after
+            return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+        return BSONResponse({
+            "status": "success",
+            "data": history,
+            "has_more": has_more,
+            "next_before": next_before,
+            "next_after": next_after
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in get_chat_history: {str(e)}")  # Add logging
-        return {"status": "error", "message": str(e)}
+        return BSONResponse({"status": "error", "message": str(e)})
+
+class ConversationBot(BaseModel):
+    id: str = Field(alias="_id")
+    bot_id: str
+    user_id: str
+    name: str
+    bio: str
+    type_of_bot: str
+    privacy: str
+    avatar_url: Optional[str] = None
+
+class ConversationLastMessage(BaseModel):
+    message: Optional[str] = None
+    response: Optional[str] = None
+    is_system_message: Optional[bool] = None
+    message_id: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+class Conversation(BaseModel):
+    bot_id: str
+    bot: ConversationBot
+    last_activity: datetime
+    last_message: Optional[ConversationLastMessage] = None
+    turn_count: int
+    unread_count: int
+    last_read_at: Optional[datetime] = None
+
+class ConversationPage(BaseModel):
+    """Documented shape of /chat/conversations; pages are returned as-is, not re-validated."""
+    status: str
+    data: List[Conversation]
+    has_more: bool
+    next_before: Optional[str] = None
+
+@router.get("/conversations", response_model=ConversationPage)
+async def get_conversations(
+    user_id: str,
+    before: str = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """The bots a user has talked to, most recently active first, with the last message,
+    turn and unread counts and card data, in one aggregation. ``before`` takes
+    ``next_before`` from the previous page."""
+    try:
+        cursor = decode_history_cursor(before) if before else None
+        rows = await list_conversations(db, user_id, cursor, limit)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        for row in rows:
+            row["bot"]["avatar_url"] = avatar_url(row["bot"], "card")
+        # Same opaque cursor format as /chat/history, over (last_activity, bot_id)
+        next_before = encode_history_cursor({"timestamp": rows[-1]["last_activity"], "message_id": rows[-1]["bot_id"]}) \
+            if rows and has_more else None
+        return BSONResponse({"status": "success", "data": rows, "has_more": has_more, "next_before": next_before})
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error in get_conversations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
+
+@router.post("/conversations/read")
+async def mark_read(user_id: str = Body(...), bot_id: str = Body(...), db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Mark a conversation read up to now (clears its unread count)."""
+    await mark_conversation_read(db, user_id, bot_id)
+    return {"status": "success"}
 
 @router.delete("/restart")
-async def restart_chat(user_id: str, bot_id: str):
+async def restart_chat(user_id: str, bot_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     try:
-        # Delete all messages for this chat using user_id and bot_id
-        result = await db.chats.delete_many({"user_id": user_id, "bot_id": bot_id})
-        
-        # Log the result
-        print(f"Deleted {result.deleted_count} messages for user_id: {user_id}, bot_id: {bot_id}")
-        
-        # Return success response with count of deleted messages
+        # The history is hidden immediately; a background job deletes it in batches
+        job = await schedule_conversation_deletion(db, user_id, bot_id)
+
         return {
             "status": "success",
             "message": "Chat history cleared successfully",
-            "deleted_count": result.deleted_count
+            # Stored turns queued for deletion (already hidden from every read) plus turns
+            # dropped from the write-behind queue before they were stored
+            "deleted_count": job["queued"] + job["discarded"],
+            "deletion_job_id": job["_id"]
         }
     except Exception as e:
         print(f"Error in restart_chat: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to clear chat history: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/deletions/{job_id}")
+async def deletion_progress(job_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Status and turns deleted so far for a restart or bot deletion job."""
+    job = await get_deletion_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return BSONResponse(job)
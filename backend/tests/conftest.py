@@ -0,0 +1,27 @@
+"""Shared fixtures: an in-memory Mongo (mongomock-motor) and the routers mounted on a bare app.
+
+Run from backend/ after `pip install -r requirements-dev.txt`:
+    python -m pytest -q
+"""
+import uuid
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from routers import bots, chat
+from utils.db import get_db
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()[f"test_{uuid.uuid4().hex[:8]}"]
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(bots.router)
+    app.include_router(chat.router)
+    app.dependency_overrides[get_db] = lambda: db
+    with TestClient(app) as client:
+        yield client
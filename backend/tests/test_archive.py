@@ -0,0 +1,19 @@
+import asyncio
+import utils.archive as archive
+from archive_chats import archive_conversation
+from test_chat_history import messages, seed_turns
+
+
+def test_archived_turns_stay_in_history_without_archive_settings(client, db, tmp_path, monkeypatch):
+    # The app runs with CHAT_ARCHIVE_AFTER_DAYS unset; only the archiver knows the cutoff
+    monkeypatch.setattr(archive, "_store", archive.LocalSegmentStore(str(tmp_path)))
+    seed_turns(db, 5)
+    cutoff = asyncio.run(db.chats.find_one({"message": "hi 3"}))["timestamp"]
+
+    assert asyncio.run(archive_conversation(db, "u1", "b1", cutoff, 2)) == 3
+    assert asyncio.run(db.chats.count_documents({})) == 2
+
+    assert messages(client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1"})) == \
+        ["hi 0", "hi 1", "hi 2", "hi 3", "hi 4"]
+    page = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 3}).json()
+    assert [turn["message"] for turn in page["data"]] == ["hi 2", "hi 3", "hi 4"]
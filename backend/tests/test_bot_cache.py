@@ -0,0 +1,19 @@
+import asyncio
+from utils.bot_cache import BotCache
+
+
+def test_hot_bot_stays_resolvable_by_object_id(db):
+    async def scenario():
+        await db.bots.insert_many([{"bot_id": f"bot-{i}", "name": f"bot {i}"} for i in range(3)])
+        cache = BotCache(maxsize=2, ttl=300)
+        hot = await cache.get_bot(db, "bot-0")
+        await cache.get_bot(db, "bot-1")
+        # bot-0 is read again, so bot-1 is the least recently used entry in both maps
+        await cache.get_bot(db, "bot-0")
+        await cache.get_bot(db, "bot-2")
+
+        await db.bots.update_one({"bot_id": "bot-0"}, {"$set": {"name": "renamed"}})
+        cache.invalidate_object_id(hot["_id"])
+        return await cache.get_bot(db, "bot-0")
+
+    assert asyncio.run(scenario())["name"] == "renamed"
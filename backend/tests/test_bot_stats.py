@@ -0,0 +1,22 @@
+import asyncio
+import pytest
+from pymongo.errors import AutoReconnect
+from utils.bot_stats import BotStatsRecorder
+
+
+def test_new_users_survive_a_failed_insert(db, monkeypatch):
+    # Only the unique-user step: mongomock's bulk_write can't run the counter flush
+    recorder = BotStatsRecorder(db)
+    recorder.record("b1", "u1")
+    recorder.record("b1", "u2")
+
+    async def fail(*args, **kwargs):
+        raise AutoReconnect("connection reset")
+    monkeypatch.setattr(type(db.bot_stats_users), "insert_many", fail)
+    with pytest.raises(AutoReconnect):
+        asyncio.run(recorder._count_new_users())
+
+    monkeypatch.undo()
+    asyncio.run(recorder._count_new_users())
+    assert recorder._new_users["b1"] == 2
+    assert asyncio.run(db.bot_stats_users.count_documents({"bot_id": "b1"})) == 2
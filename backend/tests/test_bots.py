@@ -0,0 +1,96 @@
+import asyncio, base64, io
+import pytest
+from PIL import Image
+from utils.avatars import close_avatar_pool, get_avatar_pool
+
+BOT = {
+    "user_id": "u1", "name": "Mika", "bio": "a friend", "first_message": "hey!", "situation": "s",
+    "back_story": "b", "personality": "p", "chatting_way": "c", "type_of_bot": "friend", "privacy": "public"
+}
+
+
+def stored_bot(db, bot_id):
+    return asyncio.run(db.bots.find_one({"bot_id": bot_id}))
+
+
+def avatar(color, side=128):
+    out = io.BytesIO()
+    Image.new("RGB", (side, side), color).save(out, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(out.getvalue()).decode()}"
+
+
+def blob_refs(db):
+    return {blob["_id"]: blob["refs"] for blob in asyncio.run(db.avatar_blobs.find({}).to_list(None))}
+
+
+@pytest.fixture
+def avatar_pool():
+    yield
+    close_avatar_pool()
+
+
+def test_edit_without_response_cache_keeps_it(client, db):
+    bot_id = client.post("/bots/createbot", json={**BOT, "response_cache": True}).json()["bot_id"]
+
+    res = client.put(f"/bots/{bot_id}", json={**BOT, "name": "Mika 2"})
+    assert res.status_code == 200
+    assert stored_bot(db, bot_id)["response_cache"] is True
+    assert stored_bot(db, bot_id)["name"] == "Mika 2"
+
+    client.put(f"/bots/{bot_id}", json={**BOT, "response_cache": False})
+    assert stored_bot(db, bot_id)["response_cache"] is False
+
+
+def test_avatar_refs_count_renditions_sharing_a_blob(client, db, avatar_pool):
+    # A 128px square comes out of the pipeline unchanged at both the full and card sizes
+    bot_id = client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red")}).json()["bot_id"]
+    refs = stored_bot(db, bot_id)["avatar"]
+    assert refs["full"] == refs["card"]
+    assert blob_refs(db) == {refs["full"]: 2, refs["header"]: 1}
+
+    other_id = client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red")}).json()["bot_id"]
+    assert blob_refs(db) == {refs["full"]: 4, refs["header"]: 2}
+
+    client.delete(f"/bots/{other_id}", params={"user_id": "u1"})
+    assert blob_refs(db) == {refs["full"]: 2, refs["header"]: 1}
+
+    client.put(f"/bots/{bot_id}", json={**BOT, "avatar_base64": avatar("blue")})
+    assert refs["full"] not in blob_refs(db)
+    assert set(blob_refs(db).values()) == {1, 2}
+
+
+def test_edit_sending_back_the_current_avatar_skips_processing(client, db, avatar_pool):
+    bot_id = client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red", 600)}).json()["bot_id"]
+    before = stored_bot(db, bot_id)["avatar"]
+    current = client.get(f"/bots/{bot_id}").json()["avatar_base64"]
+
+    client.put(f"/bots/{bot_id}", json={**BOT, "avatar_base64": current})
+    assert stored_bot(db, bot_id)["avatar"] == before
+    assert blob_refs(db) == {avatar_hash: 1 for avatar_hash in before.values()}
+
+
+def test_failed_insert_releases_the_avatar(client, db, avatar_pool, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise RuntimeError("insert failed")
+    monkeypatch.setattr(type(db.bots), "insert_one", fail)
+
+    res = client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red")})
+    assert res.status_code == 500
+    assert blob_refs(db) == {}
+
+
+def test_per_bot_avatar_url_is_revalidated(client, db, avatar_pool):
+    bot_id = client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red")}).json()["bot_id"]
+    res = client.get(f"/bots/{bot_id}/avatar")
+    assert res.headers["cache-control"] == "no-cache"
+
+    client.put(f"/bots/{bot_id}", json={**BOT, "avatar_base64": avatar("blue")})
+    assert client.get(f"/bots/{bot_id}/avatar", headers={"If-None-Match": res.headers["etag"]}).status_code == 200
+
+
+def test_rejected_avatars_are_not_counted_as_completed(client, avatar_pool):
+    client.post("/bots/createbot", json={**BOT, "avatar_base64": avatar("red")})
+    res = client.post("/bots/createbot", json={**BOT, "avatar_base64": "data:image/png;base64,bm90IGFuIGltYWdl"})
+    assert res.status_code == 400
+    stats = get_avatar_pool().stats()
+    assert (stats["completed"], stats["rejected"]) == (1, 1)
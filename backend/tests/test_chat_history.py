@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timedelta
+
+
+def seed_turns(db, count, user_id="u1", bot_id="b1"):
+    start = datetime(2025, 1, 1, 12, 0, 0)
+    turns = [{
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "message": f"hi {i}",
+        "response": f"hey {i}",
+        "message_id": f"m{i:03d}",
+        "timestamp": start + timedelta(minutes=i),
+        "updated": start + timedelta(minutes=i)
+    } for i in range(count)]
+    asyncio.run(db.chats.insert_many(turns))
+
+
+def messages(res):
+    return [turn["message"] for turn in res.json()["data"]]
+
+
+def test_full_history_is_oldest_first(client, db):
+    seed_turns(db, 3)
+    res = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1"})
+    assert messages(res) == ["hi 0", "hi 1", "hi 2"]
+
+
+def test_before_without_limit_is_oldest_first(client, db):
+    seed_turns(db, 4)
+    latest = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 1}).json()
+    assert [turn["message"] for turn in latest["data"]] == ["hi 3"]
+
+    res = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "before": latest["next_before"]})
+    assert messages(res) == ["hi 0", "hi 1", "hi 2"]
+
+
+def test_scrolling_back_pages(client, db):
+    seed_turns(db, 5)
+    params = {"user_id": "u1", "bot_id": "b1", "limit": 2}
+    pages = []
+    while True:
+        body = client.get("/chat/history", params=params).json()
+        pages.append([turn["message"] for turn in body["data"]])
+        if not body["has_more"]:
+            break
+        params["before"] = body["next_before"]
+    assert pages == [["hi 3", "hi 4"], ["hi 1", "hi 2"], ["hi 0"]]
+
+    res = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 2, "after": body["next_after"]})
+    assert messages(res) == ["hi 1", "hi 2"]
+
+
+def test_paged_ndjson_carries_cursors_in_headers(client, db):
+    seed_turns(db, 3)
+    res = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 2, "format": "ndjson"})
+    assert len(res.text.splitlines()) == 2
+    assert res.headers["x-has-more"] == "true"
+
+    res = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 2, "format": "ndjson",
+                                              "before": res.headers["x-next-before"]})
+    assert '"hi 0"' in res.text
+    assert res.headers["x-has-more"] == "false"
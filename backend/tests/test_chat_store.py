@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timezone
+import utils.chat_store as chat_store
+from utils.chat_store import ChatWriteBehind, append_to_bucket, iter_turns
+from migrate_chats_to_buckets import migrate_conversation
+from test_chat_history import seed_turns
+
+
+def test_turn_flushed_but_still_pending_is_returned_once(db, monkeypatch):
+    async def scenario():
+        writer = ChatWriteBehind(db, flush_interval=60)
+        monkeypatch.setattr(chat_store, "_chat_writer", writer)
+        turn = {"user_id": "u1", "bot_id": "b1", "message": "hi", "response": "hey", "message_id": "m1",
+                "timestamp": datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)}
+        try:
+            assert writer.enqueue(turn)
+            # A flush that has landed in Mongo but not yet cleared the overlay
+            await db.chats.insert_one(dict(turn))
+            return [turn async for turn in iter_turns(db, "u1", "b1")]
+        finally:
+            writer._task.cancel()
+
+    turns = asyncio.run(scenario())
+    assert [turn["message_id"] for turn in turns] == ["m1"]
+    assert turns[0]["timestamp"] == datetime(2025, 1, 1, 12, 0, 0, 123000)
+
+
+def test_appends_after_a_migration_stay_in_order(db, monkeypatch):
+    monkeypatch.setattr(chat_store, "CHAT_BUCKET_SIZE", 3)
+    seed_turns(db, 2)
+
+    async def scenario():
+        # The app already writes buckets while the migration leaves a partial one behind
+        start = datetime(2025, 1, 1, 13, 0, 0)
+        for i in range(3):
+            await append_to_bucket(db, {"user_id": "u1", "bot_id": "b1", "message": f"new {i}",
+                                        "message_id": f"n{i}", "timestamp": start.replace(minute=i)})
+        await migrate_conversation(db, "u1", "b1", 3)
+        await append_to_bucket(db, {"user_id": "u1", "bot_id": "b1", "message": "newest",
+                                    "message_id": "n9", "timestamp": start.replace(minute=9)})
+        return [turn["message"] async for turn in iter_turns(db, "u1", "b1")]
+
+    assert asyncio.run(scenario()) == ["hi 0", "hi 1", "new 0", "new 1", "new 2", "newest"]
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import datetime, timedelta
+from test_chat_history import seed_turns
+
+# list_conversations itself needs a real mongod ($unionWith), so these cover the read markers
+
+
+def read_marker(db, user_id="u1", bot_id="b1"):
+    marker = asyncio.run(db.chat_reads.find_one({"user_id": user_id, "bot_id": bot_id}))
+    return marker and marker["last_read_at"]
+
+
+def test_sending_a_turn_marks_the_conversation_read(client, db):
+    asyncio.run(db.bots.insert_one({"bot_id": "b-read", "user_id": "u2", "name": "Mika"}))
+    res = client.post("/chat/ask", json={"user_id": "u1", "bot_id": "b-read", "message": "",
+                                         "is_system_message": True, "response": "hey!"})
+    assert res.json()["status"] == "success"
+    turn = asyncio.run(db.chats.find_one({"bot_id": "b-read"}))
+    assert read_marker(db, bot_id="b-read") == turn["timestamp"]
+
+
+def test_reading_history_moves_the_marker_forward_only(client, db):
+    seed_turns(db, 4)
+    latest = client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 2}).json()
+    newest = datetime(2025, 1, 1, 12, 0, 0) + timedelta(minutes=3)
+    assert read_marker(db) == newest
+
+    client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1", "limit": 2, "before": latest["next_before"]})
+    assert read_marker(db) == newest
@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timezone
+import utils.chat_store as chat_store
+from utils.chat_store import ChatWriteBehind
+from test_chat_history import messages, seed_turns
+
+
+def test_restart_reports_queued_turns_and_hides_them(client, db):
+    seed_turns(db, 3)
+    seed_turns(db, 2, bot_id="b2")
+
+    body = client.delete("/chat/restart", params={"user_id": "u1", "bot_id": "b1"}).json()
+    assert body["deleted_count"] == 3
+    assert client.get(f"/chat/deletions/{body['deletion_job_id']}").json()["queued"] == 3
+
+    assert messages(client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1"})) == []
+    assert messages(client.get("/chat/history", params={"user_id": "u1", "bot_id": "b2"})) == ["hi 0", "hi 1"]
+
+
+def test_restart_counts_turns_still_in_the_write_behind_queue(client, db, monkeypatch):
+    writer = ChatWriteBehind(db, flush_interval=60)
+    monkeypatch.setattr(chat_store, "_chat_writer", writer)
+    seed_turns(db, 2)
+
+    async def enqueue():
+        for i in range(3):
+            writer.enqueue({"user_id": "u1", "bot_id": "b1", "message": f"new {i}", "message_id": f"n{i}",
+                            "timestamp": datetime.now(timezone.utc)})
+        writer._task.cancel()
+    asyncio.run(enqueue())
+    assert len(messages(client.get("/chat/history", params={"user_id": "u1", "bot_id": "b1"}))) == 5
+
+    body = client.delete("/chat/restart", params={"user_id": "u1", "bot_id": "b1"}).json()
+    assert body["deleted_count"] == 5
@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta
+import utils.memory as memory
+
+
+def test_turns_are_read_only_once_a_batch_has_accumulated(db, monkeypatch):
+    reads, summaries = [], []
+    iter_turns = memory.iter_turns
+
+    def counting_iter_turns(*args, **kwargs):
+        reads.append(args)
+        return iter_turns(*args, **kwargs)
+
+    async def summarize(previous, turns):
+        summaries.append(turns)
+        return f"summary of {len(turns.splitlines())} lines"
+
+    monkeypatch.setattr(memory, "iter_turns", counting_iter_turns)
+    threshold = memory.CONTEXT_WINDOW_TURNS + memory.SUMMARY_BATCH_TURNS
+
+    async def scenario():
+        start = datetime(2025, 1, 1)
+        for i in range(threshold + 1):
+            await db.chats.insert_one({"user_id": "u1", "bot_id": "b1", "message": f"hi {i}", "response": "hey",
+                                       "message_id": f"m{i:03d}", "timestamp": start + timedelta(minutes=i)})
+            state = await memory.count_new_turn(db, "u1", "b1")
+            await memory.update_summary(db, "u1", "b1", summarize, state)
+            if i < threshold:
+                assert reads == []
+        return await db.chat_summaries.find_one({"user_id": "u1", "bot_id": "b1"})
+
+    state = asyncio.run(scenario())
+    assert len(reads) == 1 and len(summaries) == 1
+    assert state["turns_summarized"] == threshold + 1 - memory.CONTEXT_WINDOW_TURNS
+    assert state["unsummarized_turns"] == memory.CONTEXT_WINDOW_TURNS
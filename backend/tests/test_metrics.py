@@ -0,0 +1,32 @@
+from utils.metrics import REGISTRY, StatsCollector
+
+
+def test_stats_collector_renders_counters_and_labelled_gauges():
+    stats = {"primary": {"hedges": 3, "breaker_open": True, "p50_ms": None, "breaker": "open"},
+             "secondary": {"hedges": 0, "breaker_open": False, "p50_ms": 41.5}}
+    collector = StatsCollector("llm_test", lambda: stats, labelname="model",
+                               counters={"hedges": "Hedged attempts"},
+                               gauges={"breaker_open": "Breaker open", "p50_ms": "Median latency"})
+    try:
+        lines = collector.render()
+    finally:
+        REGISTRY.remove(collector)
+
+    assert "# TYPE llm_test_hedges_total counter" in lines
+    assert 'llm_test_hedges_total{model="primary"} 3' in lines
+    assert 'llm_test_breaker_open{model="primary"} 1' in lines
+    assert 'llm_test_p50_ms{model="secondary"} 41.5' in lines
+    # Missing values are skipped and unlisted keys never rendered
+    assert not any(line.startswith('llm_test_p50_ms{model="primary"}') for line in lines)
+    assert not any(line.startswith("llm_test_breaker{") for line in lines)
+
+
+def test_stats_collector_survives_a_failing_component():
+    def broken():
+        raise RuntimeError("not started")
+
+    collector = StatsCollector("broken_test", broken, counters={"hits": "Hits"})
+    try:
+        assert collector.render() == ["# HELP broken_test_hits_total Hits", "# TYPE broken_test_hits_total counter"]
+    finally:
+        REGISTRY.remove(collector)
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from utils.search import BotSearchIndex
+
+
+def bot(bot_id, name, minutes=0, bio="", type_of_bot="pal"):
+    return {"bot_id": bot_id, "name": name, "bio": bio, "type_of_bot": type_of_bot, "privacy": "public",
+            "created_at": datetime(2025, 1, 1) + timedelta(minutes=minutes)}
+
+
+def test_short_prefixes_match_every_term():
+    index = BotSearchIndex()
+    for i in range(250):
+        index.upsert(bot(f"b{i}", f"fra{i:03d}", minutes=i))
+    index.upsert(bot("fox", "Friendly Fox", minutes=-1))
+
+    result = index.search("fr", limit=300)
+    assert result["total"] == 251
+    assert "fox" in [card["bot_id"] for card in result["results"]]
+    assert index.search("fri")["total"] == 1
+    assert index.search("frie fox")["total"] == 1
+
+
+def test_exact_term_outranks_prefix_and_removal_clears_prefixes():
+    index = BotSearchIndex()
+    index.upsert(bot("exact", "Fox", minutes=0))
+    index.upsert(bot("prefix", "Foxglove", minutes=5))
+    assert [card["bot_id"] for card in index.search("fox")["results"]] == ["exact", "prefix"]
+    assert [card["bot_id"] for card in index.search("foxg")["results"]] == ["prefix"]
+
+    index.remove("prefix")
+    index.remove("exact")
+    assert index.search("fo")["total"] == 0
+    assert index._prefixes == {}
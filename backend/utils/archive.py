@@ -0,0 +1,163 @@
+import asyncio, os, uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+import orjson
+import zstandard
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.serialization import dumps
+from dotenv import load_dotenv
+load_dotenv()
+
+# archive_chats.py moves turns older than this many days to archive segments (0: pass
+# --older-than-days instead). Reads always follow the segment manifest, whatever this is set to.
+CHAT_ARCHIVE_AFTER_DAYS = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "0"))
+# "local" (a directory) or "s3" (any S3-compatible endpoint, e.g. MinIO for local runs)
+CHAT_ARCHIVE_STORE = os.getenv("CHAT_ARCHIVE_STORE", "local")
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "chat_archive")
+CHAT_ARCHIVE_S3_BUCKET = os.getenv("CHAT_ARCHIVE_S3_BUCKET", "chat-archive")
+CHAT_ARCHIVE_S3_ENDPOINT = os.getenv("CHAT_ARCHIVE_S3_ENDPOINT")
+CHAT_ARCHIVE_SEGMENT_TURNS = int(os.getenv("CHAT_ARCHIVE_SEGMENT_TURNS", "1000"))
+CHAT_ARCHIVE_ZSTD_LEVEL = int(os.getenv("CHAT_ARCHIVE_ZSTD_LEVEL", "9"))
+
+DATETIME_FIELDS = ("timestamp", "updated")
+
+
+class LocalSegmentStore:
+    """Segments as files under a directory, one subdirectory per user and bot."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or CHAT_ARCHIVE_DIR
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split("/"))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so a crash never leaves a truncated segment behind a manifest entry
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3SegmentStore:
+    """Segments as objects in an S3-compatible bucket (pip install boto3)."""
+
+    def __init__(self, bucket=None, endpoint_url=None):
+        import boto3
+        self.bucket = bucket or CHAT_ARCHIVE_S3_BUCKET
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or CHAT_ARCHIVE_S3_ENDPOINT)
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="application/zstd")
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+SEGMENT_STORES = {
+    "local": LocalSegmentStore,
+    "s3": S3SegmentStore,
+}
+
+_store = None
+
+
+def get_archive_store():
+    global _store
+    if _store is None:
+        _store = SEGMENT_STORES[CHAT_ARCHIVE_STORE]()
+    return _store
+
+
+def segment_key(user_id, bot_id, start_ts):
+    return f"{quote(user_id, safe='')}/{quote(bot_id, safe='')}/{start_ts:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.ndjson.zst"
+
+
+def encode_segment(turns) -> bytes:
+    """Oldest-first turns -> zstd-compressed NDJSON."""
+    body = b"".join(dumps(turn) + b"\n" for turn in turns)
+    return zstandard.ZstdCompressor(level=CHAT_ARCHIVE_ZSTD_LEVEL).compress(body)
+
+
+def decode_segment(data: bytes):
+    """zstd NDJSON -> turns, with timestamps back as naive UTC datetimes like Mongo returns them."""
+    turns = []
+    for line in zstandard.ZstdDecompressor().decompress(data).splitlines():
+        if not line:
+            continue
+        turn = orjson.loads(line)
+        for field in DATETIME_FIELDS:
+            if isinstance(turn.get(field), str):
+                turn[field] = datetime.fromisoformat(turn[field]).astimezone(timezone.utc).replace(tzinfo=None)
+        turns.append(turn)
+    return turns
+
+
+async def read_segment(key):
+    data = await asyncio.to_thread(get_archive_store().get, key)
+    return decode_segment(data)
+
+
+async def write_segment(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, turns) -> dict:
+    """Store one segment and record it in the manifest (db.chat_archive_segments)."""
+    first, last = turns[0], turns[-1]
+    data = encode_segment(turns)
+    key = segment_key(user_id, bot_id, first["timestamp"])
+    await asyncio.to_thread(get_archive_store().put, key, data)
+    segment = {
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "key": key,
+        "start_ts": first["timestamp"],
+        "end_ts": last["timestamp"],
+        "end_message_id": last.get("message_id") or "",
+        "count": len(turns),
+        "bytes": len(data),
+        "created_at": datetime.now(timezone.utc)
+    }
+    await db.chat_archive_segments.insert_one(segment)
+    return segment
+
+
+def find_segments(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, direction: int = 1, after=None, before=None):
+    """Manifest entries whose time range can hold turns between the ``after``/``before`` keys."""
+    query = {"user_id": user_id, "bot_id": bot_id}
+    if after is not None:
+        query["end_ts"] = {"$gte": after[0]}
+    if before is not None:
+        query["start_ts"] = {"$lte": before[0]}
+    return db.chat_archive_segments.find(query, {"key": 1, "start_ts": 1, "end_ts": 1}).sort("start_ts", direction)
+
+
+async def last_archived_key(db: AsyncIOMotorDatabase, user_id: str, bot_id: str):
+    """(timestamp, message_id) of the newest archived turn, so an interrupted run resumes after it."""
+    segment = await db.chat_archive_segments.find_one(
+        {"user_id": user_id, "bot_id": bot_id}, {"end_ts": 1, "end_message_id": 1}, sort=[("end_ts", -1)]
+    )
+    return (segment["end_ts"], segment["end_message_id"]) if segment else None
+
+
+async def delete_segments_batch(db: AsyncIOMotorDatabase, query: dict, cutoff, limit: int) -> int:
+    """Delete up to ``limit`` segments matching ``query`` that end by ``cutoff``; returns turns removed."""
+    segments = [segment async for segment in
+                db.chat_archive_segments.find({**query, "end_ts": {"$lte": cutoff}}, {"key": 1, "count": 1}).limit(limit)]
+    for segment in segments:
+        await asyncio.to_thread(get_archive_store().delete, segment["key"])
+    if segments:
+        await db.chat_archive_segments.delete_many({"_id": {"$in": [segment["_id"] for segment in segments]}})
+    return sum(segment.get("count", 0) for segment in segments)
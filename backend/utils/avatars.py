@@ -0,0 +1,238 @@
+import asyncio, base64, binascii, hashlib, io, os, time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from bson import Binary
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from PIL import Image, ImageOps
+from utils.metrics import record_span
+from dotenv import load_dotenv
+load_dotenv()
+
+DEFAULT_CONTENT_TYPE = "image/png"
+
+# Uploads above either limit are rejected before (bytes) or while (pixels) decoding
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", str(4096 * 4096)))
+# Base64 is 4/3 the size of the bytes, plus room for a data URL header
+AVATAR_MAX_BASE64 = AVATAR_MAX_BYTES * 4 // 3 + 256
+# "webp" (keeps transparency) or "jpeg"
+AVATAR_FORMAT = os.getenv("AVATAR_FORMAT", "webp")
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY", "82"))
+AVATAR_POOL_SIZE = int(os.getenv("AVATAR_POOL_SIZE", str(min(2, os.cpu_count() or 1))))
+AVATAR_MAX_CONCURRENCY = int(os.getenv("AVATAR_MAX_CONCURRENCY", str(AVATAR_POOL_SIZE * 2)))
+
+# Stored renditions: "full" keeps the aspect ratio within the bound, the rest are square crops
+# (cards render at 64px and chat headers at 40px, doubled for high-DPI screens)
+AVATAR_VARIANTS = {
+    "full": 512,
+    "card": 128,
+    "header": 80
+}
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def decode_avatar(avatar_base64: str):
+    """Split a data URL (or bare base64 string) into (bytes, content_type)."""
+    content_type = DEFAULT_CONTENT_TYPE
+    encoded = avatar_base64
+    if avatar_base64.startswith("data:"):
+        header, _, encoded = avatar_base64.partition(",")
+        content_type = header[len("data:"):].split(";")[0] or DEFAULT_CONTENT_TYPE
+    try:
+        return base64.b64decode(encoded, validate=True), content_type
+    except (ValueError, binascii.Error):
+        raise ValueError("avatar_base64 is not valid base64 image data")
+
+
+def encode_avatar(data: bytes, content_type: str) -> str:
+    """Rebuild the data URL the frontend used to receive inline."""
+    return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+
+
+def process_avatar(avatar, image_format: str = AVATAR_FORMAT):
+    """Decode, validate and re-encode an avatar into every AVATAR_VARIANTS rendition.
+
+    Runs in a worker process. ``avatar`` is a data URL / base64 string or raw bytes; returns
+    {variant: (sha256, bytes)}. Raises ValueError for anything that is not a usable image.
+    """
+    data = decode_avatar(avatar)[0] if isinstance(avatar, str) else avatar
+    if len(data) > AVATAR_MAX_BYTES:
+        raise ValueError(f"Avatar is larger than {AVATAR_MAX_BYTES // (1024 * 1024)} MB")
+    Image.MAX_IMAGE_PIXELS = AVATAR_MAX_PIXELS
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()
+        # verify() leaves the image unusable, so decode again for real
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > AVATAR_MAX_PIXELS:
+            raise ValueError(f"Avatar is larger than {AVATAR_MAX_PIXELS} pixels")
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"avatar_base64 is not a supported image: {e}")
+
+    keep_alpha = image_format == "webp" and (image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info)
+    image = image.convert("RGBA" if keep_alpha else "RGB")
+    renditions = {}
+    for variant, size in AVATAR_VARIANTS.items():
+        if variant == "full":
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+        else:
+            resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, format=image_format.upper(), quality=AVATAR_QUALITY)
+        encoded = out.getvalue()
+        renditions[variant] = (hashlib.sha256(encoded).hexdigest(), encoded)
+    return renditions
+
+
+class AvatarPool:
+    """Runs avatar decoding and resizing in worker processes, with a cap on concurrent jobs."""
+
+    def __init__(self, pool_size: int = AVATAR_POOL_SIZE, max_concurrency: int = AVATAR_MAX_CONCURRENCY):
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._executor = ProcessPoolExecutor(max_workers=pool_size)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_run_seconds = 0.0
+
+    async def process(self, avatar):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        try:
+            renditions = await asyncio.get_running_loop().run_in_executor(self._executor, process_avatar, avatar)
+        except ValueError:
+            self.rejected += 1
+            raise
+        finally:
+            run_seconds = time.perf_counter() - started_at
+            self._semaphore.release()
+            record_span("avatar_process", run_seconds)
+        # Only successful jobs, so avg_process_ms isn't skewed by uploads rejected early
+        self.completed += 1
+        self.total_run_seconds += run_seconds
+        return renditions
+
+    def stats(self):
+        return {
+            "pool_size": self.pool_size,
+            "max_concurrency": self.max_concurrency,
+            "format": AVATAR_FORMAT,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_process_ms": 1000 * self.total_run_seconds / self.completed if self.completed else 0.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+
+
+def get_avatar_pool() -> AvatarPool:
+    global _pool
+    if _pool is None:
+        _pool = AvatarPool()
+    return _pool
+
+
+def close_avatar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def avatar_blob_url(avatar_hash: str) -> str:
+    return f"/bots/avatars/{avatar_hash}"
+
+
+def avatar_url(bot: dict, variant: str = "full"):
+    """Content-addressed avatar URL for a bot document, or None if it has no processed avatar."""
+    if not bot.get("avatar"):
+        return None
+    return avatar_blob_url(bot["avatar"].get(variant) or bot["avatar"]["full"])
+
+
+def is_current_avatar(bot: dict, avatar_base64: str) -> bool:
+    """Whether an upload is the bot's stored full rendition sent back unchanged (the edit page
+    reloads it as avatar_base64), so it needs no processing."""
+    if not bot.get("avatar"):
+        return False
+    return hashlib.sha256(decode_avatar(avatar_base64)[0]).hexdigest() == bot["avatar"]["full"]
+
+
+async def store_avatar(db: AsyncIOMotorDatabase, avatar) -> dict:
+    """Process an avatar off the event loop and store each rendition once in db.avatar_blobs.
+
+    Returns the {variant: sha256} references kept on the bot document. Blobs are shared by every
+    bot that uploaded the same image and counted, so release_avatar can drop unused ones.
+    """
+    renditions = await get_avatar_pool().process(avatar)
+    now = datetime.now(timezone.utc)
+    # Small images can give identical renditions; each reference is counted
+    refs = Counter(avatar_hash for avatar_hash, _ in renditions.values())
+    blobs = dict(renditions.values())
+    for avatar_hash, count in refs.items():
+        data = blobs[avatar_hash]
+        await db.avatar_blobs.update_one(
+            {"_id": avatar_hash},
+            {
+                "$setOnInsert": {
+                    "data": Binary(data),
+                    "content_type": CONTENT_TYPES[AVATAR_FORMAT],
+                    "size": len(data),
+                    "created_at": now
+                },
+                "$inc": {"refs": count}
+            },
+            upsert=True
+        )
+    return {variant: avatar_hash for variant, (avatar_hash, _) in renditions.items()}
+
+
+async def release_avatar(db: AsyncIOMotorDatabase, refs: dict):
+    """Drop a bot's references to its avatar blobs, deleting blobs nothing points at any more."""
+    if not refs:
+        return
+    # Mirrors store_avatar: one reference per rendition, even when renditions share a blob
+    counts = Counter(refs.values())
+    for avatar_hash, count in counts.items():
+        await db.avatar_blobs.update_one({"_id": avatar_hash}, {"$inc": {"refs": -count}})
+    hashes = list(counts)
+    # A concurrent upload of the same image re-inserts the blob through its upsert
+    await db.avatar_blobs.delete_many({"_id": {"$in": hashes}, "refs": {"$lte": 0}})
+
+
+async def load_avatar_blob(db: AsyncIOMotorDatabase, avatar_hash: str):
+    return await db.avatar_blobs.find_one({"_id": avatar_hash}, {"data": 1, "content_type": 1})
+
+
+async def load_avatar(db: AsyncIOMotorDatabase, bot_id: str, bot: dict = None):
+    """Return {"data", "content_type", "etag"} for a bot's full-size avatar.
+
+    Falls back to the inline base64 of bots that migrate_avatars.py has not re-encoded yet.
+    """
+    if bot is None:
+        bot = await db.bots.find_one({"bot_id": bot_id}, {"avatar": 1})
+    if bot and bot.get("avatar"):
+        blob = await load_avatar_blob(db, bot["avatar"]["full"])
+        if blob:
+            return {"data": blob["data"], "content_type": blob["content_type"], "etag": blob["_id"][:32]}
+
+    bot = await db.bots.find_one({"bot_id": bot_id}, {"avatar_base64": 1})
+    if not bot or not bot.get("avatar_base64"):
+        return None
+    data, content_type = decode_avatar(bot["avatar_base64"])
+    return {"data": data, "content_type": content_type, "etag": hashlib.sha256(data).hexdigest()[:32]}
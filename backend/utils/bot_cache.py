@@ -0,0 +1,127 @@
+import asyncio, os
+from cachetools import TTLCache
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from dotenv import load_dotenv
+load_dotenv()
+
+BOT_CACHE_MAX_SIZE = int(os.getenv("BOT_CACHE_MAX_SIZE", "1024"))
+BOT_CACHE_TTL = float(os.getenv("BOT_CACHE_TTL", "300"))
+# "none" (single worker) or "change_stream" (several workers; replica set required)
+BOT_CACHE_INVALIDATION = os.getenv("BOT_CACHE_INVALIDATION", "none")
+
+# Inline legacy avatars can be hundreds of KB; never keep them in the cache
+BOT_CACHE_PROJECTION = {"avatar_base64": 0}
+
+
+class BotCache:
+    """Bounded LRU cache with TTL for bot documents and their rendered persona prompts."""
+
+    def __init__(self, maxsize: int = BOT_CACHE_MAX_SIZE, ttl: float = BOT_CACHE_TTL):
+        self._bots = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._personas = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Mongo _id -> bot_id, so change events (which only carry _id) can be resolved. Touched
+        # on every hit as well as every miss so it evicts in the same order as _bots.
+        self._ids = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get_bot(self, db: AsyncIOMotorDatabase, bot_id: str):
+        """Return a copy of the bot document, reading through to Mongo on a miss."""
+        bot = self._bots.get(bot_id)
+        if bot is not None:
+            self.hits += 1
+            if self._ids.get(bot["_id"]) is None:
+                self._ids[bot["_id"]] = bot_id
+            return dict(bot)
+
+        self.misses += 1
+        bot = await db.bots.find_one({"bot_id": bot_id}, BOT_CACHE_PROJECTION)
+        if bot is None:
+            return None
+        self._bots[bot_id] = bot
+        self._ids[bot["_id"]] = bot_id
+        return dict(bot)
+
+    def get_persona(self, bot: dict, render):
+        """Return the rendered persona prompt for a bot, rendering it once per cache lifetime."""
+        persona = self._personas.get(bot["bot_id"])
+        if persona is None:
+            persona = render(bot)
+            self._personas[bot["bot_id"]] = persona
+        return persona
+
+    def invalidate(self, bot_id: str):
+        self._bots.pop(bot_id, None)
+        self._personas.pop(bot_id, None)
+        self.invalidations += 1
+
+    def invalidate_object_id(self, object_id):
+        bot_id = self._ids.pop(object_id, None)
+        if bot_id is not None:
+            self.invalidate(bot_id)
+
+    def clear(self):
+        self._bots.clear()
+        self._personas.clear()
+        self._ids.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._bots),
+            "max_size": self._bots.maxsize,
+            "ttl": self._bots.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+class ChangeStreamInvalidationChannel:
+    """Invalidate on every update/replace/delete of db.bots, whichever worker made it."""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def publish(self, bot_id: str):
+        # The write itself is the event; every worker sees it through its change stream
+        pass
+
+    async def listen(self, cache: BotCache):
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        while True:
+            try:
+                async with self.db.bots.watch(pipeline) as stream:
+                    async for change in stream:
+                        cache.invalidate_object_id(change["documentKey"]["_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events may have been missed while disconnected, so start from a clean cache
+                print(f"❌ Bot cache change stream failed, retrying: {e}")
+                cache.clear()
+                await asyncio.sleep(5)
+
+
+bot_cache = BotCache()
+_channel = None
+
+
+def init_invalidation_channel(db: AsyncIOMotorDatabase, mode: str = BOT_CACHE_INVALIDATION):
+    """Pick the invalidation channel; returns the listener coroutine to run as a background task, if any."""
+    global _channel
+    if mode == "change_stream":
+        _channel = ChangeStreamInvalidationChannel(db)
+    else:
+        _channel = None
+        return None
+    return _channel.listen(bot_cache)
+
+
+async def invalidate_bot(bot_id: str):
+    """Drop a bot from this worker's cache and tell the other workers to do the same."""
+    bot_cache.invalidate(bot_id)
+    if _channel is not None:
+        await _channel.publish(bot_id)
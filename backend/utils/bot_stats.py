@@ -0,0 +1,248 @@
+import asyncio, os, time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from cachetools import LRUCache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.bots import BOT_CARD_PROJECTION
+from dotenv import load_dotenv
+load_dotenv()
+
+# Counters are summed in-process and written once per interval, one $inc per bot and hour
+BOT_STATS_FLUSH_INTERVAL = float(os.getenv("BOT_STATS_FLUSH_INTERVAL", "5"))
+# (bot_id, user_id) pairs known to be counted already, so regulars don't cost a write per flush
+BOT_STATS_SEEN_USERS = int(os.getenv("BOT_STATS_SEEN_USERS", "100000"))
+# Hourly activity buckets expire (TTL index) after this long
+BOT_STATS_ACTIVITY_DAYS = int(os.getenv("BOT_STATS_ACTIVITY_DAYS", "14"))
+# Trending: activity decays by half every TRENDING_HALF_LIFE_HOURS; only the last
+# TRENDING_WINDOW_DAYS count, and the top TRENDING_SIZE public bots are kept
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_WINDOW_DAYS = float(os.getenv("TRENDING_WINDOW_DAYS", "7"))
+TRENDING_SIZE = int(os.getenv("TRENDING_SIZE", "100"))
+TRENDING_REFRESH = float(os.getenv("TRENDING_REFRESH", "60"))
+
+
+def activity_hour(at=None):
+    """Naive UTC start of the hour bucket a message falls into."""
+    at = (at or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return at.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+class BotStatsRecorder:
+    """Per-bot usage counters in db.bot_stats, db.bot_stats_users and db.bot_activity.
+
+    record() only touches in-process counters; a background task flushes them every
+    ``flush_interval`` seconds. Counts from a failed flush are kept for the next one, and
+    counts still buffered when a worker is killed are lost (they are popularity signals,
+    not billing data).
+    """
+
+    def __init__(self, db, flush_interval=BOT_STATS_FLUSH_INTERVAL, seen_users=BOT_STATS_SEEN_USERS):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._messages = Counter()    # bot_id -> messages
+        self._activity = Counter()    # (bot_id, hour) -> messages
+        self._users = set()           # (bot_id, user_id) not yet known to be counted
+        self._new_users = Counter()   # bot_id -> users first seen, awaiting their $inc
+        self._seen = LRUCache(maxsize=seen_users)
+        self._task = None
+        self.recorded = 0
+        self.flushes = 0
+        self.writes = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, bot_id: str, user_id: str, at: datetime = None):
+        self.recorded += 1
+        self._messages[bot_id] += 1
+        self._activity[(bot_id, activity_hour(at))] += 1
+        if (bot_id, user_id) not in self._seen:
+            self._users.add((bot_id, user_id))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"❌ Bot stats flush failed, will retry: {e}")
+
+    async def _count_new_users(self):
+        users, self._users = self._users, set()
+        if not users:
+            return
+        now = datetime.now(timezone.utc)
+        docs = [{"bot_id": bot_id, "user_id": user_id, "first_seen": now} for bot_id, user_id in users]
+        duplicates = set()
+        try:
+            try:
+                await self.db.bot_stats_users.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                duplicates = {error["index"] for error in errors}
+        except Exception:
+            # Retry these users on the next flush; any that did get inserted come back as duplicates
+            self._users |= users
+            raise
+        self.writes += 1
+        for index, doc in enumerate(docs):
+            if index not in duplicates:
+                self._new_users[doc["bot_id"]] += 1
+            self._seen[(doc["bot_id"], doc["user_id"])] = True
+
+    async def flush(self):
+        await self._count_new_users()
+        messages, self._messages = self._messages, Counter()
+        activity, self._activity = self._activity, Counter()
+        new_users, self._new_users = self._new_users, Counter()
+        if not messages and not new_users:
+            return
+
+        now = datetime.now(timezone.utc)
+        stats_ops = [
+            UpdateOne({"_id": bot_id}, {
+                "$inc": {"messages": messages[bot_id], "unique_users": new_users[bot_id]},
+                "$set": {"last_message_at": now}
+            }, upsert=True)
+            for bot_id in messages.keys() | new_users.keys()
+        ]
+        activity_ops = [
+            UpdateOne({"bot_id": bot_id, "hour": hour}, {"$inc": {"messages": count}}, upsert=True)
+            for (bot_id, hour), count in activity.items()
+        ]
+        try:
+            await self.db.bot_stats.bulk_write(stats_ops, ordered=False)
+            if activity_ops:
+                await self.db.bot_activity.bulk_write(activity_ops, ordered=False)
+        except Exception:
+            # Keep the counts for the next flush. A partially applied bulk write double counts
+            # a little on retry, which is fine for popularity signals.
+            self._messages.update(messages)
+            self._activity.update(activity)
+            self._new_users.update(new_users)
+            raise
+        self.flushes += 1
+        self.writes += 2
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"❌ Final bot stats flush failed: {e}")
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "buffered_bots": len(self._messages),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "failed_flushes": self.failed_flushes,
+            "flush_interval": self.flush_interval
+        }
+
+
+class TrendingBots:
+    """Top public bots by decayed recent activity, recomputed every TRENDING_REFRESH seconds.
+
+    The refresh aggregates db.bot_activity (one document per bot and hour), never db.chats;
+    reads just slice the cached list.
+    """
+
+    def __init__(self, size=TRENDING_SIZE, half_life_hours=TRENDING_HALF_LIFE_HOURS, window_days=TRENDING_WINDOW_DAYS):
+        self.size = size
+        self.half_life_hours = half_life_hours
+        self.window_days = window_days
+        self.bots = []
+        self.refreshed_at = None
+        self.refresh_seconds = 0.0
+
+    def top(self, skip=0, limit=20):
+        return self.bots[skip:skip + limit]
+
+    def discard(self, bot_id):
+        self.bots = [bot for bot in self.bots if bot["bot_id"] != bot_id]
+
+    async def refresh(self, db: AsyncIOMotorDatabase):
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        age_half_lives = {"$divide": [{"$subtract": [now, "$hour"]}, self.half_life_hours * 3600 * 1000]}
+        pipeline = [
+            {"$match": {"hour": {"$gte": now - timedelta(days=self.window_days)}}},
+            {"$group": {"_id": "$bot_id",
+                        "score": {"$sum": {"$multiply": ["$messages", {"$pow": [0.5, age_half_lives]}]}}}},
+            {"$sort": {"score": -1}},
+            # Headroom for private and deleted bots dropped by the lookup
+            {"$limit": self.size * 2},
+            {"$lookup": {"from": "bots", "localField": "_id", "foreignField": "bot_id", "as": "bot",
+                         "pipeline": [{"$match": {"privacy": "public"}}, {"$project": BOT_CARD_PROJECTION}]}},
+            {"$unwind": "$bot"},
+            {"$limit": self.size},
+            {"$lookup": {"from": "bot_stats", "localField": "_id", "foreignField": "_id", "as": "totals"}}
+        ]
+        bots = []
+        async for row in db.bot_activity.aggregate(pipeline):
+            totals = row["totals"][0] if row["totals"] else {}
+            bots.append({
+                **row["bot"],
+                "trending_score": row["score"],
+                "messages": totals.get("messages", 0),
+                "unique_users": totals.get("unique_users", 0)
+            })
+        self.bots = bots
+        self.refreshed_at = time.time()
+        self.refresh_seconds = time.perf_counter() - started
+
+    async def run_refresher(self, db: AsyncIOMotorDatabase, interval: float = TRENDING_REFRESH):
+        while True:
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                print(f"❌ Trending bots refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            "bots": len(self.bots),
+            "refreshed_at": self.refreshed_at,
+            "refresh_ms": 1000 * self.refresh_seconds,
+            "half_life_hours": self.half_life_hours,
+            "window_days": self.window_days
+        }
+
+
+trending_bots = TrendingBots()
+
+_recorder = None
+
+
+def get_bot_stats(db: AsyncIOMotorDatabase = None) -> BotStatsRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = BotStatsRecorder(db)
+    return _recorder
+
+
+def record_message(db: AsyncIOMotorDatabase, bot_id: str, user_id: str):
+    get_bot_stats(db).record(bot_id, user_id)
+
+
+async def close_bot_stats():
+    global _recorder
+    if _recorder is not None:
+        await _recorder.stop()
+        _recorder = None
@@ -0,0 +1,15 @@
+# Card-sized bot fields, shared by dashboard listings, search results, trending and the
+# conversation list; backstory, personality and avatar bytes stay out
+BOT_CARD_PROJECTION = {
+    "_id": 1,
+    "bot_id": 1,
+    "user_id": 1,
+    "name": 1,
+    "bio": 1,
+    "first_message": 1,
+    "type_of_bot": 1,
+    "privacy": 1,
+    "avatar": 1,
+    "created_at": 1,
+    "updated_at": 1
+}
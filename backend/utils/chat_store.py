@@ -0,0 +1,635 @@
+import asyncio, os, random
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from utils.archive import delete_segments_batch, find_segments, read_segment
+from utils.bots import BOT_CARD_PROJECTION
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from dotenv import load_dotenv
+load_dotenv()
+
+# Layout for new writes: "turns" (one db.chats document per turn) or "buckets" (db.chat_buckets)
+CHAT_STORAGE = os.getenv("CHAT_STORAGE", "turns")
+CHAT_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+
+# Write-behind: /chat/ask returns before the turn is stored; a background task batches inserts
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "0") == "1"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.05"))
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000"))
+CHAT_WRITE_MAX_RETRIES = int(os.getenv("CHAT_WRITE_MAX_RETRIES", "5"))
+
+# /chat/conversations counts unread turns up to this many per conversation
+UNREAD_CAP = int(os.getenv("UNREAD_CAP", "100"))
+
+# Fields every turn carries in both layouts
+TURN_FIELDS = ("message", "response", "is_system_message", "message_id", "timestamp", "updated")
+
+
+def turn_key(turn):
+    """Sort/cursor key shared by both layouts."""
+    return (turn.get("timestamp"), turn.get("message_id") or "")
+
+
+def as_naive_utc(timestamp):
+    """Mongo hands back naive UTC datetimes; normalise cursor values so they compare in Python."""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def as_stored(timestamp):
+    """The value Mongo hands back for a stored datetime: naive UTC, truncated to milliseconds."""
+    timestamp = as_naive_utc(timestamp)
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def keyset_filter(key, op):
+    """Match turns strictly before ($lt) or after ($gt) a (timestamp, message_id) key."""
+    timestamp, message_id = key
+    return [
+        {"timestamp": {op: timestamp}},
+        {"timestamp": timestamp, "message_id": {op: message_id}}
+    ]
+
+
+def _in_range(turn, after, before):
+    key = turn_key(turn)
+    if after is not None and not key > after:
+        return False
+    if before is not None and not key < before:
+        return False
+    return True
+
+
+async def insert_turn(db: AsyncIOMotorDatabase, turn: dict):
+    """Store one turn in the configured layout (queued for a batched insert in write-behind mode)."""
+    if CHAT_WRITE_BEHIND and get_chat_writer(db).enqueue(turn):
+        return
+    await _store_turn(db, turn)
+
+
+async def _store_turn(db, turn):
+    if CHAT_STORAGE == "buckets":
+        await append_to_bucket(db, turn)
+    else:
+        await db.chats.insert_one(turn)
+
+
+async def append_to_bucket(db: AsyncIOMotorDatabase, turn: dict):
+    """Append a turn to the conversation's newest bucket, starting a new one when it can't take it.
+
+    Only the bucket with the highest end_ts takes appends, and only while it has room, is not
+    closed (migrated buckets are) and ends no later than the turn, so buckets never overlap.
+    """
+    message = {field: turn[field] for field in TURN_FIELDS if field in turn}
+    message["_id"] = turn.get("_id") or ObjectId()
+    conversation = {"user_id": turn["user_id"], "bot_id": turn["bot_id"]}
+    newest = await db.chat_buckets.find_one(conversation, {"_id": 1}, sort=[("end_ts", -1)])
+    if newest:
+        bucket = await db.chat_buckets.find_one_and_update(
+            {
+                "_id": newest["_id"],
+                "count": {"$lt": CHAT_BUCKET_SIZE},
+                "closed": {"$ne": True},
+                "end_ts": {"$lte": as_naive_utc(message["timestamp"])}
+            },
+            {"$push": {"messages": message}, "$inc": {"count": 1}, "$max": {"end_ts": message["timestamp"]}},
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket:
+            return bucket
+    bucket = {**conversation, "messages": [message], "count": 1,
+              "start_ts": message["timestamp"], "end_ts": message["timestamp"]}
+    await db.chat_buckets.insert_one(bucket)
+    return {"_id": bucket["_id"]}
+
+
+async def _legacy_turns(db, user_id, bot_id, direction, after, before, projection):
+    query = {"user_id": user_id, "bot_id": bot_id}
+    clauses = []
+    if after is not None:
+        clauses.append({"$or": keyset_filter(after, "$gt")})
+    if before is not None:
+        clauses.append({"$or": keyset_filter(before, "$lt")})
+    if clauses:
+        query["$and"] = clauses
+    cursor = db.chats.find(query, projection).sort([("timestamp", direction), ("message_id", direction)])
+    async for turn in cursor:
+        yield turn
+
+
+async def _bucket_turns(db, user_id, bot_id, direction, after, before, fields):
+    query = {"user_id": user_id, "bot_id": bot_id}
+    # Skip whole buckets that end before / start after the requested range
+    if after is not None:
+        query["end_ts"] = {"$gte": after[0]}
+    if before is not None:
+        query["start_ts"] = {"$lte": before[0]}
+    cursor = db.chat_buckets.find(query, {"messages": 1}).sort("start_ts", direction)
+    async for bucket in cursor:
+        messages = sorted(bucket.get("messages", []), key=turn_key, reverse=direction < 0)
+        for message in messages:
+            if not _in_range(message, after, before):
+                continue
+            turn = {field: message[field] for field in fields if field in message} if fields else message
+            turn["_id"] = message["_id"]
+            turn["user_id"] = user_id
+            turn["bot_id"] = bot_id
+            yield turn
+
+
+async def iter_turns(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, direction: int = 1,
+                     after=None, before=None, fields=None):
+    """Yield a conversation's turns in (timestamp, message_id) order from every tier: both Mongo
+    layouts, the write-behind queue and, past the hot window, archive segments.
+
+    ``after``/``before`` are exclusive (timestamp, message_id) keys; ``fields`` limits what is
+    returned (``_id``, ``user_id``, ``bot_id``, ``timestamp`` and ``message_id`` are always kept).
+    """
+    if after is not None:
+        after = (as_naive_utc(after[0]), after[1])
+    if before is not None:
+        before = (as_naive_utc(before[0]), before[1])
+    # Restarted conversations and deleted bots: hide everything up to the tombstone while the
+    # background deletion job catches up
+    cutoff = await tombstone_cutoff(db, user_id, bot_id)
+    if cutoff is not None and (after is None or after < cutoff):
+        after = cutoff
+    if fields:
+        fields = set(fields) | {"timestamp", "message_id"}
+
+    # Whether a conversation has archived turns is up to the manifest, not to configuration, so
+    # turns moved by archive_chats.py stay readable whatever this process was started with.
+    # Archived turns are all older than hot ones: scrolling back reads the hot tiers first and
+    # only opens the manifest once they run out. The second tier starts strictly past the last
+    # turn yielded, which also skips turns present in both tiers while an archive run is moving them.
+    last_key = None
+    if direction < 0:
+        tiers = [iter_hot_turns(db, user_id, bot_id, direction, after, before, fields)]
+    else:
+        tiers = [_archived_turns(db, user_id, bot_id, direction, after, before, fields)]
+    try:
+        async for turn in tiers[0]:
+            last_key = turn_key(turn)
+            yield turn
+        if direction < 0:
+            tiers.append(_archived_turns(db, user_id, bot_id, direction, after, last_key or before, fields))
+        else:
+            tiers.append(iter_hot_turns(db, user_id, bot_id, direction, last_key or after, before, fields))
+        async for turn in tiers[1]:
+            yield turn
+    finally:
+        for tier in tiers:
+            await tier.aclose()
+
+
+async def _archived_turns(db, user_id, bot_id, direction, after, before, fields):
+    async for segment in find_segments(db, user_id, bot_id, direction, after, before):
+        # Segments are small (CHAT_ARCHIVE_SEGMENT_TURNS) and read whole, one at a time
+        turns = await read_segment(segment["key"])
+        if direction < 0:
+            turns.reverse()
+        for turn in turns:
+            if not _in_range(turn, after, before):
+                continue
+            yield {field: turn[field] for field in set(fields) | {"_id", "user_id", "bot_id"} if field in turn} \
+                if fields else turn
+
+
+async def iter_hot_turns(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, direction: int = 1,
+                         after=None, before=None, fields=None):
+    """Merge the Mongo layouts and the write-behind queue (no tombstones, no archive).
+
+    Keys must already be naive UTC; used by iter_turns and by the archiver.
+    """
+    projection = None
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection.update(user_id=1, bot_id=1)
+
+    sources = [
+        _legacy_turns(db, user_id, bot_id, direction, after, before, projection).__aiter__(),
+        _bucket_turns(db, user_id, bot_id, direction, after, before, fields).__aiter__()
+    ]
+    if _chat_writer is not None:
+        # Read-your-writes: turns still waiting in the write-behind queue
+        sources.append(_chat_writer.pending_turns(user_id, bot_id, direction, after, before, fields))
+    try:
+        heads = [await anext(source, None) for source in sources]
+        last_key = None
+        while any(head is not None for head in heads):
+            pick = None
+            for i, head in enumerate(heads):
+                if head is None:
+                    continue
+                if pick is None or (turn_key(head) < turn_key(heads[pick]) if direction > 0
+                                    else turn_key(head) > turn_key(heads[pick])):
+                    pick = i
+            turn = heads[pick]
+            heads[pick] = await anext(sources[pick], None)
+            # A turn can briefly exist in two places while a migration batch or a write-behind
+            # flush is in progress
+            if turn_key(turn) == last_key:
+                continue
+            last_key = turn_key(turn)
+            yield turn
+    finally:
+        for source in sources:
+            await source.aclose()
+
+
+async def take(turns, count):
+    """Collect up to ``count`` items from an async iterator and close it."""
+    items = []
+    if count <= 0:
+        return items
+    try:
+        async for turn in turns:
+            items.append(turn)
+            if len(items) >= count:
+                break
+    finally:
+        await turns.aclose()
+    return items
+
+
+async def tombstone_cutoff(db: AsyncIOMotorDatabase, user_id: str, bot_id: str):
+    """Exclusive (timestamp, message_id) key below which a conversation's turns are deleted, if any.
+
+    Tombstones with ``user_id: None`` cover every conversation with a deleted bot.
+    """
+    cutoff = None
+    async for tombstone in db.chat_tombstones.find({"bot_id": bot_id, "user_id": {"$in": [user_id, None]}},
+                                                   {"cutoff": 1}):
+        if cutoff is None or tombstone["cutoff"] > cutoff:
+            cutoff = tombstone["cutoff"]
+    # Sorts after every message_id at the cutoff timestamp
+    return (as_naive_utc(cutoff), "\U0010ffff") if cutoff is not None else None
+
+
+def _conversation_rows(user_id, sort, activity_field, last_turn, count):
+    """One row per bot (last_activity, last turn, turns) from one collection, newest first per bot."""
+    return [
+        {"$match": {"user_id": user_id}},
+        # ``sort`` follows the collection's (user_id, bot_id, time) index, so no blocking sort
+        {"$sort": sort},
+        {"$group": {
+            "_id": "$bot_id",
+            "last_activity": {"$first": f"${activity_field}"},
+            "last": {"$first": last_turn},
+            "turns": {"$sum": count}
+        }}
+    ]
+
+
+async def list_conversations(db: AsyncIOMotorDatabase, user_id: str, before=None, limit: int = 20):
+    """A user's conversations, most recently active first, in one aggregation.
+
+    Each row has the bot's card fields, the last turn, the turn count and how many turns
+    arrived after the user's read marker (db.chat_reads), counted up to UNREAD_CAP; neither
+    count includes turns under a tombstone that are still waiting to be purged. Rows
+    come from both layouts and the archive; turns still in a write-behind queue are not
+    included. ``before`` is an exclusive (last_activity, bot_id) keyset cursor. Needs a real
+    mongod: mongomock has no $unionWith or pipeline $lookup.
+    """
+    last_turn = {field: f"${field}" for field in TURN_FIELDS}
+    pipeline = [
+        *_conversation_rows(user_id, {"bot_id": -1, "timestamp": -1, "message_id": -1}, "timestamp", last_turn, 1),
+        {"$unionWith": {"coll": "chat_buckets", "pipeline": _conversation_rows(
+            user_id, {"bot_id": 1, "end_ts": -1}, "end_ts", {"$arrayElemAt": ["$messages", -1]}, "$count")}},
+        # Fully archived conversations have no last turn to show, only their activity and size
+        {"$unionWith": {"coll": "chat_archive_segments", "pipeline": _conversation_rows(
+            user_id, {"bot_id": 1, "end_ts": -1}, "end_ts", None, "$count")}},
+        # Merge the layouts: the newest row supplies the last turn
+        {"$sort": {"last_activity": 1}},
+        {"$group": {
+            "_id": "$_id",
+            "last_activity": {"$last": "$last_activity"},
+            "last": {"$last": "$last"},
+            "turns": {"$sum": "$turns"}
+        }},
+        # Restarted conversations and deleted bots whose purge is still running
+        {"$lookup": {
+            "from": "chat_tombstones", "let": {"bot_id": "$_id"}, "as": "tombstones",
+            "pipeline": [{"$match": {"user_id": {"$in": [user_id, None]}, "$expr": {"$eq": ["$bot_id", "$$bot_id"]}}},
+                         {"$project": {"cutoff": 1}}]
+        }},
+        {"$set": {"cutoff": {"$max": "$tombstones.cutoff"}}},
+        {"$match": {"$expr": {"$gt": ["$last_activity", "$cutoff"]}}},
+    ]
+    if before is not None:
+        last_activity, bot_id = as_naive_utc(before[0]), before[1]
+        pipeline.append({"$match": {"$or": [{"last_activity": {"$lt": last_activity}},
+                                            {"last_activity": last_activity, "_id": {"$lt": bot_id}}]}})
+    pipeline += [
+        {"$sort": {"last_activity": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        # Card fields only; the page is small, so these lookups are a handful of index hits
+        {"$lookup": {"from": "bots", "localField": "_id", "foreignField": "bot_id", "as": "bot",
+                     "pipeline": [{"$project": BOT_CARD_PROJECTION}]}},
+        {"$unwind": "$bot"},
+        {"$lookup": {
+            "from": "chat_reads", "let": {"bot_id": "$_id"}, "as": "read",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$eq": ["$bot_id", "$$bot_id"]}}},
+                         {"$project": {"last_read_at": 1}}]
+        }},
+        {"$set": {"last_read_at": {"$first": "$read.last_read_at"}}},
+        # Turns up to a tombstone cutoff are deleted even while their purge is still running
+        {"$set": {"unread_since": {"$max": ["$last_read_at", "$cutoff"]}}},
+        {"$lookup": {
+            "from": "chats", "let": {"bot_id": "$_id", "cutoff": "$cutoff"}, "as": "deleted_turns",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$and": [
+                            {"$eq": ["$bot_id", "$$bot_id"]}, {"$lte": ["$timestamp", "$$cutoff"]}]}}},
+                         {"$count": "count"}]
+        }},
+        {"$lookup": {
+            "from": "chat_buckets", "let": {"bot_id": "$_id", "cutoff": "$cutoff"}, "as": "deleted_buckets",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$and": [
+                            {"$eq": ["$bot_id", "$$bot_id"]}, {"$lte": ["$start_ts", "$$cutoff"]}]}}},
+                         {"$group": {"_id": None, "count": {"$sum": {"$size": {"$filter": {
+                             "input": "$messages", "cond": {"$lte": ["$$this.timestamp", "$$cutoff"]}}}}}}}]
+        }},
+        {"$lookup": {
+            "from": "chat_archive_segments", "let": {"bot_id": "$_id", "cutoff": "$cutoff"}, "as": "deleted_segments",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$and": [
+                            {"$eq": ["$bot_id", "$$bot_id"]}, {"$lte": ["$start_ts", "$$cutoff"]}]}}},
+                         {"$group": {"_id": None, "count": {"$sum": "$count"}}}]
+        }},
+        {"$lookup": {
+            "from": "chats", "let": {"bot_id": "$_id", "since": "$unread_since"}, "as": "unread_turns",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$and": [
+                            {"$eq": ["$bot_id", "$$bot_id"]}, {"$gt": ["$timestamp", "$$since"]}]}}},
+                         {"$limit": UNREAD_CAP},
+                         {"$count": "count"}]
+        }},
+        {"$lookup": {
+            "from": "chat_buckets", "let": {"bot_id": "$_id", "since": "$unread_since"}, "as": "unread_buckets",
+            "pipeline": [{"$match": {"user_id": user_id, "$expr": {"$and": [
+                            {"$eq": ["$bot_id", "$$bot_id"]}, {"$gt": ["$end_ts", "$$since"]}]}}},
+                         {"$sort": {"end_ts": -1}},
+                         {"$limit": UNREAD_CAP // CHAT_BUCKET_SIZE + 1},
+                         {"$group": {"_id": None, "count": {"$sum": {"$size": {"$filter": {
+                             "input": "$messages", "cond": {"$gt": ["$$this.timestamp", "$$since"]}}}}}}}]
+        }},
+        {"$project": {
+            "_id": 0,
+            "bot_id": "$_id",
+            "bot": 1,
+            "last_activity": 1,
+            "last_message": "$last",
+            "turn_count": {"$max": [0, {"$subtract": ["$turns", {"$add": [
+                {"$ifNull": [{"$first": "$deleted_turns.count"}, 0]},
+                {"$ifNull": [{"$first": "$deleted_buckets.count"}, 0]},
+                {"$ifNull": [{"$first": "$deleted_segments.count"}, 0]}
+            ]}]}]},
+            "last_read_at": 1,
+            "unread_count": {"$min": [UNREAD_CAP, {"$add": [
+                {"$ifNull": [{"$first": "$unread_turns.count"}, 0]},
+                {"$ifNull": [{"$first": "$unread_buckets.count"}, 0]}
+            ]}]}
+        }}
+    ]
+    return [row async for row in db.chats.aggregate(pipeline, allowDiskUse=True)]
+
+
+async def mark_conversation_read(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, read_at=None):
+    """Move the user's read marker forward (never back) to ``read_at`` or now.
+
+    Called when the user sends a turn or reads history, and by POST /chat/conversations/read.
+    """
+    await db.chat_reads.update_one(
+        {"user_id": user_id, "bot_id": bot_id},
+        {"$max": {"last_read_at": read_at or datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+async def count_turns(db: AsyncIOMotorDatabase, query: dict, cutoff) -> int:
+    """How many turns matching ``query`` with timestamp <= ``cutoff`` are stored, across both
+    layouts and the archive (buckets and segments that start by the cutoff count whole)."""
+    count = await db.chats.count_documents({**query, "timestamp": {"$lte": cutoff}})
+    for collection in (db.chat_buckets, db.chat_archive_segments):
+        async for row in collection.aggregate([
+            {"$match": {**query, "start_ts": {"$lte": cutoff}}},
+            {"$group": {"_id": None, "count": {"$sum": "$count"}}}
+        ]):
+            count += row["count"]
+    return count
+
+
+async def purge_turns_batch(db: AsyncIOMotorDatabase, query: dict, cutoff, batch_size: int,
+                            include_archive: bool = True) -> int:
+    """Delete up to ``batch_size`` turns matching ``query`` with timestamp <= ``cutoff``, from both
+    layouts and (unless ``include_archive`` is False) the archive.
+
+    Returns how many turns were removed; 0 means nothing is left to delete.
+    """
+    ids = [doc["_id"] async for doc in db.chats.find({**query, "timestamp": {"$lte": cutoff}}, {"_id": 1})
+           .limit(batch_size)]
+    if ids:
+        return (await db.chats.delete_many({"_id": {"$in": ids}})).deleted_count
+
+    # Whole buckets that end before the cutoff
+    buckets = [bucket async for bucket in db.chat_buckets.find({**query, "end_ts": {"$lte": cutoff}}, {"count": 1})
+               .limit(max(1, batch_size // CHAT_BUCKET_SIZE))]
+    if buckets:
+        await db.chat_buckets.delete_many({"_id": {"$in": [bucket["_id"] for bucket in buckets]}})
+        return sum(bucket.get("count", 0) for bucket in buckets)
+
+    # The open bucket can straddle the cutoff; drop just its older messages
+    removed = 0
+    async for bucket in db.chat_buckets.find({**query, "start_ts": {"$lte": cutoff}}, {"count": 1}).limit(batch_size):
+        remaining = [
+            {"$set": {"messages": {"$filter": {"input": "$messages", "cond": {"$gt": ["$$this.timestamp", cutoff]}}}}},
+            {"$set": {"count": {"$size": "$messages"}, "start_ts": {"$min": "$messages.timestamp"}}}
+        ]
+        after = await db.chat_buckets.find_one_and_update(
+            {"_id": bucket["_id"]}, remaining, projection={"count": 1}, return_document=ReturnDocument.AFTER
+        )
+        removed += bucket.get("count", 0) - (after or {}).get("count", 0)
+    if removed or not include_archive:
+        return removed
+
+    # Finally, archived segments that lie entirely before the cutoff
+    return await delete_segments_batch(db, query, cutoff, max(1, batch_size // CHAT_BUCKET_SIZE))
+
+
+class ChatWriteBehind:
+    """Bounded in-process queue of turns, flushed by one background task with insert_many.
+
+    A batch is written once ``batch_size`` turns are waiting or ``flush_interval`` seconds after
+    its first turn arrived. Queued turns stay visible to iter_turns (read-your-writes) until
+    they are stored. The overlay is per process, so it only covers reads served by the worker
+    that handled the write; with several workers keep the flush interval short.
+    """
+
+    def __init__(self, db, batch_size=CHAT_WRITE_BATCH_SIZE, flush_interval=CHAT_WRITE_FLUSH_INTERVAL,
+                 maxsize=CHAT_WRITE_QUEUE_SIZE, max_retries=CHAT_WRITE_MAX_RETRIES):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._pending = {}  # (user_id, bot_id) -> {_id: turn} awaiting a flush
+        self._task = None
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.overflowed = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, turn: dict) -> bool:
+        """Queue a turn; returns False when the queue is full so the caller writes it inline."""
+        self.start()
+        turn.setdefault("_id", ObjectId())
+        try:
+            self._queue.put_nowait(turn)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            return False
+        # The overlay holds timestamps exactly as Mongo will return them, so a turn that is both
+        # flushed and still pending has the same key in both sources and is only yielded once
+        overlay = dict(turn, timestamp=as_stored(turn["timestamp"]))
+        if "updated" in overlay:
+            overlay["updated"] = as_stored(overlay["updated"])
+        self._pending.setdefault((turn["user_id"], turn["bot_id"]), {})[turn["_id"]] = overlay
+        self.queued += 1
+        return True
+
+    async def pending_turns(self, user_id, bot_id, direction, after, before, fields):
+        pending = self._pending.get((user_id, bot_id))
+        if not pending:
+            return
+        keep = set(fields) | {"_id", "user_id", "bot_id"} if fields else None
+        for turn in sorted(pending.values(), key=turn_key, reverse=direction < 0):
+            if not _in_range(turn, after, before):
+                continue
+            yield {field: turn[field] for field in keep if field in turn} if keep else dict(turn)
+
+    def discard(self, user_id, bot_id) -> int:
+        """Forget queued turns of a deleted conversation; returns how many were dropped."""
+        pending = self._pending.pop((user_id, bot_id), None)
+        return len(pending) if pending else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        # Skip turns whose conversation was deleted while they were queued
+        turns = [turn for turn in batch if turn["_id"] in self._pending.get((turn["user_id"], turn["bot_id"]), {})]
+        for attempt in range(self.max_retries + 1):
+            try:
+                if CHAT_STORAGE == "buckets":
+                    # Bucket appends aren't idempotent, so retries only redo what hasn't landed yet
+                    while turns:
+                        await append_to_bucket(self.db, turns[0])
+                        self._stored(turns.pop(0))
+                elif turns:
+                    await self.db.chats.insert_many(turns, ordered=False)
+                break
+            except BulkWriteError as e:
+                # Duplicate _ids mean an earlier attempt already stored those turns
+                if all(error.get("code") == 11000 for error in e.details.get("writeErrors", [])):
+                    break
+                error = e
+            except Exception as e:
+                error = e
+            if attempt == self.max_retries:
+                self.failed += len(turns)
+                print(f"[ERROR] Dropping {len(turns)} chat turns after {attempt + 1} write attempts: {error}")
+                for turn in turns:
+                    self._forget(turn)
+                return
+            await asyncio.sleep(random.uniform(0, 0.1 * (2 ** attempt)))
+        self.batches += 1
+        for turn in turns:
+            self._stored(turn)
+
+    def _stored(self, turn):
+        self.written += 1
+        self._forget(turn)
+
+    def _forget(self, turn):
+        key = (turn["user_id"], turn["bot_id"])
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.pop(turn["_id"], None)
+            if not pending:
+                del self._pending[key]
+
+    async def stop(self, timeout=10.0):
+        """Flush everything still queued (up to ``timeout`` seconds), then stop the flusher."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"[ERROR] Chat write-behind shutdown with {self.depth} turns unsaved")
+        self._task.cancel()
+        self._task = None
+
+    def stats(self):
+        return {
+            "enabled": CHAT_WRITE_BEHIND,
+            "queue_depth": self.depth,
+            "queued": self.queued,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": self.written / self.batches if self.batches else 0.0,
+            "failed": self.failed,
+            "overflowed": self.overflowed
+        }
+
+
+_chat_writer = None
+
+
+def get_chat_writer(db: AsyncIOMotorDatabase = None) -> ChatWriteBehind:
+    global _chat_writer
+    if _chat_writer is None:
+        _chat_writer = ChatWriteBehind(db)
+    return _chat_writer
+
+
+def discard_pending(user_id: str, bot_id: str) -> int:
+    """Drop a conversation's turns still waiting in the write-behind queue, if there is one."""
+    return _chat_writer.discard(user_id, bot_id) if _chat_writer is not None else 0
+
+
+async def close_chat_writer():
+    global _chat_writer
+    if _chat_writer is not None:
+        await _chat_writer.stop()
+        _chat_writer = None
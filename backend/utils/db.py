@@ -0,0 +1,70 @@
+import os
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from utils.metrics import METRICS_ENABLED, MongoCommandListener
+from dotenv import load_dotenv
+load_dotenv()
+
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "ai_companion")  # fallback if not in .env
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+_client: AsyncIOMotorClient = None
+
+
+def init_mongo(uri: str = None, **kwargs) -> AsyncIOMotorClient:
+    """Create the single Motor client for this worker. Called from the lifespan hook in main.py."""
+    global _client
+    uri = uri or MONGODB_URI
+    if uri and uri.startswith("mongomock://"):
+        # In-memory stand-in for load tests and local runs (pip install mongomock-motor)
+        from mongomock_motor import AsyncMongoMockClient
+        _client = AsyncMongoMockClient()
+        return _client
+
+    options = {
+        "maxPoolSize": _env_int("MONGODB_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGODB_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGODB_MAX_IDLE_TIME_MS", 60000),
+        "connectTimeoutMS": _env_int("MONGODB_CONNECT_TIMEOUT_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGODB_SOCKET_TIMEOUT_MS", 20000),
+    }
+    if METRICS_ENABLED:
+        options["event_listeners"] = [MongoCommandListener()]
+    options.update(kwargs)
+    _client = AsyncIOMotorClient(uri, **options)
+    return _client
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Return the shared client, creating it lazily for scripts that run outside the app."""
+    if _client is None:
+        return init_mongo()
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """FastAPI dependency returning the application database."""
+    return get_client()[MONGODB_DB_NAME]
+
+
+async def ping_mongo() -> bool:
+    try:
+        await get_client().admin.command("ping")
+        print("✅ MongoDB Connected Successfully!")
+        return True
+    except Exception as e:
+        print(f"❌ MongoDB connection failed: {e}")
+        return False
+
+
+def close_mongo():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
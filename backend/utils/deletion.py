@@ -0,0 +1,218 @@
+import asyncio, os, uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.chat_store import count_turns, discard_pending, purge_turns_batch
+from utils.metrics import Counter
+from dotenv import load_dotenv
+load_dotenv()
+
+# Turns removed per batch, and the pause between batches that keeps the purge off the hot path
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+DELETE_BATCH_PAUSE = float(os.getenv("DELETE_BATCH_PAUSE", "0.05"))
+DELETE_POLL_INTERVAL = float(os.getenv("DELETE_POLL_INTERVAL", "5"))
+# A worker that dies mid-job loses its claim after this long and another one resumes the job
+DELETE_LEASE_SECONDS = float(os.getenv("DELETE_LEASE_SECONDS", "60"))
+# Turns still in a write-behind queue can land shortly after the tombstone; keep sweeping this long
+DELETE_SETTLE_SECONDS = float(os.getenv("DELETE_SETTLE_SECONDS", "5"))
+
+# Tombstone cutoff for a deleted bot: every turn, whenever it was written
+END_OF_TIME = datetime(9999, 12, 31, tzinfo=timezone.utc)
+
+chat_turns_deleted = Counter("chat_turns_deleted_total", "Turns removed by background deletion jobs")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+async def _schedule(db, kind, user_id, bot_id, cutoff, queued=None):
+    now = _now()
+    job = {
+        "_id": str(uuid.uuid4()),
+        "kind": kind,
+        "user_id": user_id,
+        "bot_id": bot_id,
+        "cutoff": cutoff,
+        "status": "pending",
+        "deleted": 0,
+        "queued": queued,
+        "created_at": now,
+        "updated_at": now
+    }
+    await db.deletion_jobs.insert_one(job)
+    # Reads hide the conversation(s) from here on, however long the purge takes
+    await db.chat_tombstones.insert_one({"user_id": user_id, "bot_id": bot_id, "cutoff": cutoff, "job_id": job["_id"]})
+    if user_id is not None:
+        # Not stored yet, so the job never sees them; reported alongside ``queued``
+        job["discarded"] = discard_pending(user_id, bot_id)
+    if _worker is not None:
+        _worker.wake()
+    return job
+
+
+async def schedule_conversation_deletion(db: AsyncIOMotorDatabase, user_id: str, bot_id: str) -> dict:
+    """Tombstone every turn of a conversation up to now and queue their deletion; returns the job,
+    whose ``queued`` is the number of stored turns it will delete and ``discarded`` the number of
+    write-behind turns dropped before they were stored."""
+    # The rolling summary describes the deleted turns; it is a single document, so it goes now
+    await db.chat_summaries.delete_one({"user_id": user_id, "bot_id": bot_id})
+    cutoff = _now()
+    queued = await count_turns(db, {"user_id": user_id, "bot_id": bot_id}, cutoff)
+    return await _schedule(db, "conversation", user_id, bot_id, cutoff, queued)
+
+
+async def schedule_bot_deletion(db: AsyncIOMotorDatabase, bot_id: str) -> str:
+    """Tombstone every conversation with a deleted bot and queue their deletion; returns the job id."""
+    # Not counted up front: a popular bot's conversations can hold millions of turns
+    return (await _schedule(db, "bot", None, bot_id, END_OF_TIME))["_id"]
+
+
+async def get_deletion_job(db: AsyncIOMotorDatabase, job_id: str):
+    return await db.deletion_jobs.find_one({"_id": job_id})
+
+
+class DeletionWorker:
+    """Works through db.deletion_jobs in bounded, throttled batches.
+
+    Jobs are claimed with a lease, so an interrupted job (crash, deploy) is picked up again
+    by this or another worker once the lease runs out; progress is kept on the job document.
+    """
+
+    def __init__(self, db, batch_size=DELETE_BATCH_SIZE, batch_pause=DELETE_BATCH_PAUSE,
+                 poll_interval=DELETE_POLL_INTERVAL, lease_seconds=DELETE_LEASE_SECONDS):
+        self.db = db
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._current = None
+        self.completed = 0
+        self.deleted = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _claim(self):
+        now = _now()
+        return await self.db.deletion_jobs.find_one_and_update(
+            {"$or": [{"status": "pending"}, {"status": "running", "lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"❌ Deletion job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._current = job["_id"]
+            try:
+                await self._process(job)
+            except Exception as e:
+                print(f"❌ Deletion job {job['_id']} failed, will retry: {e}")
+                await self._release(job)
+                await asyncio.sleep(self.poll_interval)
+            finally:
+                self._current = None
+
+    async def _release(self, job):
+        await self.db.deletion_jobs.update_one({"_id": job["_id"], "status": "running"},
+                                               {"$set": {"status": "pending"}, "$unset": {"lease_until": ""}})
+
+    async def _process(self, job):
+        query = {"bot_id": job["bot_id"]}
+        if job["user_id"] is not None:
+            query["user_id"] = job["user_id"]
+
+        while True:
+            deleted = await purge_turns_batch(self.db, query, job["cutoff"], self.batch_size)
+            if not deleted:
+                created_at = job["created_at"].replace(tzinfo=timezone.utc)
+                settle = (created_at + timedelta(seconds=DELETE_SETTLE_SECONDS) - _now()).total_seconds()
+                if settle <= 0:
+                    break
+                await asyncio.sleep(settle)
+                continue
+            self.deleted += deleted
+            chat_turns_deleted.inc(deleted)
+            await self.db.deletion_jobs.update_one({"_id": job["_id"]}, {
+                "$inc": {"deleted": deleted},
+                "$set": {"updated_at": _now(), "lease_until": _now() + timedelta(seconds=self.lease_seconds)}
+            })
+            await asyncio.sleep(self.batch_pause)
+
+        if job["kind"] == "bot":
+            # Summaries, read markers and usage counters keyed by the bot; one per user (or hour), still batched
+            for collection in ("chat_summaries", "chat_reads", "bot_stats_users", "bot_activity"):
+                while True:
+                    ids = [doc["_id"] async for doc in self.db[collection].find(query, {"_id": 1}).limit(self.batch_size)]
+                    if not ids:
+                        break
+                    await self.db[collection].delete_many({"_id": {"$in": ids}})
+                    await asyncio.sleep(self.batch_pause)
+            await self.db.bot_stats.delete_one({"_id": job["bot_id"]})
+
+        await self.db.chat_tombstones.delete_many({"job_id": job["_id"]})
+        await self.db.deletion_jobs.update_one({"_id": job["_id"]}, {
+            "$set": {"status": "done", "updated_at": _now(), "finished_at": _now()},
+            "$unset": {"lease_until": ""}
+        })
+        self.completed += 1
+
+    async def stop(self):
+        """Stop the worker; an unfinished job goes back to pending so the next start resumes it."""
+        if self._task is None:
+            return
+        current = self._current
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if current is not None:
+            await self._release({"_id": current})
+        self._task = None
+
+    def stats(self):
+        return {
+            "current_job": self._current,
+            "completed": self.completed,
+            "deleted": self.deleted,
+            "batch_size": self.batch_size,
+            "batch_pause": self.batch_pause
+        }
+
+
+_worker = None
+
+
+def get_deletion_worker(db: AsyncIOMotorDatabase = None) -> DeletionWorker:
+    global _worker
+    if _worker is None:
+        _worker = DeletionWorker(db)
+    return _worker
+
+
+async def close_deletion_worker():
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
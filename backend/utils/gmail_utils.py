@@ -1,27 +1,173 @@
-import base64, os
+import asyncio, base64, os, random, smtplib, threading, time, uuid
 from email.mime.text import MIMEText
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from utils.metrics import span
+from dotenv import load_dotenv
+load_dotenv()
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 
-def get_gmail_service():
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    return build("gmail", "v1", credentials=creds)
+# "gmail" (token.json), "smtp" (e.g. a local debugging server) or "file" (one .eml per message)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "gmail")
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "4"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "3"))
+EMAIL_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "1.0"))
 
-def send_email(recipient, subject, body):
+
+def build_message(recipient, subject, body):
     message = MIMEText(body)
     message["to"] = recipient
     message["subject"] = subject
-    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    return message
+
+
+class GmailTransport:
+    """Gmail API transport. The discovery service is built once per worker thread and reused."""
+
+    def __init__(self, token_file="token.json"):
+        self.token_file = token_file
+        # httplib2 connections are not thread-safe, so each pool thread keeps its own service
+        self._local = threading.local()
+
+    def get_service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
+            service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+            self._local.service = service
+        return service
+
+    def send(self, message):
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        self.get_service().users().messages().send(userId="me", body={"raw": raw}).execute()
+
+
+class SMTPTransport:
+    """Plain SMTP, e.g. `python -m aiosmtpd -n -l localhost:1025` as a local sink."""
+
+    def __init__(self, host=None, port=None, sender=None):
+        self.host = host or os.getenv("SMTP_HOST", "localhost")
+        self.port = port or int(os.getenv("SMTP_PORT", "1025"))
+        self.sender = sender or os.getenv("SMTP_SENDER", "no-reply@ai-companion.local")
+
+    def send(self, message):
+        message["from"] = self.sender
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+
+class FileTransport:
+    """Writes each message to EMAIL_OUTBOX_DIR as an .eml file; for tests and local development."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("EMAIL_OUTBOX_DIR", "outbox")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, message):
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.eml")
+        with open(path, "wb") as f:
+            f.write(message.as_bytes())
+
+
+TRANSPORTS = {
+    "gmail": GmailTransport,
+    "smtp": SMTPTransport,
+    "file": FileTransport,
+}
+
+
+class EmailQueue:
+    """Bounded background queue; a pool of workers sends messages off the event loop with retries."""
+
+    def __init__(self, transport, workers=EMAIL_WORKERS, maxsize=EMAIL_QUEUE_SIZE,
+                 max_retries=EMAIL_MAX_RETRIES, backoff_base=EMAIL_BACKOFF_BASE):
+        self.transport = transport
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def enqueue(self, recipient, subject, body):
+        """Queue a message and return immediately. Raises asyncio.QueueFull when saturated."""
+        self.start()
+        self._queue.put_nowait((recipient, subject, body))
+
+    async def _worker(self):
+        while True:
+            recipient, subject, body = await self._queue.get()
+            try:
+                await self._deliver(recipient, subject, body)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, recipient, subject, body):
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Transports are blocking (httplib2 / smtplib / file I/O), so run them in a thread
+                with span("email_send"):
+                    await asyncio.to_thread(self.transport.send, build_message(recipient, subject, body))
+                self.sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    print(f"[ERROR] Giving up on email to {recipient} after {attempt + 1} attempts: {e}")
+                    return
+                delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                print(f"[ERROR] Email to {recipient} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def stop(self, timeout=10.0):
+        """Drain queued messages (up to ``timeout`` seconds), then stop the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"[ERROR] Email queue shutdown with {self.depth} messages unsent")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+_email_queue = None
+
+
+def get_email_queue():
+    global _email_queue
+    if _email_queue is None:
+        _email_queue = EmailQueue(TRANSPORTS[EMAIL_TRANSPORT]())
+    return _email_queue
+
+
+async def close_email_queue():
+    global _email_queue
+    if _email_queue is not None:
+        await _email_queue.stop()
+        _email_queue = None
+
+
+def send_email(recipient, subject, body):
+    """Send synchronously on the current thread (scripts only; routes go through the queue)."""
+    get_email_queue().transport.send(build_message(recipient, subject, body))
 
-    service = get_gmail_service()
-    service.users().messages().send(userId="me", body={"raw": raw}).execute()
 
 async def send_welcome_email(to, name):
     body = f"Hi {name},\n\nWelcome to AI Companion! Your account has been created.\n\nThanks!"
-    send_email(to, "Welcome to AI Companion!", body)
+    get_email_queue().enqueue(to, "Welcome to AI Companion!", body)
+
 
 async def send_otp_email(to, otp):
     body = f"Your OTP is: {otp}\n\nValid for 10 minutes."
-    send_email(to, "AI Companion - OTP", body)
+    get_email_queue().enqueue(to, "AI Companion - OTP", body)
@@ -1,9 +1,108 @@
+import asyncio, os, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from passlib.context import CryptContext
+from utils.metrics import record_span
+from dotenv import load_dotenv
+load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Changing BCRYPT_ROUNDS makes existing hashes "need update"; they are rehashed on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(HASH_POOL_SIZE * 2)))
+# bcrypt releases the GIL, so threads scale; "process" isolates hashing from the server entirely
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash uses outdated rounds."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class HashingPool:
+    """Runs bcrypt off the event loop on a sized executor, with a cap on concurrent jobs."""
+
+    def __init__(self, pool_size: int = HASH_POOL_SIZE, max_concurrency: int = HASH_MAX_CONCURRENCY,
+                 executor: str = HASH_EXECUTOR):
+        executor_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._executor = executor_class(max_workers=pool_size)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    async def run(self, func, *args):
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        self.total_wait_seconds += started_at - queued_at
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            run_seconds = time.perf_counter() - started_at
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_run_seconds += run_seconds
+            self._semaphore.release()
+            record_span("bcrypt_wait", started_at - queued_at)
+            record_span("bcrypt", run_seconds)
+
+    def stats(self):
+        return {
+            "pool_size": self.pool_size,
+            "max_concurrency": self.max_concurrency,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "avg_wait_ms": 1000 * self.total_wait_seconds / self.completed if self.completed else 0.0,
+            "avg_hash_ms": 1000 * self.total_run_seconds / self.completed if self.completed else 0.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+
+def get_hashing_pool() -> HashingPool:
+    global _pool
+    if _pool is None:
+        _pool = HashingPool()
+    return _pool
+
+def close_hashing_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+async def hash_password_async(password: str) -> str:
+    return await get_hashing_pool().run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await get_hashing_pool().run(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    return await get_hashing_pool().run(verify_and_update_password, plain_password, hashed_password)
@@ -0,0 +1,119 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.bot_stats import BOT_STATS_ACTIVITY_DAYS
+
+# Indexes backing every hot router query, keyed by collection
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique"),
+    ],
+    "bots": [
+        IndexModel([("bot_id", ASCENDING)], unique=True, name="bot_id_unique"),
+        IndexModel([("privacy", ASCENDING), ("created_at", DESCENDING)], name="privacy_created_at"),
+        IndexModel([("privacy", ASCENDING), ("name", ASCENDING)], name="privacy_name"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "chats": [
+        # Also serves keyset pagination on (timestamp, message_id) for /chat/history
+        IndexModel(
+            [("user_id", ASCENDING), ("bot_id", ASCENDING), ("timestamp", ASCENDING), ("message_id", ASCENDING)],
+            name="user_bot_timestamp_message_id",
+        ),
+        # Cascade deletion of a bot's conversations across every user
+        IndexModel([("bot_id", ASCENDING)], name="bot_id"),
+    ],
+    "chat_buckets": [
+        # History reads walk buckets in time order; appends target the newest open bucket
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING), ("start_ts", ASCENDING)], name="user_bot_start_ts"),
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING), ("end_ts", DESCENDING)], name="user_bot_end_ts"),
+        IndexModel([("bot_id", ASCENDING)], name="bot_id"),
+    ],
+    "chat_summaries": [
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING)], unique=True, name="user_bot_unique"),
+        IndexModel([("bot_id", ASCENDING)], name="bot_id"),
+    ],
+    # Archive manifest: history reads look up segments by time range
+    "chat_archive_segments": [
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING), ("start_ts", ASCENDING)], name="user_bot_start_ts"),
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING), ("end_ts", DESCENDING)], name="user_bot_end_ts"),
+        IndexModel([("bot_id", ASCENDING)], name="bot_id"),
+    ],
+    # Read markers behind unread counts in /chat/conversations
+    "chat_reads": [
+        IndexModel([("user_id", ASCENDING), ("bot_id", ASCENDING)], unique=True, name="user_bot_unique"),
+        IndexModel([("bot_id", ASCENDING)], name="bot_id"),
+    ],
+    # Checked on every history/context read, so it must stay an index lookup
+    "chat_tombstones": [
+        IndexModel([("bot_id", ASCENDING), ("user_id", ASCENDING)], name="bot_user"),
+        IndexModel([("job_id", ASCENDING)], name="job_id"),
+    ],
+    # Usage counters behind /bots/trending; bot_stats is keyed by bot_id
+    "bot_stats_users": [
+        IndexModel([("bot_id", ASCENDING), ("user_id", ASCENDING)], unique=True, name="bot_user_unique"),
+    ],
+    "bot_activity": [
+        IndexModel([("bot_id", ASCENDING), ("hour", ASCENDING)], unique=True, name="bot_hour_unique"),
+        # Also serves the trending refresh's time-window match
+        IndexModel([("hour", ASCENDING)], expireAfterSeconds=BOT_STATS_ACTIVITY_DAYS * 86400, name="hour_ttl"),
+    ],
+    "deletion_jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    ],
+}
+
+# (collection, description, filter, sort) for each query the routers run on a hot path
+HOT_QUERIES = [
+    ("users", "auth: find user by email", {"email": "probe@example.com"}, None),
+    ("bots", "chat.ask / bots.get_bot: find bot by bot_id", {"bot_id": "probe"}, None),
+    ("bots", "bots.list_public_bots", {"privacy": "public"}, None),
+    ("bots", "bots.list_my_bots", {"user_id": "probe"}, None),
+    ("chats", "chat.get_chat_history", {"user_id": "probe", "bot_id": "probe"},
+     [("timestamp", ASCENDING), ("message_id", ASCENDING)]),
+    ("chats", "chat.list_conversations", {"user_id": "probe"},
+     [("bot_id", DESCENDING), ("timestamp", DESCENDING), ("message_id", DESCENDING)]),
+    ("chat_tombstones", "chat_store.tombstone_cutoff", {"bot_id": "probe", "user_id": {"$in": ["probe", None]}}, None),
+    ("chats", "deletion: purge a deleted bot's turns", {"bot_id": "probe", "timestamp": {"$lte": "probe"}}, None),
+    ("bot_activity", "bot_stats: trending refresh window", {"hour": {"$gte": "probe"}}, None),
+]
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create any missing indexes. Safe to run on every startup; existing indexes are left as-is."""
+    for collection, models in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(models)
+            print(f"✅ Indexes ensured on {collection}: {', '.join(names)}")
+        except OperationFailure as e:
+            # e.g. duplicate emails in legacy data blocking a unique index; keep serving
+            print(f"❌ Failed to create indexes on {collection}: {e}")
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree (classic and SBE layouts)."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("queryPlan", "inputStage", "outerStage", "innerStage"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def find_collscans(db: AsyncIOMotorDatabase):
+    """Run explain() on each hot query and return (description, stages) for any that scan the collection."""
+    failures = []
+    for collection, description, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = list(_plan_stages(explanation["queryPlanner"]["winningPlan"]))
+        print(f"{description}: {' <- '.join(stages)}")
+        if "COLLSCAN" in stages:
+            failures.append((description, stages))
+    return failures
@@ -1,10 +1,17 @@
-import os
-import httpx
+import os, time
+from utils.llm_providers import get_llm_router
+from utils.bot_cache import bot_cache
+from utils.memory import CONTEXT_TOKEN_BUDGET, estimate_tokens, fit_history
+from utils.metrics import record_span, span
+from utils.llm_dispatch import PRIORITY_BACKGROUND, PRIORITY_CHAT, get_dispatcher
+from utils.response_cache import RESPONSE_CACHE_ENABLED, normalize_message, response_cache, response_cache_key
 from dotenv import load_dotenv
 load_dotenv()
 
-async def chat_with_bot(bot, user_message, chat_id):
-    prompt = f"""
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+def build_persona(bot):
+    return f"""
         You are an AI bot named {bot['name']} with the following details:
         Personality: {bot['personality']}
         Situation: {bot['situation']}
@@ -15,21 +22,100 @@ async def chat_with_bot(bot, user_message, chat_id):
         Respond naturally, casually, like a human texting, with short one-line replies — no long paragraphs, no formal tone, just chill and real.
 
         Start the chat from the perspective of {bot['name']} and continue accordingly.
+"""
+
+
+def build_history(context, budget):
+    """Render the rolling summary and recent turns that fit in the remaining token budget."""
+    summary, turns, _ = fit_history(context, budget)
+    history = ""
+    if summary:
+        history += f"\n        Summary of the conversation so far: {summary}\n"
+    if turns:
+        history += "\n" + "\n".join(f"        {line}" for turn in turns for line in turn.split("\n")) + "\n"
+    return history
+
 
+def build_prompt(bot, user_message, context=None):
+    # The persona only changes when the bot is edited, so render it once per cache entry
+    persona = bot_cache.get_persona(bot, build_persona)
+    history = ""
+    if context:
+        budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(persona) - estimate_tokens(user_message)
+        history = build_history(context, max(budget, 0))
+    return f"""{persona}{history}
         User: {user_message}
         AI:
     """
 
-    api_key = os.getenv("GOOGLE_API_KEY")
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
 
-    headers = {"Content-Type": "application/json"}
-    params = {"key": api_key}
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
+async def generate(prompt, user_id=None, priority=PRIORITY_CHAT):
+    # One dispatcher slot covers the whole call, including any hedged or fallback attempt;
+    # background summaries are never hedged
+    async with get_dispatcher().slot(user_id, priority):
+        with span("gemini_total"):
+            return await get_llm_router().generate(prompt, hedge=None if priority == PRIORITY_CHAT else False)
+
+
+def cacheable_reply_key(bot, user_message, context):
+    """Response-cache key for opening turns of cache-enabled bots, else None.
+
+    Only turns whose prompt depends on nothing but the persona (and the bot's own first
+    message) are cacheable; once the user has said anything, replies depend on history.
+    """
+    if not RESPONSE_CACHE_ENABLED or not bot.get("response_cache"):
+        return None
+    if context and (context.get("summary") or any(turn.get("message") for turn in context.get("turns", []))):
+        return None
+    persona = bot_cache.get_persona(bot, build_persona)
+    opening = "\n".join(turn.get("response") or "" for turn in (context or {}).get("turns", []))
+    return response_cache_key(GEMINI_MODEL, persona, opening, normalize_message(user_message))
+
+
+async def chat_with_bot(bot, user_message, chat_id, context=None, user_id=None):
+    """Reply as the bot. ``context`` is the conversation memory from utils.memory.load_context."""
+    prompt = build_prompt(bot, user_message, context)
+    key = cacheable_reply_key(bot, user_message, context)
+    if key:
+        return await response_cache.get_or_generate(key, lambda: generate(prompt, user_id))
+    return await generate(prompt, user_id)
+
+
+async def summarize_conversation(previous_summary, turns):
+    """Fold new turns into the running conversation summary used by utils.memory."""
+    prompt = f"""
+        Update the running summary of a chat between a user and an AI companion.
+        Keep names, facts the user shared about themselves, preferences and unresolved threads.
+        Reply with the updated summary only, in under 150 words.
+
+        Current summary: {previous_summary or "(none)"}
+
+        New messages:
+        {turns}
+    """
+    return (await generate(prompt, priority=PRIORITY_BACKGROUND)).strip()
+
+
+async def stream_chat_with_bot(bot, user_message, chat_id, context=None, user_id=None):
+    """Yield reply text chunks as they arrive, from the first model in LLM_MODELS that answers."""
+    key = cacheable_reply_key(bot, user_message, context)
+    cached = response_cache.peek(key) if key else None
+    if cached:
+        yield cached
+        return
+
+    prompt = build_prompt(bot, user_message, context)
 
-    async with httpx.AsyncClient() as client:
-        res = await client.post(url, headers=headers, params=params, json=payload)
-        data = res.json()
-        return data['candidates'][0]['content']['parts'][0]['text']
+    async with get_dispatcher().slot(user_id, PRIORITY_CHAT):
+        started = time.perf_counter()
+        first_token = True
+        chunks = get_llm_router().stream(prompt)
+        try:
+            async for chunk in chunks:
+                if first_token:
+                    record_span("gemini_ttft", time.perf_counter() - started)
+                    first_token = False
+                yield chunk
+        finally:
+            await chunks.aclose()
+            record_span("gemini_total", time.perf_counter() - started)
@@ -0,0 +1,140 @@
+import asyncio, os, random
+import httpx
+from dotenv import load_dotenv
+load_dotenv()
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
+# Upstream responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class LLMClient:
+    """Application-scoped, connection-pooled HTTP client for LLM provider calls."""
+
+    def __init__(
+        self,
+        base_url: str = None,
+        max_connections: int = None,
+        max_keepalive_connections: int = None,
+        keepalive_expiry: float = None,
+        timeout: float = None,
+        connect_timeout: float = None,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_max: float = None,
+        http2: bool = None,
+    ):
+        self.base_url = base_url or GEMINI_API_BASE
+        self.max_retries = max_retries if max_retries is not None else _env_int("LLM_MAX_RETRIES", 2)
+        self.backoff_base = backoff_base if backoff_base is not None else _env_float("LLM_BACKOFF_BASE", 0.25)
+        self.backoff_max = backoff_max if backoff_max is not None else _env_float("LLM_BACKOFF_MAX", 4.0)
+
+        if http2 is None:
+            http2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+        limits = httpx.Limits(
+            max_connections=max_connections or _env_int("LLM_POOL_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=max_keepalive_connections or _env_int("LLM_POOL_MAX_KEEPALIVE", 20),
+            keepalive_expiry=keepalive_expiry or _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 30.0),
+        )
+        timeouts = httpx.Timeout(
+            timeout or _env_float("LLM_TIMEOUT", 30.0),
+            connect=connect_timeout or _env_float("LLM_CONNECT_TIMEOUT", 5.0),
+        )
+
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2 and HTTP2_AVAILABLE,
+            limits=limits,
+            timeout=timeouts,
+            headers={"Content-Type": "application/json"},
+        )
+
+    def _backoff_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the provider sends one."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _send(self, method: str, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        """Send with bounded retries on transport errors, 429 and 5xx responses.
+
+        Streaming responses are only retried until headers arrive; the caller owns
+        the returned response and must ``aclose()`` it.
+        """
+        attempt = 0
+        while True:
+            request = self._client.build_request(method, path, **kwargs)
+            try:
+                res = await self._client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"[LLM] Transport error ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            else:
+                if res.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return res
+                if stream:
+                    await res.aclose()
+                delay = self._backoff_delay(attempt, res)
+                print(f"[LLM] Upstream returned {res.status_code}, retrying in {delay:.2f}s")
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self._send("POST", path, **kwargs)
+
+    async def open_stream(self, path: str, **kwargs) -> httpx.Response:
+        """POST and return the response with its body still unread, for token streaming."""
+        return await self._send("POST", path, stream=True, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_llm_client: LLMClient = None
+
+
+def init_llm_client(**kwargs) -> LLMClient:
+    """Create the shared client. Called from the FastAPI lifespan hook in main.py."""
+    global _llm_client
+    _llm_client = LLMClient(**kwargs)
+    return _llm_client
+
+
+def get_llm_client() -> LLMClient:
+    """Return the shared client, creating it lazily for scripts that run outside the app."""
+    if _llm_client is None:
+        return init_llm_client()
+    return _llm_client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
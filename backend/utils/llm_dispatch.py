@@ -0,0 +1,209 @@
+import asyncio, heapq, itertools, math, os, time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_PER_USER_CONCURRENCY = int(os.getenv("LLM_PER_USER_CONCURRENCY", "2"))
+# Match these to the provider quota so we queue locally instead of collecting 429s
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "1000"))
+LLM_BURST = int(os.getenv("LLM_BURST", "50"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "10"))
+
+# Lower runs first
+PRIORITY_CHAT = 0
+PRIORITY_BACKGROUND = 10
+
+
+class LLMOverloaded(Exception):
+    """Raised instead of queueing when the dispatcher is saturated; maps to 429 + Retry-After."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class LLMUpstreamError(Exception):
+    """The provider answered with an error payload instead of a reply."""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        # Serialises waiters so tokens are handed out in arrival order
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until_available(self) -> float:
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def acquire(self, deadline: float):
+        async with self._lock:
+            wait = self.time_until_available()
+            if time.monotonic() + wait > deadline:
+                raise LLMOverloaded("LLM rate limit reached", wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+
+
+class LLMDispatcher:
+    """Governs outbound LLM calls: per-user and global concurrency, a rate limit and a priority queue."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, per_user_concurrency: int = LLM_PER_USER_CONCURRENCY,
+                 rate_per_minute: float = LLM_RATE_PER_MINUTE, burst: int = LLM_BURST,
+                 max_queue: int = LLM_MAX_QUEUE, max_queue_wait: float = LLM_MAX_QUEUE_WAIT):
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self._bucket = TokenBucket(rate_per_minute / 60, burst)
+        self._available = max_concurrency
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._users = {}  # user_id -> [semaphore, holders]
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.upstream_total = 0.0
+        self.upstream_max = 0.0
+
+    def retry_after_hint(self) -> float:
+        """Rough time for the current backlog to clear, for Retry-After."""
+        avg_upstream = self.upstream_total / self.completed if self.completed else 1.0
+        return (self.waiting + 1) * avg_upstream / self.max_concurrency
+
+    def check_capacity(self):
+        """Fail fast with LLMOverloaded when the queue is full (used before opening a stream)."""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloaded("Too many pending LLM requests", self.retry_after_hint())
+
+    async def _wait(self, awaitable, deadline):
+        try:
+            return await asyncio.wait_for(awaitable, timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMOverloaded("Timed out waiting for an LLM slot", self.retry_after_hint())
+
+    async def _acquire_user(self, user_id, deadline):
+        if user_id is None:
+            return
+        entry = self._users.setdefault(user_id, [asyncio.Semaphore(self.per_user_concurrency), 0])
+        entry[1] += 1
+        try:
+            await self._wait(entry[0].acquire(), deadline)
+        except BaseException:
+            self._release_user(user_id, acquired=False)
+            raise
+
+    def _release_user(self, user_id, acquired=True):
+        if user_id is None:
+            return
+        entry = self._users[user_id]
+        if acquired:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._users[user_id]
+
+    async def _acquire_slot(self, priority, deadline):
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+
+        self.check_capacity()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.waiting += 1
+        try:
+            await self._wait(future, deadline)
+        except BaseException:
+            # The slot may have been handed over just as we gave up; pass it on
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            self.waiting -= 1
+
+    def _release_slot(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._available += 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: str = None, priority: int = PRIORITY_CHAT, max_wait: float = None):
+        """Hold one upstream slot for the duration of the block; raises LLMOverloaded if none frees up in time."""
+        queued_at = time.monotonic()
+        deadline = queued_at + (max_wait if max_wait is not None else self.max_queue_wait)
+
+        await self._acquire_user(user_id, deadline)
+        try:
+            await self._acquire_slot(priority, deadline)
+            try:
+                await self._bucket.acquire(deadline)
+                started = time.monotonic()
+                wait = started - queued_at
+                self.queue_wait_total += wait
+                self.queue_wait_max = max(self.queue_wait_max, wait)
+                self.in_flight += 1
+                try:
+                    yield
+                finally:
+                    upstream = time.monotonic() - started
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.upstream_total += upstream
+                    self.upstream_max = max(self.upstream_max, upstream)
+            finally:
+                self._release_slot()
+        finally:
+            self._release_user(user_id)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_user_concurrency": self.per_user_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_queue_wait_ms": 1000 * self.queue_wait_total / self.completed if self.completed else 0.0,
+            "max_queue_wait_ms": 1000 * self.queue_wait_max,
+            "avg_upstream_ms": 1000 * self.upstream_total / self.completed if self.completed else 0.0,
+            "max_upstream_ms": 1000 * self.upstream_max
+        }
+
+
+_dispatcher = None
+
+
+def get_dispatcher() -> LLMDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = LLMDispatcher()
+    return _dispatcher
@@ -0,0 +1,408 @@
+import asyncio, json, os, time
+from collections import deque
+import httpx
+from utils.llm_client import RETRY_STATUS_CODES, LLMClient, get_llm_client
+from utils.llm_dispatch import LLMUpstreamError
+from utils.metrics import Counter
+from dotenv import load_dotenv
+load_dotenv()
+
+# Ordered by preference: "model", "model@https://base-url/v1beta" or "fake[:latency_seconds]"
+LLM_MODELS = os.getenv("LLM_MODELS") or os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Hedging: if the first attempt has not answered after the delay, send a second one and keep
+# whichever finishes first. LLM_HEDGE_DELAY pins the delay; otherwise it tracks the primary
+# model's LLM_HEDGE_QUANTILE latency once LLM_HEDGE_MIN_SAMPLES replies have been seen.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "2.0"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))
+# Circuit breaker: this many consecutive failures take a model out of rotation for the cooldown
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "500"))
+
+llm_attempts = Counter("llm_attempts_total", "Upstream LLM attempts by model and outcome", ("model", "outcome"))
+
+
+def build_payload(prompt):
+    return {"contents": [{"parts": [{"text": prompt}]}]}
+
+
+def parse_reply(res):
+    """Extract the reply text, turning provider error payloads into LLMUpstreamError."""
+    try:
+        data = res.json()
+    except ValueError:
+        data = {}
+    if res.status_code != 200:
+        message = (data.get("error") or {}).get("message") or f"Gemini returned status {res.status_code}"
+        raise LLMUpstreamError(res.status_code, message, res.headers.get("Retry-After"))
+
+    candidates = data.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts")
+    if not parts:
+        # e.g. a prompt blocked by safety filters returns no content
+        reason = candidates[0].get("finishReason") or (data.get("promptFeedback") or {}).get("blockReason")
+        raise LLMUpstreamError(res.status_code, f"Gemini returned no reply ({reason or 'empty response'})")
+    return parts[0]['text']
+
+
+def is_retryable(error):
+    """Whether another model (or another attempt) could succeed where this one failed.
+
+    Requests the provider rejected as such (bad request, blocked prompt) fail the same everywhere,
+    so they neither fall back nor count against the model's circuit breaker.
+    """
+    if isinstance(error, LLMUpstreamError):
+        return error.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class GeminiProvider:
+    """One Gemini model, on the shared pooled client or on its own endpoint."""
+
+    def __init__(self, model: str, base_url: str = None):
+        self.name = model
+        self.model = model
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        if self.base_url is None:
+            return get_llm_client()
+        if self._client is None:
+            self._client = LLMClient(base_url=self.base_url)
+        return self._client
+
+    async def generate(self, prompt):
+        params = {"key": os.getenv("GOOGLE_API_KEY")}
+        res = await self.client.post(f"/models/{self.model}:generateContent", params=params, json=build_payload(prompt))
+        return parse_reply(res)
+
+    async def stream(self, prompt):
+        """Yield reply text chunks from streamGenerateContent as they arrive."""
+        params = {"key": os.getenv("GOOGLE_API_KEY"), "alt": "sse"}
+        res = await self.client.open_stream(f"/models/{self.model}:streamGenerateContent", params=params,
+                                            json=build_payload(prompt))
+        try:
+            if res.status_code != 200:
+                await res.aread()
+                parse_reply(res)
+
+            async for line in res.aiter_lines():
+                # SSE frames look like "data: {...}"; blank lines separate events
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):])
+                candidates = data.get("candidates") or [{}]
+                for part in candidates[0].get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+        finally:
+            await res.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeProvider:
+    """Deterministic local stand-in for tail-latency tests: every ``slow_every``-th call takes
+    ``slow_latency`` instead of ``latency``, and every ``fail_every``-th call fails with a 503."""
+
+    def __init__(self, name: str = "fake", latency: float = 0.05, slow_latency: float = 2.0, slow_every: int = 0,
+                 fail_every: int = 0, reply: str = "hey! not much, just chilling. what about you?"):
+        self.name = name
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_every = slow_every
+        self.fail_every = fail_every
+        self.reply = reply
+        self.calls = 0
+
+    async def _respond(self):
+        self.calls += 1
+        slow = self.slow_every and self.calls % self.slow_every == 0
+        await asyncio.sleep(self.slow_latency if slow else self.latency)
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise LLMUpstreamError(503, f"{self.name} is overloaded")
+
+    async def generate(self, prompt):
+        await self._respond()
+        return self.reply
+
+    async def stream(self, prompt):
+        await self._respond()
+        for word in self.reply.split(" "):
+            yield word + " "
+
+    async def aclose(self):
+        pass
+
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures; after ``cooldown`` one
+    trial call is let through (half-open) and its outcome closes or re-opens the breaker."""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def begin(self):
+        """Called as a call starts; in half-open state that call is the trial."""
+        if self.state != "closed":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release(self):
+        """A trial call ended without a verdict (cancelled, or a non-retryable error)."""
+        self.trial_in_flight = False
+
+
+class ModelStats:
+    """Recent reply latencies and outcome counts for one model."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def quantile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        def ms(q):
+            value = self.quantile(q)
+            return 1000 * value if value is not None else None
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "p50_ms": ms(0.5),
+            "p90_ms": ms(0.9),
+            "p99_ms": ms(0.99)
+        }
+
+
+class LLMRouter:
+    """Sends each call to the first healthy model in order, hedging slow attempts and falling
+    back down the list on retryable failures."""
+
+    def __init__(self, providers, hedge: bool = LLM_HEDGE, hedge_delay: float = LLM_HEDGE_DELAY,
+                 hedge_quantile: float = LLM_HEDGE_QUANTILE, breaker_failures: int = LLM_BREAKER_FAILURES,
+                 breaker_cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_delay_override = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.breakers = {p.name: CircuitBreaker(breaker_failures, breaker_cooldown) for p in self.providers}
+        self.model_stats = {p.name: ModelStats() for p in self.providers}
+
+    def candidates(self):
+        """Providers whose breaker lets a call through, in preference order.
+
+        When every breaker is open the primary is tried anyway rather than failing outright.
+        """
+        allowed = [p for p in self.providers if self.breakers[p.name].allow()]
+        return allowed or self.providers[:1]
+
+    def hedge_delay(self, provider):
+        if self.hedge_delay_override:
+            return self.hedge_delay_override
+        stats = self.model_stats[provider.name]
+        if len(stats.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(stats.quantile(self.hedge_quantile), LLM_HEDGE_MIN_DELAY)
+
+    async def _attempt(self, provider, prompt):
+        started = time.perf_counter()
+        breaker, stats = self.breakers[provider.name], self.model_stats[provider.name]
+        breaker.begin()
+        try:
+            reply = await provider.generate(prompt)
+        except asyncio.CancelledError:
+            stats.cancelled += 1
+            breaker.release()
+            llm_attempts.inc(model=provider.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                stats.failures += 1
+                breaker.record_failure()
+                llm_attempts.inc(model=provider.name, outcome="failure")
+            else:
+                breaker.release()
+                llm_attempts.inc(model=provider.name, outcome="rejected")
+            raise
+        stats.latencies.append(time.perf_counter() - started)
+        stats.successes += 1
+        breaker.record_success()
+        llm_attempts.inc(model=provider.name, outcome="success")
+        return reply
+
+    async def generate(self, prompt, hedge: bool = None):
+        """Reply text from the fastest successful attempt; raises the last error if all fail."""
+        hedge = self.hedge if hedge is None else hedge
+        queue = self.candidates()
+        primary = queue[0]
+        # A hedge goes to the next model in line, or to the same one if it is the only one healthy
+        hedge_target = queue[1] if len(queue) > 1 else primary
+        fallbacks = iter(queue[1:])
+        attempts = {asyncio.create_task(self._attempt(primary, prompt)): primary}
+        hedged = not hedge
+        hedge_task = None
+        last_error = None
+        try:
+            while True:
+                timeout = None if hedged else self.hedge_delay(primary)
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.model_stats[hedge_target.name].hedges += 1
+                    if hedge_target is not primary:
+                        # The hedge used up this fallback
+                        next(fallbacks, None)
+                    hedge_task = asyncio.create_task(self._attempt(hedge_target, prompt))
+                    attempts[hedge_task] = hedge_target
+                    continue
+                for task in done:
+                    provider = attempts.pop(task)
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.model_stats[provider.name].hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if not is_retryable(last_error):
+                        raise last_error
+                if not attempts:
+                    provider = next(fallbacks, None)
+                    if provider is None:
+                        raise last_error
+                    hedged = True
+                    attempts[asyncio.create_task(self._attempt(provider, prompt))] = provider
+        finally:
+            # The losers: cancel and wait so no request outlives the call
+            for task in attempts:
+                task.cancel()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+
+    async def stream(self, prompt):
+        """Yield reply chunks from the first model that starts answering.
+
+        Streams are not hedged; a model that fails before its first chunk falls through to the next.
+        """
+        last_error = None
+        for provider in self.candidates():
+            breaker, stats = self.breakers[provider.name], self.model_stats[provider.name]
+            started = time.perf_counter()
+            answered = False
+            breaker.begin()
+            chunks = provider.stream(prompt)
+            try:
+                async for chunk in chunks:
+                    if not answered:
+                        answered = True
+                        stats.latencies.append(time.perf_counter() - started)
+                        stats.successes += 1
+                        breaker.record_success()
+                        llm_attempts.inc(model=provider.name, outcome="success")
+                    yield chunk
+                return
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if answered or not is_retryable(e):
+                    breaker.release()
+                    raise
+                stats.failures += 1
+                breaker.record_failure()
+                llm_attempts.inc(model=provider.name, outcome="failure")
+                last_error = e
+            finally:
+                await chunks.aclose()
+        raise last_error
+
+    def stats(self):
+        return {
+            "hedge": self.hedge,
+            "models": {
+                p.name: {
+                    **self.model_stats[p.name].snapshot(),
+                    "breaker": self.breakers[p.name].state,
+                    "breaker_open": self.breakers[p.name].state != "closed",
+                    "breaker_trips": self.breakers[p.name].trips,
+                    "hedge_delay_ms": 1000 * self.hedge_delay(p)
+                }
+                for p in self.providers
+            }
+        }
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+
+def provider_from_spec(spec: str):
+    spec = spec.strip()
+    if spec == "fake" or spec.startswith("fake:"):
+        _, _, latency = spec.partition(":")
+        return FakeProvider(latency=float(latency) if latency else 0.05)
+    model, _, base_url = spec.partition("@")
+    return GeminiProvider(model, base_url or None)
+
+
+_router = None
+
+
+def get_llm_router() -> LLMRouter:
+    global _router
+    if _router is None:
+        _router = LLMRouter([provider_from_spec(spec) for spec in LLM_MODELS.split(",") if spec.strip()])
+    return _router
+
+
+async def close_llm_router():
+    global _router
+    if _router is not None:
+        await _router.aclose()
+        _router = None
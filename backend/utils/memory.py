@@ -0,0 +1,145 @@
+import asyncio, os
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.chat_store import iter_turns, take
+from dotenv import load_dotenv
+load_dotenv()
+
+# Most recent turns sent verbatim with every request
+CONTEXT_WINDOW_TURNS = int(os.getenv("CONTEXT_WINDOW_TURNS", "10"))
+# Prompt budget (persona + summary + recent turns + new message), in estimated tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Turns allowed to pile up outside the window before they are folded into the summary
+SUMMARY_BATCH_TURNS = int(os.getenv("SUMMARY_BATCH_TURNS", "20"))
+# Upper bound on turns folded in a single summarisation call
+SUMMARY_MAX_TURNS_PER_PASS = int(os.getenv("SUMMARY_MAX_TURNS_PER_PASS", "50"))
+
+CHARS_PER_TOKEN = 4
+
+# Turn fields the prompt needs
+CONTEXT_FIELDS = ("message", "response")
+
+_background_tasks = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def format_turn(turn: dict) -> str:
+    lines = []
+    if turn.get("message"):
+        lines.append(f"User: {turn['message']}")
+    if turn.get("response"):
+        lines.append(f"AI: {turn['response']}")
+    return "\n".join(lines)
+
+
+def fit_history(context: dict, budget: int):
+    """Keep the summary and as many of the newest turns as fit in ``budget`` tokens.
+
+    Returns (summary, formatted turns oldest-first, tokens used).
+    """
+    summary = context.get("summary") or ""
+    if estimate_tokens(summary) > budget:
+        summary = summary[-budget * CHARS_PER_TOKEN:] if budget > 0 else ""
+    used = estimate_tokens(summary)
+
+    kept = []
+    for turn in reversed(context.get("turns", [])):
+        text = format_turn(turn)
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            break
+        kept.append(text)
+        used += cost
+    kept.reverse()
+    return summary, kept, used
+
+
+def _summarized_until(summary_state: dict):
+    """(timestamp, message_id) of the last turn already folded into the summary, if any."""
+    until = summary_state.get("summarized_until")
+    return (until["timestamp"], until["message_id"]) if until else None
+
+
+async def load_context(db: AsyncIOMotorDatabase, user_id: str, bot_id: str) -> dict:
+    """Load the rolling summary and the recent-turn window for a conversation."""
+    state = await db.chat_summaries.find_one({"user_id": user_id, "bot_id": bot_id}) or {}
+    turns = await take(
+        iter_turns(db, user_id, bot_id, direction=-1, after=_summarized_until(state), fields=CONTEXT_FIELDS),
+        CONTEXT_WINDOW_TURNS
+    )
+    turns.reverse()
+    return {"summary": state.get("summary", ""), "turns": turns}
+
+
+async def count_new_turn(db: AsyncIOMotorDatabase, user_id: str, bot_id: str) -> dict:
+    """Bump the conversation's count of turns not yet in the summary; returns the summary state."""
+    return await db.chat_summaries.find_one_and_update(
+        {"user_id": user_id, "bot_id": bot_id},
+        {"$inc": {"unsummarized_turns": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def update_summary(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, summarize, state: dict = None):
+    """Fold turns that have slid out of the window into the stored summary.
+
+    ``summarize(previous_summary, formatted_turns)`` is awaited to produce the new summary.
+    Turns are only read once the ``unsummarized_turns`` counter says a batch has accumulated;
+    then at most one pass worth is read. ``state`` is the summary document, if already loaded.
+    """
+    if state is None:
+        state = await db.chat_summaries.find_one({"user_id": user_id, "bot_id": bot_id}) or {}
+    threshold = CONTEXT_WINDOW_TURNS + SUMMARY_BATCH_TURNS
+    if state.get("unsummarized_turns", 0) <= threshold:
+        return
+
+    pending = await take(
+        iter_turns(db, user_id, bot_id, direction=1, after=_summarized_until(state), fields=CONTEXT_FIELDS),
+        SUMMARY_MAX_TURNS_PER_PASS + CONTEXT_WINDOW_TURNS
+    )
+    if len(pending) <= threshold:
+        # The counter drifted (turns deleted or dropped); this read was a full count, so resync
+        await db.chat_summaries.update_one({"_id": state["_id"]}, {"$set": {"unsummarized_turns": len(pending)}})
+        return
+
+    # Everything older than the window is folded, up to one pass worth
+    turns = pending[:min(len(pending) - CONTEXT_WINDOW_TURNS, SUMMARY_MAX_TURNS_PER_PASS)]
+
+    summary = await summarize(state.get("summary", ""), "\n".join(format_turn(turn) for turn in turns))
+    last = turns[-1]
+    try:
+        # Only advance from the position we read, so concurrent updaters can't fold turns twice
+        await db.chat_summaries.update_one(
+            {"user_id": user_id, "bot_id": bot_id, "summarized_until": state.get("summarized_until")},
+            {
+                "$set": {
+                    "summary": summary,
+                    "summarized_until": {"timestamp": last["timestamp"], "message_id": last["message_id"]}
+                },
+                "$inc": {"turns_summarized": len(turns), "unsummarized_turns": -len(turns)}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+
+
+def schedule_summary_update(db: AsyncIOMotorDatabase, user_id: str, bot_id: str, summarize):
+    """Count the new turn and, once a batch has accumulated, run update_summary, all in the
+    background so it never adds latency to a chat turn."""
+    async def run():
+        try:
+            state = await count_new_turn(db, user_id, bot_id)
+            await update_summary(db, user_id, bot_id, summarize, state)
+        except Exception as e:
+            print(f"Error updating chat summary for {user_id}_{bot_id}: {str(e)}")
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
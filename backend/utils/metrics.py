@@ -0,0 +1,280 @@
+import bisect, contextvars, os, threading, time
+from contextlib import contextmanager
+from pymongo import monitoring
+from dotenv import load_dotenv
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Adds a Server-Timing header (app, mongo_*, gemini_*, bcrypt, ...) to every response; handy in dev tools
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Spans recorded while handling the current request, for Server-Timing
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+# Mongo listener callbacks can run on executor threads
+_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A settable gauge, or one read from ``function`` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.function is None:
+            return super().render()
+        try:
+            value = self.function()
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class StatsCollector:
+    """Exposes a component's stats() dict when /metrics is scraped.
+
+    ``counters`` and ``gauges`` map stats keys to help text; counters are rendered as
+    ``<prefix>_<key>_total`` and gauges as ``<prefix>_<key>``. With ``labelname`` the function
+    returns ``{label value: stats}`` (e.g. one entry per LLM model). Other keys are left out.
+    """
+
+    def __init__(self, prefix, function, counters=None, gauges=None, labelname=None):
+        self.prefix = prefix
+        self.function = function
+        self.metrics = [(f"{prefix}_{key}_total", key, "counter", help) for key, help in (counters or {}).items()]
+        self.metrics += [(f"{prefix}_{key}", key, "gauge", help) for key, help in (gauges or {}).items()]
+        self.labelnames = (labelname,) if labelname else ()
+        REGISTRY.append(self)
+
+    def render(self):
+        try:
+            stats = self.function()
+            samples = sorted(stats.items()) if self.labelnames else [((), stats)]
+        except Exception:
+            samples = []
+        lines = []
+        for name, key, kind, documentation in self.metrics:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            for label, values in samples:
+                value = values.get(key)
+                if value is None:
+                    continue
+                labels = _format_labels(self.labelnames, (label,) if self.labelnames else ())
+                lines.append(f"{name}{labels} {int(value) if isinstance(value, bool) else value}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render_metrics() -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route template",
+    ("method", "route", "status")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+http_response_size = Histogram(
+    "http_response_size_bytes", "Response body size, by route template", ("method", "route"), buckets=SIZE_BUCKETS
+)
+span_duration = Histogram(
+    "span_duration_seconds", "Time spent in dependencies (mongo_<command>, gemini_ttft, gemini_total, bcrypt, email_send)",
+    ("span",)
+)
+
+
+def record_span(name: str, seconds: float):
+    """Record a dependency timing in the span histogram and the current request's Server-Timing."""
+    if not METRICS_ENABLED:
+        return
+    span_duration.observe(seconds, span=name)
+    spans = _request_spans.get()
+    if spans is not None:
+        with _lock:
+            spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as dependency span ``name`` (works around awaits too)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def server_timing_header(spans, total):
+    """Collapse repeated spans (e.g. several Mongo finds) into one Server-Timing entry each."""
+    totals = {}
+    for name, seconds in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = [f"app;dur={total * 1000:.1f}"]
+    parts += [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in totals.items()]
+    return ", ".join(parts)
+
+
+def route_template(scope):
+    """The matched route's path template, so metrics don't get one series per bot or user id."""
+    from starlette.routing import Match
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and response sizes per route.
+
+    Pure ASGI rather than BaseHTTPMiddleware so streamed responses (/chat/ask/stream,
+    NDJSON history) pass through untouched and their full duration is measured.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        started = time.perf_counter()
+        spans = []
+        token = _request_spans.set(spans)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    with _lock:
+                        header = server_timing_header(spans, time.perf_counter() - started)
+                    message.setdefault("headers", [])
+                    message["headers"] = [*message["headers"], (b"server-timing", header.encode())]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            _request_spans.reset(token)
+            http_request_duration.observe(time.perf_counter() - started, method=method, route=route, status=str(status))
+            http_response_size.observe(size, method=method, route=route)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds every Mongo command's server round trip into span_duration as mongo_<command>."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_span(f"mongo_{event.command_name}", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_span(f"mongo_{event.command_name}", event.duration_micros / 1e6)
@@ -0,0 +1,78 @@
+import asyncio, hashlib, os, re
+from cachetools import TTLCache
+from dotenv import load_dotenv
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "10000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s!?.,~]+$")
+
+
+def normalize_message(message: str) -> str:
+    """'Hey!!', ' hey ' and 'HEY' should all share one cache entry."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", message.strip().lower()))
+
+
+def response_cache_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ResponseCache:
+    """TTL/LRU cache of model replies with single-flight coalescing of identical in-flight prompts."""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_MAX_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def peek(self, key: str):
+        reply = self._cache.get(key)
+        if reply is not None:
+            self.hits += 1
+        return reply
+
+    async def get_or_generate(self, key: str, generate):
+        """Return the cached reply, join an identical in-flight call, or make the upstream call."""
+        reply = self._cache.get(key)
+        if reply is not None:
+            self.hits += 1
+            return reply
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(generate())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        # Shield so one cancelled caller doesn't cancel the upstream call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._cache[key] = task.result()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "upstream_calls_saved": self.hits + self.coalesced
+        }
+
+
+response_cache = ResponseCache()
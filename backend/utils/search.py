@@ -0,0 +1,228 @@
+import asyncio, bisect, heapq, os, re, time
+from collections import Counter
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from utils.bots import BOT_CARD_PROJECTION
+from dotenv import load_dotenv
+load_dotenv()
+
+# Full rebuild from Mongo; picks up bots changed by other workers between rebuilds
+SEARCH_INDEX_REFRESH = float(os.getenv("SEARCH_INDEX_REFRESH", "300"))
+# Query tokens up to this long are looked up in a precomputed prefix map instead of walking every
+# index term they prefix ("a" would otherwise touch most of the vocabulary); longer ones are selective
+SEARCH_PREFIX_MAP_CHARS = int(os.getenv("SEARCH_PREFIX_MAP_CHARS", "3"))
+
+# Where a match counts most
+FIELD_WEIGHTS = {"name": 3.0, "type_of_bot": 2.0, "bio": 1.0}
+# A term that only starts with the query token is worth less than an exact match
+PREFIX_MATCH_FACTOR = 0.5
+# created_at seconds are scaled under 0.25 and added as a tie-break, below the smallest real
+# score difference (0.5), so equally relevant bots rank newest first
+RECENCY_SCALE = 1e10
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class BotSearchIndex:
+    """In-process inverted index over public bots' name, bio and type_of_bot.
+
+    Kept current by create_bot / update_bot / delete_bot in this worker and rebuilt from
+    Mongo every SEARCH_INDEX_REFRESH seconds for changes made elsewhere.
+    """
+
+    def __init__(self):
+        self._cards = {}      # bot_id -> card document
+        self._postings = {}   # term -> {bot_id: weight}
+        self._terms = []      # sorted index terms, for prefix lookups
+        self._prefixes = {}   # short prefix -> {bot_id: best weight of a longer term it starts}
+        self._doc_terms = {}  # bot_id -> terms it was indexed under, for removal
+        self._by_type = {}    # type_of_bot -> bot_ids, for facets and filtering
+        self._recency = {}    # bot_id -> tie-break from created_at
+        self._changed_during_rebuild = None
+        self.built_at = None
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def __len__(self):
+        return len(self._cards)
+
+    def _add(self, card, keep_sorted=True):
+        bot_id = card["bot_id"]
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in set(tokenize(card.get(field))):
+                weights[term] += weight
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self._terms, term)
+            postings[bot_id] = weight
+            for length in range(1, min(len(term), SEARCH_PREFIX_MAP_CHARS + 1)):
+                prefixed = self._prefixes.setdefault(term[:length], {})
+                if weight > prefixed.get(bot_id, 0.0):
+                    prefixed[bot_id] = weight
+        self._cards[bot_id] = card
+        self._doc_terms[bot_id] = list(weights)
+        self._by_type.setdefault(card.get("type_of_bot"), set()).add(bot_id)
+        created_at = card.get("created_at")
+        self._recency[bot_id] = created_at.replace(tzinfo=timezone.utc).timestamp() / RECENCY_SCALE \
+            if isinstance(created_at, datetime) else 0.0
+
+    def remove(self, bot_id):
+        if self._changed_during_rebuild is not None:
+            self._changed_during_rebuild[bot_id] = None
+        card = self._cards.pop(bot_id, None)
+        if card is not None:
+            members = self._by_type[card.get("type_of_bot")]
+            members.discard(bot_id)
+            if not members:
+                del self._by_type[card.get("type_of_bot")]
+            del self._recency[bot_id]
+        for term in self._doc_terms.pop(bot_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(bot_id, None)
+            for length in range(1, min(len(term), SEARCH_PREFIX_MAP_CHARS + 1)):
+                prefixed = self._prefixes.get(term[:length])
+                if prefixed is not None:
+                    prefixed.pop(bot_id, None)
+                    if not prefixed:
+                        del self._prefixes[term[:length]]
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._terms, term)
+                if index < len(self._terms) and self._terms[index] == term:
+                    del self._terms[index]
+
+    def upsert(self, bot):
+        """Index (or re-index) a bot; private bots are dropped from the index."""
+        self.remove(bot["bot_id"])
+        if bot.get("privacy") == "public":
+            card = {field: bot[field] for field in BOT_CARD_PROJECTION if field in bot}
+            # Stored bots come back with naive UTC datetimes; keep freshly written ones comparable
+            for field in ("created_at", "updated_at"):
+                if isinstance(card.get(field), datetime) and card[field].tzinfo is not None:
+                    card[field] = card[field].astimezone(timezone.utc).replace(tzinfo=None)
+            self._add(card)
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild[bot["bot_id"]] = card
+
+    def _token_scores(self, token):
+        """bot_id -> best score for one query token, over the exact term and terms it prefixes."""
+        if len(token) <= SEARCH_PREFIX_MAP_CHARS:
+            scores = {bot_id: weight * PREFIX_MATCH_FACTOR for bot_id, weight in self._prefixes.get(token, {}).items()}
+            for bot_id, weight in self._postings.get(token, {}).items():
+                if weight > scores.get(bot_id, 0.0):
+                    scores[bot_id] = weight
+            return scores
+        scores = {}
+        for index in range(bisect.bisect_left(self._terms, token), len(self._terms)):
+            term = self._terms[index]
+            if not term.startswith(token):
+                break
+            factor = 1.0 if term == token else PREFIX_MATCH_FACTOR
+            for bot_id, weight in self._postings[term].items():
+                score = weight * factor
+                if score > scores.get(bot_id, 0.0):
+                    scores[bot_id] = score
+        return scores
+
+    def search(self, query: str = "", type_of_bot: str = None, skip: int = 0, limit: int = 20):
+        """Rank public bots matching every token of ``query`` (each as a word prefix).
+
+        Facet counts cover every match before the type_of_bot filter, so clients can show
+        how many results each type would give.
+        """
+        started = time.perf_counter()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        type_members = self._by_type.get(type_of_bot, set()) if type_of_bot else None
+        recency = self._recency
+
+        if tokens:
+            scores = None
+            # Rarest token first keeps the intersection small
+            for token_scores in sorted((self._token_scores(token) for token in tokens), key=len):
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {bot_id: score + token_scores[bot_id] for bot_id, score in scores.items()
+                              if bot_id in token_scores}
+                if not scores:
+                    break
+            scores = scores or {}
+            facets = {}
+            for bot_type, members in self._by_type.items():
+                count = len(members.intersection(scores)) if len(members) < len(scores) else \
+                    sum(1 for bot_id in scores if bot_id in members)
+                if count:
+                    facets[bot_type] = count
+            if type_members is not None:
+                scores = {bot_id: score for bot_id, score in scores.items() if bot_id in type_members}
+            ranking = {bot_id: score + recency[bot_id] for bot_id, score in scores.items()}
+            top = heapq.nlargest(skip + limit, ranking, key=ranking.__getitem__)[skip:]
+            results = [dict(self._cards[bot_id], score=scores[bot_id]) for bot_id in top]
+            total = len(scores)
+        else:
+            # Browsing: newest first, no text scoring
+            facets = {bot_type: len(members) for bot_type, members in self._by_type.items()}
+            candidates = type_members if type_members is not None else recency
+            top = heapq.nlargest(skip + limit, candidates, key=recency.__getitem__)[skip:]
+            results = [dict(self._cards[bot_id], score=0.0) for bot_id in top]
+            total = len(candidates)
+
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - started
+        return {
+            "total": total,
+            "results": results,
+            "facets": {"type_of_bot": dict(sorted(facets.items(), key=lambda item: -item[1]))}
+        }
+
+    async def rebuild(self, db: AsyncIOMotorDatabase):
+        """Replace the index with a fresh build from Mongo."""
+        fresh = BotSearchIndex()
+        # Writes that land while the scan runs are replayed onto the new index before the swap
+        self._changed_during_rebuild = {}
+        try:
+            async for bot in db.bots.find({"privacy": "public"}, BOT_CARD_PROJECTION):
+                fresh._add(bot, keep_sorted=False)
+            fresh._terms = sorted(fresh._postings)
+            for bot_id, card in self._changed_during_rebuild.items():
+                fresh.remove(bot_id)
+                if card is not None:
+                    fresh._add(card)
+        finally:
+            self._changed_during_rebuild = None
+        self._cards, self._postings, self._terms = fresh._cards, fresh._postings, fresh._terms
+        self._prefixes = fresh._prefixes
+        self._doc_terms, self._by_type, self._recency = fresh._doc_terms, fresh._by_type, fresh._recency
+        self.built_at = time.time()
+
+    async def run_refresher(self, db: AsyncIOMotorDatabase, interval: float = SEARCH_INDEX_REFRESH):
+        """Build the index now, then rebuild it every ``interval`` seconds."""
+        while True:
+            try:
+                await self.rebuild(db)
+                print(f"✅ Bot search index built: {len(self)} public bots")
+            except Exception as e:
+                print(f"❌ Bot search index rebuild failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            "bots": len(self._cards),
+            "terms": len(self._terms),
+            "built_at": self.built_at,
+            "queries": self.queries,
+            "avg_query_ms": 1000 * self.query_seconds / self.queries if self.queries else 0.0
+        }
+
+
+search_index = BotSearchIndex()
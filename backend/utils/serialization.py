@@ -0,0 +1,38 @@
+import base64
+from datetime import date
+from decimal import Decimal
+import orjson
+from bson import Binary, Decimal128, ObjectId
+from fastapi.responses import ORJSONResponse
+
+# Mongo hands back naive UTC datetimes; OPT_NAIVE_UTC renders them with "+00:00" like the old
+# format_timestamp_for_response did, without touching each document
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+def bson_default(obj):
+    """orjson fallback for the BSON types that show up in our documents."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (Binary, bytes)):
+        return base64.b64encode(obj).decode()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    """Serialize Mongo documents (ObjectId, datetime, Binary, ...) straight to JSON bytes."""
+    return orjson.dumps(obj, default=bson_default, option=ORJSON_OPTIONS)
+
+
+class BSONResponse(ORJSONResponse):
+    """App-wide response class. Routes that return one directly skip jsonable_encoder and
+    response_model validation entirely, which is what the large list endpoints do."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,10 +1,12 @@
 import React from 'react';
 import { useNavigate } from 'react-router-dom';
 import { MessageCircle, Settings, Globe, Lock, User, Trash2 } from 'lucide-react';
+import { getAvatarSrc } from '../services/api';
 
 interface Bot {
   bot_id: string;
   avatar_base64?: string;
+  avatar_url?: string | null;
   name: string;
   type_of_bot: string;
   privacy: 'public' | 'private';
@@ -20,6 +22,7 @@ interface BotCardProps {
 }
 
 export default function BotCard({ bot, isOwner, onDelete }: BotCardProps) {
+  const avatarSrc = getAvatarSrc(bot);
   const navigate = useNavigate();
 
   const handleChatClick = () => {
@@ -51,9 +54,9 @@ export default function BotCard({ bot, isOwner, onDelete }: BotCardProps) {
     <div className="bg-white rounded-xl shadow-md hover:shadow-lg transition-shadow border border-slate-200 overflow-hidden">
       <div className="p-6">
         <div className="flex items-center mb-4">
-          {bot.avatar_base64 ? (
+          {avatarSrc ? (
             <img
-              src={bot.avatar_base64}
+              src={avatarSrc}
               alt={bot.name}
               onError={(e) => {
                 // If image fails to load, show the default avatar
@@ -65,7 +68,7 @@ export default function BotCard({ bot, isOwner, onDelete }: BotCardProps) {
               className="w-16 h-16 rounded-full object-cover mr-4"
             />
           ) : null}
-          <div className={`w-16 h-16 bg-gradient-to-br from-blue-500 to-purple-600 rounded-full flex items-center justify-center mr-4 default-avatar ${bot.avatar_base64 ? 'hidden' : ''}`}>
+          <div className={`w-16 h-16 bg-gradient-to-br from-blue-500 to-purple-600 rounded-full flex items-center justify-center mr-4 default-avatar ${avatarSrc ? 'hidden' : ''}`}>
             <User className="h-8 w-8 text-white" />
           </div>
           <div className="flex-1">
@@ -19,6 +19,7 @@ export default function CreateBot() {
     chatting_way: '',
     type_of_bot: '',
     privacy: 'private',
+    response_cache: false,
   });
   
   const [avatarBase64, setAvatarBase64] = useState<string>('');
@@ -56,6 +57,7 @@ export default function CreateBot() {
         chatting_way: bot.chatting_way || '',
         type_of_bot: bot.type_of_bot || '',
         privacy: bot.privacy || 'private',
+        response_cache: Boolean(bot.response_cache),
       });
       
       if (bot.avatar_base64) {
@@ -384,6 +386,24 @@ export default function CreateBot() {
           </div>
         </div>
 
+        {/* Reply Caching */}
+        <div className="bg-white rounded-xl shadow-sm border border-slate-200 p-6">
+          <h2 className="text-xl font-semibold text-slate-900 mb-4">Reply Caching</h2>
+          <label className="flex items-center">
+            <input
+              type="checkbox"
+              name="response_cache"
+              checked={form.response_cache}
+              onChange={(e) => setForm({ ...form, response_cache: e.target.checked })}
+              className="mr-3 text-blue-600"
+            />
+            <div>
+              <span className="font-medium text-slate-900">Reuse replies to common openers</span>
+              <p className="text-sm text-slate-600">Greetings like "hi" or "who are you" at the start of a chat get a shared, faster reply</p>
+            </div>
+          </label>
+        </div>
+
         {/* Submit Button */}
         <div className="flex justify-end space-x-4">
           <button
@@ -1,7 +1,7 @@
 import { useEffect, useState, useCallback } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { Plus, MessageCircle, ChevronRight, Menu, X } from 'lucide-react';
-import { getMyBots, getPublicBots, getChatHistory, deleteBot, getBotById } from '../services/api';
+import { getMyBots, getPublicBots, getChatHistory, deleteBot, getBotById, getAvatarSrc } from '../services/api';
 import BotCard from '../components/BotCard';
 import { Bot, ChatMessage, ChatHistoryItem } from '../types';
 import { useMediaQuery } from 'react-responsive';
@@ -99,7 +99,7 @@ export default function Dashboard() {
             return {
               bot_id: botId,
               bot_name: bot?.name || 'Unknown Bot',
-              bot_avatar_base64: bot?.avatar_base64,
+              bot_avatar_base64: getAvatarSrc(bot),
               last_message: lastMessage.message || lastMessage.response || '',
               timestamp: validTimestamp
             };
@@ -69,6 +69,7 @@ export interface BotData {
   type_of_bot: string;
   privacy: string;
   avatar_base64?: string | null;
+  response_cache?: boolean;
 }
 
 export const createBot = (botData: BotData) =>
@@ -89,6 +90,12 @@ export const getPublicBots = (signal?: AbortSignal) =>
 export const deleteBot = (botId: string, userId: string) =>
   API.delete(`/bots/${botId}?user_id=${userId}`);
 
+// List endpoints return a versioned avatar_url instead of the inline image
+export const getAvatarSrc = (bot?: { avatar_url?: string | null; avatar_base64?: string | null }) => {
+  if (bot?.avatar_url) return `${API.defaults.baseURL}${bot.avatar_url}`;
+  return bot?.avatar_base64 || undefined;
+};
+
 // ======================
 // Chat Endpoints
 // ======================
@@ -2,6 +2,7 @@ export interface Bot {
   bot_id: string;
   name: string;
   avatar_base64?: string;
+  avatar_url?: string | null;
   type_of_bot: string;
   privacy: 'public' | 'private';
   bio: string;